@@ -49,12 +49,6 @@ _io = [
         Subsignal("bte",   Pins(2)),
         Subsignal("err",   Pins(1))
     ),
-    ("spi", 0,
-        Subsignal("miso", Pins(1)),
-        Subsignal("mosi", Pins(1)),
-        Subsignal("clk", Pins(1)),
-        Subsignal("cs_n", Pins(1)),
-    ),
     ("clk", 0,
         Subsignal("clk48", Pins(1)),
         Subsignal("clk12", Pins(1)),
@@ -64,6 +58,17 @@ _io = [
 
 _connectors = []
 
+def _spi_io(width):
+    """The SPI pads, with `dq` data lines when there is more than one"""
+    if width > 1:
+        data = [Subsignal("dq", Pins(width))]
+    else:
+        data = [Subsignal("miso", Pins(1)), Subsignal("mosi", Pins(1))]
+    return ("spi", 0, *data,
+        Subsignal("clk", Pins(1)),
+        Subsignal("cs_n", Pins(1)),
+    )
+
 class _CRG(Module):
     def __init__(self, platform):
         clk = platform.request("clk")
@@ -97,8 +102,8 @@ class _CRG(Module):
         ]
 
 class Platform(SimPlatform):
-    def __init__(self, toolchain="verilator"):
-        SimPlatform.__init__(self, "sim", _io, _connectors, toolchain="verilator")
+    def __init__(self, toolchain="verilator", width=1):
+        SimPlatform.__init__(self, "sim", _io + [_spi_io(width)], _connectors, toolchain="verilator")
 
     def create_programmer(self):
         raise ValueError("programming is not supported")
@@ -112,7 +117,8 @@ class BaseSoC(SoCCore):
         "csr":      0x60000000,  # (default shadow @0xe0000000)
     }
 
-    def __init__(self, platform, wires, output_dir="build", **kwargs):
+    def __init__(self, platform, wires, direct=False, width=1, address_bytes=4, address_base=0,
+                 output_dir="build", **kwargs):
         # Disable integrated RAM as we'll add it later
         self.integrated_sram_size = 0
 
@@ -131,7 +137,12 @@ class BaseSoC(SoCCore):
 
         # Add SPI
         spi_pads = platform.request("spi")
-        self.submodules.spibone = ClockDomainsRenamer("clk_48")(spibone.SpiWishboneBridge(spi_pads, wires=wires))
+        if direct:
+            self.submodules.spibone = ClockDomainsRenamer("clk_48")(spibone.DirectSpiWishboneBridge(spi_pads,
+                address_bytes=address_bytes, address_base=address_base))
+        else:
+            self.submodules.spibone = ClockDomainsRenamer("clk_48")(spibone.SpiWishboneBridge(spi_pads,
+                wires=wires, width=width, address_bytes=address_bytes, address_base=address_base))
         self.add_wb_master(self.spibone.wishbone)
 
         class _WishboneBridge(Module):
@@ -141,6 +152,9 @@ class BaseSoC(SoCCore):
         self.add_cpu(_WishboneBridge(self.platform.request("wishbone")))
         self.add_wb_master(self.cpu.wishbone)
 
+        # Give main_ram a fixed name, so that tb.v can load and dump it
+        self.main_ram.mem.name_override = "main_ram"
+
 def add_fsm_state_names():
     """Hack the FSM module to add state names to the output"""
     from migen.fhdl.visit import NodeTransformer
@@ -192,9 +206,9 @@ def add_fsm_state_names():
         return My_LowerNext(self.next_state, self.next_state_name, self.encoding, self.state_aliases)
     fsm.FSM._lower_controls = my_lower_controls
 
-def generate(output_dir, csr_csv, wires=4):
-    platform = Platform()
-    soc = BaseSoC(platform, wires,
+def generate(output_dir, csr_csv, wires=4, direct=False, width=1, address_bytes=4, address_base=0):
+    platform = Platform(width=width)
+    soc = BaseSoC(platform, wires, direct, width, address_bytes, address_base,
                             cpu_type=None, cpu_variant=None,
                             output_dir=output_dir)
     builder = Builder(soc, output_dir=output_dir,
@@ -214,10 +228,25 @@ def main():
                                  help='csr file (default: %(default)s)')
     parser.add_argument('--wires', choices=[2, 3, 4], default=4, type=int,
                                  help='select the number of wires for SPI')
+    parser.add_argument('--direct', action='store_true',
+                                 help='clock the bridge directly from SPI (four-wire only)')
+    parser.add_argument('--width', choices=[1, 2, 4], default=1, type=int,
+                                 help='select the number of data lines (default: %(default)s)')
+    parser.add_argument('--address-bytes', choices=[1, 2, 3, 4], default=4, type=int,
+                                 help='select the number of address bytes (default: %(default)s)')
+    parser.add_argument('--address-base', type=lambda x: int(x, 0),
+                                 help='base of a short address (default: main_ram)')
     args = parser.parse_args()
     add_fsm_state_names()
     output_dir = args.dir
-    generate(output_dir, args.csr, args.wires)
+    if args.direct and args.wires != 4:
+        parser.error("--direct requires four wires")
+    if args.width > 1 and (args.direct or args.wires == 2):
+        parser.error("--width requires three or four wires, without --direct")
+    address_base = args.address_base
+    if address_base is None:
+        address_base = BaseSoC.mem_map["main_ram"] if args.address_bytes < 4 else 0
+    generate(output_dir, args.csr, args.wires, args.direct, args.width, args.address_bytes, address_base)
 
     print(
 """Simulation build complete.  Output files:
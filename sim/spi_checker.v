@@ -0,0 +1,58 @@
+`timescale 100ps / 100ps
+
+// Checks that the data lines, and MISO if `check_miso` is set, don't change
+// while SPI CLK is high.  `spi_dq[0]` is MOSI.  The lines are sampled on
+// both edges of `clk`, and only while CS is asserted and the design isn't
+// in reset.
+//
+// `mosi_error` and `miso_error` are sticky, and are only cleared by
+// `reset`, so they can be checked whenever it's convenient.
+module spi_checker(
+	input clk,
+	input reset,
+
+	input check_miso,
+	input spi_cs_n,
+	input spi_clk,
+	input [3:0] spi_dq,
+	input spi_miso,
+
+	output reg mosi_error,
+	output reg miso_error
+);
+
+reg previous_clk;
+reg [3:0] previous_dq;
+reg previous_miso;
+
+initial begin
+	mosi_error = 0;
+	miso_error = 0;
+	previous_clk = 0;
+	previous_dq = 0;
+	previous_miso = 0;
+end
+
+always @(posedge clk or negedge clk) begin
+	if (reset) begin
+		mosi_error <= 0;
+		miso_error <= 0;
+		previous_clk <= 0;
+	end else if (spi_cs_n == 1'b0) begin
+		if (spi_clk) begin
+			if (!previous_clk) begin
+				// Clock went high, so capture the values
+				previous_dq <= spi_dq;
+				previous_miso <= spi_miso;
+			end else begin
+				if (spi_dq !== previous_dq)
+					mosi_error <= 1;
+				if (check_miso && spi_miso !== previous_miso)
+					miso_error <= 1;
+			end
+		end
+		previous_clk <= spi_clk;
+	end
+end
+
+endmodule
@@ -0,0 +1,172 @@
+`timescale 100ps / 100ps
+
+// SPI master for the testbench, so that Python only has to deal in bytes.
+//
+// Each operation clocks up to four bytes of `tx`, MSB first, or, if
+// `wait_response` is set, repeats `tx[7:0]` until a byte other than 0xff
+// comes back or `len` bytes have gone by.  Toggle `start` to begin an
+// operation.  `done` toggles once it has finished, at which point `rx`
+// holds the last four bytes received and `count` the number of bytes that
+// were clocked.
+//
+// Each clock takes two cycles of `clk`, with SPI CLK low and then high.
+// The data lines change while CLK is low, and are sampled at the end of
+// the high half.  MOSI is `spi_dq[0]`.  With `release_mosi` set, the data
+// lines are left undriven and data is received on them instead of MISO,
+// for two- and three-wire mode.  With `wide` set, WIDTH bits are sent or
+// received on each clock, with `spi_dq[0]` carrying the least significant
+// bit of each group.  `reset` abandons any operation, and lets `start` be
+// set to any value without starting one.
+module spi_master #(
+	parameter WIDTH = 1
+) (
+	input clk,
+	input reset,
+
+	input start,
+	output reg done,
+	input [31:0] tx,
+	input [15:0] len,
+	input wait_response,
+	input release_mosi,
+	input wide,
+	output reg [31:0] rx,
+	output reg [15:0] count,
+
+	output reg spi_clk,
+	inout [3:0] spi_dq,
+	input spi_miso
+);
+
+reg start_seen;
+reg busy;
+reg finishing;
+reg phase;
+reg pending;
+reg [2:0] bit_index;
+reg [31:0] shift;
+reg [7:0] byte_in;
+reg [7:0] tx_byte;
+reg [15:0] len_r;
+reg wait_r;
+reg release_r;
+reg wide_r;
+reg [3:0] dq_out;
+reg [3:0] dq_oe;
+
+initial begin
+	done = 0;
+	rx = 0;
+	count = 0;
+	spi_clk = 0;
+	start_seen = 0;
+	busy = 0;
+	finishing = 0;
+	phase = 0;
+	pending = 0;
+	bit_index = 0;
+	shift = 0;
+	byte_in = 0;
+	dq_out = 0;
+	dq_oe = 4'b0001;
+	release_r = 0;
+	wide_r = 0;
+end
+
+genvar i;
+generate
+	for (i = 0; i < 4; i = i + 1) begin : dq
+		assign spi_dq[i] = dq_oe[i] ? dq_out[i] : 1'bz;
+	end
+endgenerate
+wire line = release_r ? spi_dq[0] : spi_miso;
+
+// Number of bits sent on each clock, and the lines they are sent on
+wire [2:0] step = (wide_r && WIDTH > 1) ? WIDTH : 1;
+wire [3:0] lines = (step == 4) ? 4'b1111 : (step == 2) ? 4'b0011 : 4'b0001;
+
+reg [7:0] next_byte;
+reg [15:0] next_count;
+reg [31:0] next_shift;
+reg finished;
+
+always @(posedge clk) begin
+	if (reset) begin
+		start_seen <= start;
+		busy <= 0;
+		finishing <= 0;
+		spi_clk <= 0;
+		dq_out <= 0;
+		dq_oe <= 4'b0001;
+	end else if (!busy) begin
+		// `rx` and `count` settle a cycle before `done` changes
+		if (finishing) begin
+			finishing <= 0;
+			done <= ~done;
+		end else if (start != start_seen) begin
+			start_seen <= start;
+			busy <= 1;
+			phase <= 0;
+			pending <= 0;
+			bit_index <= 0;
+			count <= 0;
+			len_r <= len;
+			wait_r <= wait_response;
+			release_r <= release_mosi;
+			wide_r <= wide;
+			tx_byte <= tx[7:0];
+			if (wait_response)
+				shift <= {tx[7:0], 24'h0};
+			else
+				shift <= tx << (8 * (4 - len));
+		end
+	end else if (!phase) begin
+		// Sample the bit from the previous rising edge, then drive CLK low
+		finished = 0;
+		next_shift = shift;
+		if (pending) begin
+			if (step == 4)
+				next_byte = {byte_in[3:0], spi_dq[3:0]};
+			else if (step == 2)
+				next_byte = {byte_in[5:0], spi_dq[1:0]};
+			else
+				next_byte = {byte_in[6:0], line};
+			byte_in <= next_byte;
+			if (bit_index == 0) begin
+				next_count = count + 1;
+				rx <= {rx[23:0], next_byte};
+				count <= next_count;
+				if (next_count == len_r || (wait_r && next_byte != 8'hff))
+					finished = 1;
+				else if (wait_r)
+					next_shift = {tx_byte, 24'h0};
+			end
+		end
+		spi_clk <= 0;
+		pending <= 0;
+		if (finished) begin
+			busy <= 0;
+			finishing <= 1;
+		end else begin
+			if (step == 4) begin
+				dq_out <= next_shift[31:28];
+				shift <= {next_shift[27:0], 4'h0};
+			end else if (step == 2) begin
+				dq_out <= {2'b00, next_shift[31:30]};
+				shift <= {next_shift[29:0], 2'b00};
+			end else begin
+				dq_out <= {3'b000, next_shift[31]};
+				shift <= {next_shift[30:0], 1'b0};
+			end
+			dq_oe <= release_r ? 4'b0000 : lines;
+			phase <= 1;
+		end
+	end else begin
+		spi_clk <= 1;
+		bit_index <= bit_index + step;
+		pending <= 1;
+		phase <= 0;
+	end
+end
+
+endmodule
@@ -5,10 +5,27 @@ module tb(
 	output clk12,
 	input reset,
 
-	input spi_mosi,
-	output spi_miso,
 	input spi_cs_n,
-	input spi_clk,
+
+	input master_start,
+	output master_done,
+	input [31:0] master_tx,
+	input [15:0] master_len,
+	input master_wait,
+	input master_release,
+	input master_wide,
+	output [31:0] master_rx,
+	output [15:0] master_count,
+
+	input spi_check_miso,
+	output spi_mosi_error,
+	output spi_miso_error,
+
+	input backdoor_load,
+	input backdoor_dump,
+	input [31:0] backdoor_start,
+	input [31:0] backdoor_end,
+	output reg backdoor_done,
 
 	input [29:0] wishbone_adr,
 	output [31:0] wishbone_datrd,
@@ -21,7 +38,118 @@ module tb(
 	input [2:0] wishbone_cti,
 	input [1:0] wishbone_bte,
 	input [4095:0] test_name,
-	output wishbone_err
+	output wishbone_err,
+	output wishbone_stall
+);
+
+// The bus in the dut is classic Wishbone, so pipelined operations are
+// accepted into a one-deep register and presented to the dut from there.
+// A new operation is accepted in the cycle that the previous one is
+// answered, so the dut sees its strobe back to back.
+reg bus_pending;
+reg [29:0] bus_adr;
+reg [31:0] bus_dat_w;
+reg [3:0] bus_sel;
+reg bus_we;
+
+assign wishbone_stall = bus_pending & ~(wishbone_ack | wishbone_err);
+wire bus_accept = wishbone_cyc & wishbone_stb & ~wishbone_stall;
+
+initial begin
+	bus_pending = 0;
+end
+
+always @(posedge clk12) begin
+	if (reset || !wishbone_cyc) begin
+		bus_pending <= 0;
+	end else if (bus_accept) begin
+		bus_pending <= 1;
+		bus_adr <= wishbone_adr;
+		bus_dat_w <= wishbone_datwr;
+		bus_sel <= wishbone_sel;
+		bus_we <= wishbone_we;
+	end else if (wishbone_ack || wishbone_err) begin
+		bus_pending <= 0;
+	end
+end
+
+// Access to main_ram without going over the bus, for setting up and
+// checking tests.  Toggle backdoor_load to read words backdoor_start to
+// backdoor_end of main_ram from backdoor.hex, or backdoor_dump to write
+// them to it.  backdoor_done toggles once the file has been handled.
+reg backdoor_load_seen;
+reg backdoor_dump_seen;
+
+initial begin
+	backdoor_done = 0;
+	backdoor_load_seen = 0;
+	backdoor_dump_seen = 0;
+end
+
+always @(posedge clk48) begin
+	if (backdoor_load != backdoor_load_seen) begin
+		backdoor_load_seen <= backdoor_load;
+		$readmemh("backdoor.hex", dut.main_ram, backdoor_start, backdoor_end);
+		backdoor_done <= ~backdoor_done;
+	end else if (backdoor_dump != backdoor_dump_seen) begin
+		backdoor_dump_seen <= backdoor_dump;
+		$writememh("backdoor.hex", dut.main_ram, backdoor_start, backdoor_end);
+		backdoor_done <= ~backdoor_done;
+	end
+end
+
+// spi_dq[0] is MOSI.  The other lines are only used by a dut built with
+// `generate-verilog.py --width`, in which case SPI_WIDTH should be defined
+// as the number of data lines.
+wire [3:0] spi_dq;
+wire spi_miso;
+wire spi_clk;
+
+// Lets the data lines idle high when nothing drives them
+pullup(spi_dq[0]);
+pullup(spi_dq[1]);
+pullup(spi_dq[2]);
+pullup(spi_dq[3]);
+
+`ifdef SPI_WIDTH
+localparam WIDTH = `SPI_WIDTH;
+`else
+localparam WIDTH = 1;
+`endif
+
+spi_master #(
+	.WIDTH(WIDTH)
+) spi_master (
+	.clk(clk12),
+	.reset(reset),
+
+	.start(master_start),
+	.done(master_done),
+	.tx(master_tx),
+	.len(master_len),
+	.wait_response(master_wait),
+	.release_mosi(master_release),
+	.wide(master_wide),
+	.rx(master_rx),
+	.count(master_count),
+
+	.spi_clk(spi_clk),
+	.spi_dq(spi_dq),
+	.spi_miso(spi_miso)
+);
+
+spi_checker spi_checker (
+	.clk(clk48),
+	.reset(reset),
+
+	.check_miso(spi_check_miso),
+	.spi_cs_n(spi_cs_n),
+	.spi_clk(spi_clk),
+	.spi_dq(spi_dq),
+	.spi_miso(spi_miso),
+
+	.mosi_error(spi_mosi_error),
+	.miso_error(spi_miso_error)
 );
 
 dut dut (
@@ -29,28 +157,34 @@ dut dut (
 	.clk_clk12(clk12),
 	.reset(reset),
 
-	.spi_mosi(spi_mosi),
+`ifdef SPI_WIDTH
+	.spi_dq(spi_dq[`SPI_WIDTH-1:0]),
+`else
+	.spi_mosi(spi_dq[0]),
 	.spi_miso(spi_miso),
+`endif
 	.spi_cs_n(spi_cs_n),
 	.spi_clk(spi_clk),
 
-	.wishbone_adr(wishbone_adr),
+	.wishbone_adr(bus_adr),
 	.wishbone_dat_r(wishbone_datrd),
-	.wishbone_dat_w(wishbone_datwr),
-	.wishbone_sel(wishbone_sel),
+	.wishbone_dat_w(bus_dat_w),
+	.wishbone_sel(bus_sel),
 	.wishbone_cyc(wishbone_cyc),
-	.wishbone_stb(wishbone_stb),
+	.wishbone_stb(bus_pending),
 	.wishbone_ack(wishbone_ack),
-	.wishbone_we(wishbone_we),
+	.wishbone_we(bus_we),
 	.wishbone_cti(wishbone_cti),
 	.wishbone_bte(wishbone_bte),
 	.wishbone_err(wishbone_err)
 );
 
-  // Dump waves
+`ifndef VERILATOR
+  // Dump waves.  Under Verilator, the simulator records them with WAVES=1.
   initial begin
     $dumpfile("dump.vcd");
     $dumpvars(0, tb);
   end
+`endif
 
 endmodule
@@ -14,12 +14,23 @@ import os
 # Disable pylint's E1101, which breaks on our wishbone addresses
 #pylint:disable=E1101
 
+# Where main_ram is mapped, as set up in generate-verilog.py
+MAIN_RAM_BASE = 0x40000000
+
+# File that tb.v loads main_ram from and dumps it to
+BACKDOOR_FILE = "backdoor.hex"
+
 class SpiboneTest:
     def __init__(self, dut, test_name):
         if "WIRES" in os.environ:
             self.wires = int(os.environ["WIRES"])
         else:
             self.wires = 4
+        self.width = int(os.environ.get("WIDTH", 1))
+        self.address_bytes = int(os.environ.get("ADDRESS_BYTES", 4))
+        # Everything after the first byte of a transaction uses all of the
+        # data lines
+        self.wide = False
         self.dut = dut
         self.test_name = test_name
         self.csrs = dict()
@@ -39,57 +50,6 @@ class SpiboneTest:
         tn.buff = test_name
         self.dut.test_name = tn
 
-    @cocotb.coroutine
-    # Validate that the MOSI line doesn't change while CLK is 1
-    def validate_mosi_stability(self, test_name):
-        previous_clk = self.dut.spi_clk
-        previous_val = self.dut.spi_mosi
-        while True:
-            v = self.dut.spi_cs_n.value
-            v_str = "{}".format(v)
-            # self.dut._log.error("{} - CS_N value: {}  Reset value: {}".format(test_name, v_str, self.dut.reset))
-            if v_str == "0" and self.dut.reset == 0:
-                if self.dut.spi_clk:
-                    # Clock went high, so capture value
-                    if previous_clk == 0:
-                        previous_val = self.dut.spi_mosi
-                    else:
-                        if int(self.dut.spi_mosi) != int(previous_val):
-                            raise TestFailure("spi.mosi changed while clk was high (was {}, now {})".format(previous_val, self.dut.spi_mosi))
-                previous_clk = self.dut.spi_clk
-            # else:
-            #     self.dut._log.error("CS_N is Z")
-            yield Edge(self.dut.clk48)
-
-    @cocotb.coroutine
-    # Validate that the MOSI and MISO line don't change while CLK is 1
-    def validate_mosi_miso_stability(self, test_name):
-        previous_clk = self.dut.spi_clk
-        previous_mosi = self.dut.spi_mosi
-        if self.wires == 4:
-            previous_miso = self.dut.spi_miso
-        while True:
-            v = self.dut.spi_cs_n.value
-            v_str = "{}".format(v)
-            # self.dut._log.error("{} - CS_N value: {}  Reset value: {}".format(test_name, v_str, self.dut.reset))
-            if v_str == "0" and self.dut.reset == 0:
-                if self.dut.spi_clk:
-                    # Clock went high, so capture value
-                    if previous_clk == 0:
-                        previous_mosi = self.dut.spi_mosi
-                        if self.wires == 4:
-                            previous_miso = self.dut.spi_miso
-                    else:
-                        if int(self.dut.spi_mosi) != int(previous_mosi):
-                            raise TestFailure("spi.mosi changed while clk was high (was {}, now {})".format(previous_mosi, self.dut.spi_mosi))
-                        if self.wires == 4:
-                            if int(self.dut.spi_miso) != int(previous_miso):
-                                raise TestFailure("spi.mosi changed while clk was high (was {}, now {})".format(previous_miso, self.dut.spi_miso))
-                previous_clk = self.dut.spi_clk
-            # else:
-            #     self.dut._log.error("CS_N is Z")
-            yield Edge(self.dut.clk48)
-
     @cocotb.coroutine
     def write(self, addr, val):
         yield self.wb.write(addr, val)
@@ -99,51 +59,157 @@ class SpiboneTest:
         value = yield self.wb.read(addr)
         raise ReturnValue(value)
 
+    @cocotb.coroutine
+    def write_words(self, addr, values):
+        """Write consecutive words in a single, pipelined, Wishbone cycle"""
+        yield self.wb.send_cycle([WBOp((addr >> 2) + offset, val) for offset, val in enumerate(values)])
+
+    @cocotb.coroutine
+    def read_words(self, addr, count):
+        """Read consecutive words in a single, pipelined, Wishbone cycle"""
+        results = yield self.wb.send_cycle([WBOp((addr >> 2) + offset) for offset in range(count)])
+        raise ReturnValue([res.datrd for res in results])
+
+    @cocotb.coroutine
+    def bus_monitor(self, accepts, answers):
+        """Record the clock on which each Wishbone operation is accepted and answered"""
+        clkedge = RisingEdge(self.dut.clk12)
+        cycle = 0
+        while True:
+            yield clkedge
+            cycle += 1
+            if int(self.dut.wishbone_cyc) and int(self.dut.wishbone_stb) and not int(self.dut.wishbone_stall):
+                accepts.append(cycle)
+            if int(self.dut.wishbone_ack) or int(self.dut.wishbone_err):
+                answers.append(cycle)
+
     @cocotb.coroutine
     def reset(self):
         self.dut.reset = 1
         self.dut.spi_cs_n = 1
-        self.dut.spi_mosi = 0
-        self.dut.spi_clk = 0
+        self.master_start = 0
+        self.dut.master_start = 0
+        self.backdoor_load = 0
+        self.backdoor_dump = 0
+        self.dut.backdoor_load = 0
+        self.dut.backdoor_dump = 0
+        self.dut.master_tx = 0
+        self.dut.master_len = 1
+        self.dut.master_wait = 0
+        self.dut.master_release = 0
+        self.dut.master_wide = 0
+        # MISO is shared with MOSI in two- and three-wire mode
+        self.dut.spi_check_miso = int(self.wires == 4 and self.width == 1)
         yield RisingEdge(self.dut.clk12)
         yield RisingEdge(self.dut.clk12)
-        cocotb.fork(self.validate_mosi_miso_stability(self.test_name))
         self.dut.reset = 0
-        self.dut.spi_mosi = 0
-        self.dut.spi_clk = 0
         self.dut.spi_cs_n = 1
         yield RisingEdge(self.dut.clk12)
         yield RisingEdge(self.dut.clk12)
 
+    def _main_ram_index(self, addr, count):
+        if addr & 3 or addr < MAIN_RAM_BASE:
+            raise TestFailure("backdoor address 0x{:08x} is not a word in main_ram".format(addr))
+        if count < 1:
+            raise TestFailure("backdoor access must be at least one word")
+        return (addr - MAIN_RAM_BASE) >> 2
+
     @cocotb.coroutine
-    def host_spi_tick(self):
-        self.dut.spi_clk = 0
-        yield RisingEdge(self.dut.clk12)
-        self.dut.spi_clk = 1
-        yield RisingEdge(self.dut.clk12)
+    def backdoor_write(self, addr, values):
+        """Write words straight into main_ram, without using the bus
+
+        This takes at most one cycle of clk48, however many words there are.
+        """
+        start = self._main_ram_index(addr, len(values))
+        with open(BACKDOOR_FILE, "w") as backdoor_file:
+            backdoor_file.write("".join("{:08x}\n".format(val & 0xffffffff) for val in values))
+        self.dut.backdoor_start = start
+        self.dut.backdoor_end = start + len(values) - 1
+        self.backdoor_load ^= 1
+        self.dut.backdoor_load = self.backdoor_load
+        yield Edge(self.dut.backdoor_done)
+
+    @cocotb.coroutine
+    def backdoor_read(self, addr, count):
+        """Read words straight out of main_ram, without using the bus"""
+        start = self._main_ram_index(addr, count)
+        self.dut.backdoor_start = start
+        self.dut.backdoor_end = start + count - 1
+        self.backdoor_dump ^= 1
+        self.dut.backdoor_dump = self.backdoor_dump
+        yield Edge(self.dut.backdoor_done)
+        values = []
+        with open(BACKDOOR_FILE) as backdoor_file:
+            for line in backdoor_file:
+                # Skip address markers and comments
+                for word in line.split("//")[0].split():
+                    if not word.startswith("@"):
+                        values.append(int(word, 16))
+        if len(values) != count:
+            raise TestFailure("backdoor read {} words from main_ram, not {}".format(len(values), count))
+        raise ReturnValue(values)
+
+    @cocotb.coroutine
+    def host_spi_transfer(self, val, length=1, receive=False, wait=False):
+        """Have the SPI master in tb.v clock out `length` bytes of `val`
+
+        Returns the last four bytes received, and the number of bytes that
+        were clocked.  When `receive` is set, the data lines are released in
+        two- and three-wire mode, and when there is more than one of them, so
+        that the bridge can drive them.  With `wait`, the
+        low byte of `val` is repeated until a byte other than 0xff comes
+        back, for at most `length` bytes.
+        """
+        self.dut.master_tx = val & 0xffffffff
+        self.dut.master_len = length
+        self.dut.master_wait = int(wait)
+        self.dut.master_release = int(receive and (self.wires != 4 or self.width > 1))
+        self.dut.master_wide = int(self.wide)
+        self.master_start ^= 1
+        self.dut.master_start = self.master_start
+        yield Edge(self.dut.master_done)
+        self.wide = self.width > 1
+        raise ReturnValue((int(self.dut.master_rx), int(self.dut.master_count)))
 
     @cocotb.coroutine
     def host_spi_write_byte(self, val):
-        for shift in range(7, -1, -1):
-            self.dut.spi_mosi = (val >> shift) & 1
-            yield self.host_spi_tick()
+        yield self.host_spi_transfer(val)
+
+    @cocotb.coroutine
+    def host_spi_write_word(self, val, length=4):
+        yield self.host_spi_transfer(val, length)
+
+    @cocotb.coroutine
+    def host_spi_write_address(self, addr):
+        """Send the low `address_bytes` bytes of `addr`"""
+        yield self.host_spi_write_word(addr, self.address_bytes)
 
     @cocotb.coroutine
     def host_spi_read_byte(self):
-        val = 0
-        for shift in range(7, -1, -1):
-            yield self.host_spi_tick()
-            if self.wires == 3 or self.wires == 2:
-                val = val | (int(self.dut.spi_mosi) << shift)
-            elif self.wires == 4:
-                val = val | (int(self.dut.spi_miso) << shift)
+        val = yield self.host_spi_read_word(1)
+        raise ReturnValue(val)
+
+    @cocotb.coroutine
+    def host_spi_read_word(self, length=4):
+        val, _ = yield self.host_spi_transfer(0xffffffff, length, receive=True)
+        raise ReturnValue(val & ((1 << (8 * length)) - 1))
+
+    @cocotb.coroutine
+    def host_spi_wait_response(self, expected, timeout=20):
+        """Read until a byte other than 0xff arrives, and check that it's one of `expected`"""
+        val, _ = yield self.host_spi_transfer(0xff, timeout + 1, receive=True, wait=True)
+        val = val & 0xff
+        if val == 0xff:
+            raise TestFailure("timed out waiting for response")
+        if val not in expected:
+            raise TestFailure("response byte was 0x{:02x}, not {}".format(val, " or ".join("0x{:02x}".format(e) for e in expected)))
         raise ReturnValue(val)
 
     @cocotb.coroutine
     def host_start(self):
+        self.wide = False
         if self.wires == 3 or self.wires == 4:
             self.dut.spi_cs_n = 0
-            self.dut.spi_mosi = 0
         elif self.wires == 2:
             yield self.host_spi_write_byte(0xab)
         if False:
@@ -153,18 +219,16 @@ class SpiboneTest:
     def host_finish(self):
         if self.wires == 3 or self.wires == 4:
             self.dut.spi_cs_n = 1
-        self.dut.spi_mosi = 0
-        yield self.host_spi_tick()
-        self.dut.spi_mosi = 0
-        yield self.host_spi_tick()
-        self.dut.spi_mosi = 0
-        yield self.host_spi_tick()
-        self.dut.spi_mosi = 0
-        yield self.host_spi_tick()
-        self.dut.spi_mosi = 0
-        yield self.host_spi_tick()
-        if False:
-            yield
+        self.wide = False
+        yield self.host_spi_write_byte(0)
+        self.check_stability()
+
+    def check_stability(self):
+        """Fail if the checker in tb.v saw a data line or MISO change while CLK was high"""
+        if int(self.dut.spi_mosi_error):
+            raise TestFailure("spi.mosi changed while clk was high")
+        if int(self.dut.spi_miso_error):
+            raise TestFailure("spi.miso changed while clk was high")
 
     @cocotb.coroutine
     def host_spi_write(self, addr, val):
@@ -176,24 +240,13 @@ class SpiboneTest:
         yield self.host_spi_write_byte(0)
 
         # Address
-        for shift in [24, 16, 8, 0]:
-            yield self.host_spi_write_byte(addr >> shift)
+        yield self.host_spi_write_address(addr)
 
         # Value
-        for shift in [24, 16, 8, 0]:
-            yield self.host_spi_write_byte(val >> shift)
+        yield self.host_spi_write_word(val)
 
         # Wait for response
-        timeout_counter = 0
-        while True:
-            val = yield self.host_spi_read_byte()
-            if val != 0xff:
-                if val == 0:
-                    break
-                raise TestFailure("response byte was 0x{:02x}, not 0x00".format(val))
-            timeout_counter = timeout_counter + 1
-            if timeout_counter > 20:
-                raise TestFailure("timed out waiting for response")
+        yield self.host_spi_wait_response([0])
         yield self.host_finish()
 
     @cocotb.coroutine
@@ -206,31 +259,185 @@ class SpiboneTest:
         yield self.host_spi_write_byte(1)
 
         # Address
-        for shift in [24, 16, 8, 0]:
-            yield self.host_spi_write_byte(addr >> shift)
+        yield self.host_spi_write_address(addr)
 
         # Wait for response
-        timeout_counter = 0
-        while True:
-            val = yield self.host_spi_read_byte()
-            if val != 0xff:
-                if val == 1:
-                    break
-                raise TestFailure("response byte was 0x{:02x}, not 0x01".format(val))
-            timeout_counter = timeout_counter + 1
-            if timeout_counter > 20:
-                raise TestFailure("timed out waiting for response")
+        yield self.host_spi_wait_response([1])
+
+        # Value
+        val = yield self.host_spi_read_word()
+
+        self.dut.spi_cs_n = 1
+        yield self.host_finish()
+        raise ReturnValue(val)
+
+    @cocotb.coroutine
+    def host_spi_burst_write(self, addr, vals):
+        yield self.host_start()
+
+        # Header
+        # 2: Burst write
+        yield self.host_spi_write_byte(2)
+
+        # Address
+        yield self.host_spi_write_address(addr)
+
+        # Count
+        yield self.host_spi_write_word(len(vals), 2)
+
+        # Values
+        for val in vals:
+            yield self.host_spi_write_word(val)
+
+        # Wait for response
+        yield self.host_spi_wait_response([2])
+        yield self.host_finish()
+
+    @cocotb.coroutine
+    def host_spi_burst_read(self, addr, count):
+        yield self.host_start()
+
+        # Header
+        # 3: Burst read
+        yield self.host_spi_write_byte(3)
+
+        # Address
+        yield self.host_spi_write_address(addr)
+
+        # Count
+        yield self.host_spi_write_word(count, 2)
+
+        vals = []
+        for i in range(count):
+            # Wait for response
+            yield self.host_spi_wait_response([3])
+
+            # Value
+            val = yield self.host_spi_read_word()
+            vals.append(val)
+
+        self.dut.spi_cs_n = 1
+        yield self.host_finish()
+        raise ReturnValue(vals)
+
+    @cocotb.coroutine
+    def host_spi_posted_write(self, writes):
+        yield self.host_start()
+
+        for addr, val in writes:
+            # Header
+            # 4: Posted write
+            yield self.host_spi_write_byte(4)
+
+            # Address
+            yield self.host_spi_write_address(addr)
+
+            # Value
+            yield self.host_spi_write_word(val)
+
+        # Header
+        # 5: Posted write status
+        yield self.host_spi_write_byte(5)
+
+        # Wait for response
+        yield self.host_spi_wait_response([5])
+
+        # Status
+        val = yield self.host_spi_read_word()
+
+        self.dut.spi_cs_n = 1
+        yield self.host_finish()
+        raise ReturnValue(val)
+
+    @cocotb.coroutine
+    def host_spi_write_byte_value(self, addr, val):
+        yield self.host_start()
+
+        # Header
+        # 6: Byte write
+        yield self.host_spi_write_byte(6)
+
+        # Address
+        yield self.host_spi_write_address(addr)
+
+        # Value
+        yield self.host_spi_write_byte(val)
+
+        # Wait for response
+        yield self.host_spi_wait_response([6])
+        yield self.host_finish()
+
+    @cocotb.coroutine
+    def host_spi_read_byte_value(self, addr):
+        yield self.host_start()
+
+        # Header
+        # 7: Byte read
+        yield self.host_spi_write_byte(7)
+
+        # Address
+        yield self.host_spi_write_address(addr)
+
+        # Wait for response
+        yield self.host_spi_wait_response([7])
 
         # Value
-        val = 0
-        for shift in [24, 16, 8, 0]:
-            addon = yield self.host_spi_read_byte()
-            val = val | (addon << shift)
+        val = yield self.host_spi_read_byte()
 
         self.dut.spi_cs_n = 1
         yield self.host_finish()
         raise ReturnValue(val)
 
+    @cocotb.coroutine
+    def host_spi_rmw(self, command, addr, mask):
+        yield self.host_start()
+
+        # Header
+        # 0x0a: Set bits
+        # 0x0c: Clear bits
+        # 0x0e: Toggle bits
+        yield self.host_spi_write_byte(command)
+
+        # Address
+        yield self.host_spi_write_address(addr)
+
+        # Mask
+        yield self.host_spi_write_word(mask)
+
+        # Wait for response
+        yield self.host_spi_wait_response([command])
+        yield self.host_finish()
+
+    @cocotb.coroutine
+    def host_spi_poll(self, addr, mask, expected, attempts):
+        yield self.host_start()
+
+        # Header
+        # 0x0b: Poll
+        yield self.host_spi_write_byte(0x0b)
+
+        # Address
+        yield self.host_spi_write_address(addr)
+
+        # Mask
+        yield self.host_spi_write_word(mask)
+
+        # Expected value
+        yield self.host_spi_write_word(expected)
+
+        # Attempts
+        yield self.host_spi_write_word(attempts, 2)
+
+        # Wait for response
+        response = yield self.host_spi_wait_response([0x0b, 0x8b], attempts + 20)
+
+        # Value
+        val = yield self.host_spi_read_word()
+
+        self.dut.spi_cs_n = 1
+        yield self.host_finish()
+        raise ReturnValue((response, val))
+
 @cocotb.test()
 def test_wishbone_write(dut):
     harness = SpiboneTest(dut, inspect.currentframe().f_code.co_name)
@@ -245,6 +452,47 @@ def test_wishbone_write(dut):
     if val != 0x54:
         raise TestFailure("wishbone check failed -- expected 0x54, got 0x{:02x}".format(val))
 
+@cocotb.test()
+def test_backdoor(dut):
+    addr = 0x40000100
+    canaries = [0x01234567, 0x89abcdef, 0xaaaaaaaa, 0x55555555]
+    harness = SpiboneTest(dut, inspect.currentframe().f_code.co_name)
+    yield harness.reset()
+    yield harness.backdoor_write(addr, canaries)
+    check_canaries = yield harness.read_words(addr, len(canaries))
+    if check_canaries != canaries:
+        raise TestFailure("bus read {} after backdoor write of {}".format(check_canaries, canaries))
+    canaries.reverse()
+    yield harness.write_words(addr, canaries)
+    check_canaries = yield harness.backdoor_read(addr, len(canaries))
+    if check_canaries != canaries:
+        raise TestFailure("backdoor read {} after bus write of {}".format(check_canaries, canaries))
+
+@cocotb.test()
+def test_wishbone_pipelined(dut):
+    addr = 0x40000200
+    canaries = [0x01234567, 0x89abcdef, 0xaaaaaaaa, 0x55555555, 0x00000000, 0xffffffff]
+    harness = SpiboneTest(dut, inspect.currentframe().f_code.co_name)
+    yield harness.reset()
+    yield harness.backdoor_write(addr, canaries)
+    accepts = []
+    answers = []
+    monitor = cocotb.fork(harness.bus_monitor(accepts, answers))
+    check_canaries = yield harness.read_words(addr, len(canaries))
+    monitor.kill()
+    if check_canaries != canaries:
+        raise TestFailure("pipelined read {}, not {}".format(check_canaries, canaries))
+    if len(accepts) != len(canaries) or len(answers) != len(canaries):
+        raise TestFailure("{} operations were accepted and {} answered, not {}".format(len(accepts), len(answers), len(canaries)))
+    for index, (accepted, answered) in enumerate(zip(accepts, answers)):
+        # Each operation is issued before the one ahead of it is answered,
+        # and accepted as soon as it is
+        if answered <= accepted:
+            raise TestFailure("operation {} was only accepted once it was answered".format(index))
+        if index > 0 and accepted != answers[index - 1]:
+            raise TestFailure("operation {} was accepted {} cycles after the previous one was answered".format(
+                index, accepted - answers[index - 1]))
+
 @cocotb.coroutine
 def test_spibone_write(dut, test_name, canary):
     addr = 0x40000004
@@ -261,7 +509,7 @@ def test_spibone_read(dut, test_name, canary):
     harness = SpiboneTest(dut, test_name)
     yield harness.reset()
 
-    yield harness.write(addr, canary)
+    yield harness.backdoor_write(addr, [canary])
     check_canary = yield harness.host_spi_read(addr)
     if check_canary != canary:
         raise TestFailure("check_canary 0x{:08x} doesn't match written value 0x{:08x}".format(check_canary, canary))
@@ -281,3 +529,137 @@ def test_spibone_write_aaaaaaaa(dut):
 @cocotb.test()
 def test_spibone_write_55555555(dut):
     yield test_spibone_write(dut, inspect.currentframe().f_code.co_name, 0x55555555)
+
+@cocotb.test()
+def test_spibone_burst_write(dut):
+    addr = 0x40000010
+    canaries = [0x01234567, 0x89abcdef, 0xaaaaaaaa, 0x55555555]
+    harness = SpiboneTest(dut, inspect.currentframe().f_code.co_name)
+    yield harness.reset()
+    yield harness.host_spi_burst_write(addr, canaries)
+    check_canaries = yield harness.backdoor_read(addr, len(canaries))
+    for check_canary, canary in zip(check_canaries, canaries):
+        if check_canary != canary:
+            raise TestFailure("check_canary 0x{:08x} doesn't match written value 0x{:08x}".format(check_canary, canary))
+
+@cocotb.test()
+def test_spibone_burst_read(dut):
+    addr = 0x40000010
+    canaries = [0x01234567, 0x89abcdef, 0xaaaaaaaa, 0x55555555]
+    harness = SpiboneTest(dut, inspect.currentframe().f_code.co_name)
+    yield harness.reset()
+    yield harness.backdoor_write(addr, canaries)
+    check_canaries = yield harness.host_spi_burst_read(addr, len(canaries))
+    for check_canary, canary in zip(check_canaries, canaries):
+        if check_canary != canary:
+            raise TestFailure("check_canary 0x{:08x} doesn't match written value 0x{:08x}".format(check_canary, canary))
+
+@cocotb.test()
+def test_spibone_posted_write(dut):
+    addr = 0x40000020
+    canaries = [0x01234567, 0x89abcdef, 0xaaaaaaaa, 0x55555555]
+    harness = SpiboneTest(dut, inspect.currentframe().f_code.co_name)
+    yield harness.reset()
+    status = yield harness.host_spi_posted_write([(addr + offset * 4, canary) for offset, canary in enumerate(canaries)])
+    if status != 0:
+        raise TestFailure("posted write status was 0x{:08x}, not 0x00000000".format(status))
+    check_canaries = yield harness.read_words(addr, len(canaries))
+    for check_canary, canary in zip(check_canaries, canaries):
+        if check_canary != canary:
+            raise TestFailure("check_canary 0x{:08x} doesn't match written value 0x{:08x}".format(check_canary, canary))
+
+@cocotb.test()
+def test_spibone_multiple_commands(dut):
+    addr = 0x40000030
+    canaries = [0x01234567, 0x89abcdef]
+    harness = SpiboneTest(dut, inspect.currentframe().f_code.co_name)
+    yield harness.reset()
+    yield harness.host_start()
+    for offset, canary in enumerate(canaries):
+        if harness.wires == 2 and offset > 0:
+            yield harness.host_spi_write_byte(0xab)
+
+        # Header
+        # 0: Write
+        yield harness.host_spi_write_byte(0)
+
+        # Address
+        yield harness.host_spi_write_address(addr + offset * 4)
+
+        # Value
+        yield harness.host_spi_write_word(canary)
+
+        # Wait for response
+        yield harness.host_spi_wait_response([0])
+    yield harness.host_finish()
+
+    check_canaries = yield harness.read_words(addr, len(canaries))
+    for check_canary, canary in zip(check_canaries, canaries):
+        if check_canary != canary:
+            raise TestFailure("check_canary 0x{:08x} doesn't match written value 0x{:08x}".format(check_canary, canary))
+
+@cocotb.test()
+def test_spibone_padding(dut):
+    addr = 0x40000038
+    canary = 0x5a5aa5a5
+    harness = SpiboneTest(dut, inspect.currentframe().f_code.co_name)
+    yield harness.reset()
+    yield harness.host_start()
+
+    # Write, then pad with NOPs before reading the value back
+    yield harness.host_spi_write_byte(0)
+    yield harness.host_spi_write_address(addr)
+    yield harness.host_spi_write_word(canary)
+    yield harness.host_spi_wait_response([0])
+    yield harness.host_spi_write_word(0xffffff, 3)
+    if harness.wires == 2:
+        yield harness.host_spi_write_byte(0xab)
+    yield harness.host_spi_write_byte(1)
+    yield harness.host_spi_write_address(addr)
+    yield harness.host_spi_wait_response([1])
+    val = yield harness.host_spi_read_word()
+    yield harness.host_finish()
+
+    if val != canary:
+        raise TestFailure("read after padding returned 0x{:08x}, not 0x{:08x}".format(val, canary))
+
+@cocotb.test()
+def test_spibone_byte_access(dut):
+    addr = 0x40000040
+    harness = SpiboneTest(dut, inspect.currentframe().f_code.co_name)
+    yield harness.reset()
+    yield harness.write(addr, 0x11223344)
+    yield harness.host_spi_write_byte_value(addr + 1, 0xaa)
+    val = yield harness.read(addr)
+    if val != 0x1122aa44:
+        raise TestFailure("memory check failed -- expected 0x1122aa44, got 0x{:08x}".format(val))
+    val = yield harness.host_spi_read_byte_value(addr + 2)
+    if val != 0x22:
+        raise TestFailure("byte read failed -- expected 0x22, got 0x{:02x}".format(val))
+
+@cocotb.test()
+def test_spibone_rmw(dut):
+    addr = 0x40000050
+    harness = SpiboneTest(dut, inspect.currentframe().f_code.co_name)
+    yield harness.reset()
+    yield harness.write(addr, 0xf0f0f0f0)
+    for command, mask, expected in [(0x0a, 0x0000000f, 0xf0f0f0ff),
+                                    (0x0c, 0xf0000000, 0x00f0f0ff),
+                                    (0x0e, 0xffffffff, 0xff0f0f00)]:
+        yield harness.host_spi_rmw(command, addr, mask)
+        val = yield harness.read(addr)
+        if val != expected:
+            raise TestFailure("command 0x{:02x} failed -- expected 0x{:08x}, got 0x{:08x}".format(command, expected, val))
+
+@cocotb.test()
+def test_spibone_poll(dut):
+    addr = 0x40000060
+    harness = SpiboneTest(dut, inspect.currentframe().f_code.co_name)
+    yield harness.reset()
+    yield harness.write(addr, 0x12345678)
+    response, val = yield harness.host_spi_poll(addr, 0x000000ff, 0x00000078, 4)
+    if response != 0x0b or val != 0x12345678:
+        raise TestFailure("poll should have matched, got response 0x{:02x} value 0x{:08x}".format(response, val))
+    response, val = yield harness.host_spi_poll(addr, 0x000000ff, 0x00000079, 4)
+    if response != 0x8b or val != 0x12345678:
+        raise TestFailure("poll should have timed out, got response 0x{:02x} value 0x{:08x}".format(response, val))
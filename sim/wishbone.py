@@ -86,8 +86,18 @@ class Wishbone(BusDriver):
 class WishboneMaster(Wishbone):
     """
     Wishbone master
+
+    In pipelined mode (Wishbone B4), the strobe stays up for the whole list
+    of operations given to send_cycle(), and a new operation is presented
+    as soon as the slave stops stalling, without waiting for the previous
+    one to be acknowledged.  This needs a stall signal, and is used by
+    default if there is one.
+
+    The dut in tb.v is classic Wishbone, so tb.v accepts operations into a
+    one-deep register in front of it.  The next operation is accepted in
+    the cycle that the one before it is answered.
     """
-    def __init__(self, entity, name, clock, timeout=None, width=32):
+    def __init__(self, entity, name, clock, timeout=None, width=32, pipelined=None):
         sTo = ", no cycle timeout"
         if timeout is not None:
             sTo = ", cycle timeout is %u clock cycles" % timeout
@@ -100,6 +110,13 @@ class WishboneMaster(Wishbone):
         self._op_cnt            = 0
         self._clk_cycle_count   = 0
         Wishbone.__init__(self, entity, name, clock, width)
+        if pipelined is None:
+            pipelined = hasattr(self.bus, "stall")
+        elif pipelined and not hasattr(self.bus, "stall"):
+            raise TestFailure("Pipelined Wishbone needs a stall signal")
+        self._pipelined         = pipelined
+        if pipelined:
+            sTo += ", pipelined"
         self.log.info("Wishbone Master created%s" % sTo)
 
 
@@ -163,7 +180,7 @@ class WishboneMaster(Wishbone):
         """
         clkedge = RisingEdge(self.clock)
         count = 0
-        if hasattr(self.bus, "stall"):
+        if self._pipelined:
             count = 0
             while self.bus.stall:
                 yield clkedge
@@ -182,7 +199,7 @@ class WishboneMaster(Wishbone):
         #wait for acknownledgement before continuing - Classic Wishbone without pipelining
         clkedge = RisingEdge(self.clock)
         count = 0
-        if not hasattr(self.bus, "stall"):
+        if not self._pipelined:
             while not self._get_reply():
                 yield clkedge
                 count += 1
@@ -235,7 +252,10 @@ class WishboneMaster(Wishbone):
         clkedge = RisingEdge(self.clock)
         if self.busy:
             # insert requested idle cycles
-            if idle is not None:
+            if idle:
+                # the strobe is still up after a pipelined operation
+                self.bus.stb    <= 0
+                self.bus.we     <= 0
                 idlecnt = idle
                 while idlecnt > 0:
                     idlecnt -= 1
@@ -251,6 +271,10 @@ class WishboneMaster(Wishbone):
             stalled = yield self._wait_stall()
             #append operation and meta info to auxiliary buffer
             self._aux_buf.append(WBAux(sel, adr, datwr, stalled, idle, self._clk_cycle_count))
+            if self._pipelined:
+                # The operation was accepted, so leave the strobe up for the
+                # next one.  Its ack is picked up by _read().
+                return
             # non pipelined wishbone
             yield self._wait_ack()
             #reset strobe and write enable after the acknowledgement was received.
@@ -299,6 +323,8 @@ class WishboneMaster(Wishbone):
                     yield self._drive(we, op.adr, dat, op.sel, op.idle)
                     self.log.debug("#%3u WE: %s ADR: 0x%08x DAT: 0x%08x SEL: 0x%1x IDLE: %3u" % (cnt, we, op.adr<<2, dat, op.sel, op.idle))
                     cnt += 1
+                self.bus.stb    <= 0
+                self.bus.we     <= 0
                 yield self._close_cycle()
 
                 #do pick and mix from result- and auxiliary buffer so we get all operation and meta info
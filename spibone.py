@@ -5,6 +5,19 @@ from migen.genlib.cdc import MultiReg
 from litex.soc.integration.doc import ModuleDoc, AutoDoc
 from litex.soc.interconnect import wishbone, stream
 
+# Access sizes, as log2 of the number of bytes
+SIZE_BYTE = 0
+SIZE_HALF = 1
+SIZE_WORD = 2
+
+# Read-modify-write commands
+CMD_RMW_SET    = 0x0a
+CMD_RMW_CLEAR  = 0x0c
+CMD_RMW_TOGGLE = 0x0e
+
+# Poll until a value matches
+CMD_POLL = 0x0b
+
 class Spi4WireDocumentation(ModuleDoc):
     """4-Wire SPI Protocol
 
@@ -106,6 +119,766 @@ class Spi2WireDocumentation(ModuleDoc):
         ]}
         """
 
+class SpiBurstDocumentation(ModuleDoc):
+    """Burst Operations
+
+    In addition to single 32-bit reads and writes, the bridge supports burst
+    operations that transfer a number of consecutive words within a single
+    transaction.  The command byte and address are followed by a 16-bit word
+    count, and the address is incremented by four after each word.  A count
+    of ``0`` transfers 65536 words.
+
+    A burst write (``0x02``) is followed by all of the data words.  Each word
+    is written to the bus while the data after it is received into a small
+    buffer, which holds at least one word.  Once the final word has been
+    written, the device responds with ``0x02``.  If the buffer fills up
+    before a word has been written, or if the bus signals an error, the
+    remainder of the burst is discarded and the device responds with
+    ``0x82`` instead.
+
+    A burst read (``0x03``) returns each word with its own response byte.
+    The device outputs ``0xFF`` while the word is being read from the bus,
+    followed by ``0x03`` and the four data bytes, and then moves on to the
+    next word.  Words are read ahead into a small FIFO while the previous
+    word is being shifted out, so after the first word there are usually
+    no further ``0xFF`` bytes.  If the bus signals an error, that word is
+    sent with a response byte of ``0x83`` and the burst ends there, so the
+    device is ready for the next command straight after it.
+
+    ::
+
+        Burst read:
+            Write: 03 | AA | AA | AA | AA | NN | NN
+            Read:  [FF...] 03 | VV | VV | VV | VV | [FF...] 03 | VV | ...
+        Burst write:
+            Write: 02 | AA | AA | AA | AA | NN | NN | VV | VV | VV | VV | ...
+            Read:  [FF...] 02
+    """
+
+class SpiPostedWriteDocumentation(ModuleDoc):
+    """Posted Writes
+
+    A posted write (``0x04``) has the same format as a normal write, but
+    there is no response.  The address and data are added to a small queue
+    and written to the bus in the background, and the device is immediately
+    ready for the next command without the host releasing ``CS``.  This
+    allows long sequences of register writes to run at the full SPI rate.
+
+    Because posted writes have no response, any errors are recorded in a
+    sticky status register.  The status command (``0x05``) waits until all
+    posted writes have finished, and then responds like a read with ``0x05``
+    followed by the status word.  Reading the status clears it.
+
+    * Bit 0: The bus signalled an error during a posted write
+    * Bit 1: A posted write was discarded because the queue was full
+
+    Other commands wait for the queue to drain before they access the bus,
+    so a read always returns the result of any earlier posted writes.
+
+    ::
+
+        Posted write:
+            Write: 04 | AA | AA | AA | AA | VV | VV | VV | VV | [next command]
+        Status:
+            Write: 05
+            Read:  [FF...] 05 | SS | SS | SS | SS
+    """
+
+class SpiWideDocumentation(ModuleDoc):
+    """Dual and Quad SPI
+
+    When built with a ``width`` of 2 or 4, the bridge uses that many data
+    lines, which are connected to the ``dq`` pads.  As with QSPI flash, the
+    first command byte after ``CS`` is asserted is sent one bit at a time on
+    ``dq[0]``.  Everything after it, including the address, data, ``0xFF``
+    padding, responses, and any further commands before ``CS`` is released,
+    is transferred 2 or 4 bits per clock, with ``dq[0]`` carrying the least
+    significant bit of each group.
+
+    As in three-wire mode, all of the data lines change direction once the
+    device starts to respond, and change back once the response has been
+    sent.
+    """
+
+class SpiMultipleCommandDocumentation(ModuleDoc):
+    """Multiple Commands
+
+    After each response the device goes back to waiting for a command, so
+    any number of commands may be sent without releasing ``CS``.  In two-wire
+    mode each command must still be preceded by the sync byte.  In three-wire
+    mode the line changes direction back to an input once the response has
+    been sent.
+
+    A command byte of ``0xFF`` does nothing, so the ``0xFF`` bytes that the
+    host sends while polling for a response are ignored if the response
+    arrives early.  The host should send enough ``0xFF`` bytes after each
+    command to cover the longest expected response time.  If a response
+    takes longer than that, the bytes of the following command will have been
+    sent while the device was still busy, so the host should release ``CS``
+    and retry.
+
+    ::
+
+        Write: 01 | AA | AA | AA | AA | FF | FF | FF | FF | FF | FF | FF | 00 | AA | ...
+        Read:  FF | FF | FF | FF | FF | FF | 01 | VV | VV | VV | VV | FF | FF | ...
+    """
+
+class SpiNarrowDocumentation(ModuleDoc):
+    """Byte and Halfword Access
+
+    Registers that are only 8 or 16 bits wide can be accessed without
+    reading and writing the whole word.  These commands work like the normal
+    read and write, except that the value is only one or two bytes long.
+    The low bits of the address select which byte lanes are accessed, and
+    halfword addresses must be aligned to two bytes.
+
+    * ``0x06``: Byte write
+    * ``0x07``: Byte read
+    * ``0x08``: Halfword write
+    * ``0x09``: Halfword read
+
+    ::
+
+        Byte read:
+            Write: 07 | AA | AA | AA | AA
+            Read:  [FF...] 07 | VV
+        Halfword write:
+            Write: 08 | AA | AA | AA | AA | VV | VV
+            Read:  [FF...] 08
+    """
+
+class SpiReadModifyWriteDocumentation(ModuleDoc):
+    """Read-Modify-Write
+
+    Individual bits can be set, cleared, or toggled with a single command.
+    The command is followed by the address and a 32-bit mask.  The device
+    reads the word, modifies the bits given by the mask, and writes the
+    result back without releasing the bus in between, so no other master
+    can modify the word at the same time.
+
+    * ``0x0A``: Set the bits in the mask (OR)
+    * ``0x0C``: Clear the bits in the mask (AND NOT)
+    * ``0x0E``: Toggle the bits in the mask (XOR)
+
+    The response is the command byte, with the top bit set if the bus
+    signalled an error.  If the read fails, nothing is written.
+
+    ::
+
+        Write: 0A | AA | AA | AA | AA | MM | MM | MM | MM
+        Read:  [FF...] 0A
+    """
+
+class SpiPollDocumentation(ModuleDoc):
+    """Polling
+
+    Rather than repeatedly reading a status register from the host, the
+    device can poll it.  The poll command (``0x0B``) is followed by the
+    address, a 32-bit mask, a 32-bit expected value, and a 16-bit attempt
+    count.  The device reads the address once per byte until
+    ``(value & mask) == expected``, outputting ``0xFF`` while it waits.
+
+    When the value matches, the device responds with ``0x0B`` followed by
+    the value.  If there is no match after the given number of attempts, or
+    if the bus signals an error, the device responds with ``0x8B`` followed by
+    the last value that was read.  An attempt count of ``0`` allows 65536
+    attempts.
+
+    ::
+
+        Write: 0B | AA | AA | AA | AA | MM | MM | MM | MM | EE | EE | EE | EE | NN | NN
+        Read:  [FF...] 0B | VV | VV | VV | VV
+    """
+
+class SpiAddressDocumentation(ModuleDoc):
+    """Short Addresses
+
+    This bridge was built with {} address bytes rather than four, which
+    shortens every command that includes an address.  The address that is
+    sent is an offset from 0x{:08x}, so the bridge can only reach the
+    0x{:x} bytes starting at that address.
+    """
+    def __init__(self, address_bytes, address_base):
+        self.__doc__ = self.__doc__.format(address_bytes, address_base, 2**(8 * address_bytes))
+
+class _SpiBridgeCore(Module):
+    """Command handling shared by the SPI bridges
+
+    The core takes the bytes of each command from `sink`, performs it on the
+    Wishbone bus, and offers each byte of the response on `source`.  The
+    front end that connects it to the SPI pins should:
+
+    * Queue each byte received from the host on `sink`, and pulse
+      `rx_overflow` if one is lost because the core isn't taking them.
+    * Send each byte offered on `source` at the next byte boundary, asserting
+      `ready` when it does so, and send "FF" when nothing is offered.
+    * Drive shared data lines while `drive` is set, which is whenever the
+      host is waiting for a response.
+    * Hold `cs_n` high between transactions, which aborts any command in
+      progress.
+
+    `done` pulses each time the core goes back to waiting for a command.
+    With `resync`, the front end looks for a sync byte before each command,
+    so an unknown command is ignored rather than ending the transaction.
+    """
+    def __init__(self, address_bytes=4, address_base=0, resync=False):
+        self.wishbone = wishbone.Interface()
+        self.sink = stream.Endpoint([("data", 8)])
+        self.source = stream.Endpoint([("data", 8)])
+        self.rx_overflow = Signal()
+        self.drive = Signal()
+        self.done = Signal()
+        self.cs_n = Signal()
+
+        # # #
+        address_bits = 8 * address_bytes
+        rx = self.sink
+        tx = self.source
+        cs_n = self.cs_n
+
+        command = Signal(8)
+        address = Signal(32)
+        value   = Signal(32)
+        wr      = Signal()
+
+        # Number of bytes left to receive or send in the current field
+        bytes_left = Signal(2)
+
+        # Access size, as log2 of the number of bytes.  Narrow values are
+        # kept in the low bits of `value` and moved to the correct byte
+        # lane on the bus.
+        size       = Signal(2)
+        data_bytes = Signal(3)
+        sel        = Signal(4)
+        lane       = Signal(5)
+
+        # Read-modify-write.  The mask is received into `value`, and the
+        # new value is calculated from it and the value read from the bus.
+        rmw        = Signal()
+        rmw_result = Signal(32)
+
+        # Poll until `(value & mask) == expected`, with `count` holding the
+        # number of attempts remaining
+        poll     = Signal()
+        mask     = Signal(32)
+        expected = Signal(32)
+
+        # Burst state.  Once a burst write has failed, the rest of its data
+        # is received and discarded.
+        burst  = Signal()
+        count  = Signal(16)
+        failed = Signal()
+        status = Signal(8)
+
+        # Burst read prefetch.  Words are read from the bus into a small
+        # FIFO while previous words are still being sent.  A word that
+        # failed is marked with `err`, and ends the burst.
+        fetching = Signal()
+        fetch_count = Signal(16)
+        prefetch_fifo = stream.SyncFIFO([("data", 32), ("err", 1)], 4)
+        prefetch_fifo = ResetInserter()(prefetch_fifo)
+        self.submodules += prefetch_fifo
+        self.comb += prefetch_fifo.reset.eq(cs_n)
+
+        # Posted writes are queued here and written to the bus in the
+        # background, even after CS has been deasserted.  Any errors are
+        # recorded in sticky flags until they are read.
+        posted = Signal()
+        posted_fifo = stream.SyncFIFO([("adr", 30), ("data", 32)], 4)
+        self.submodules += posted_fifo
+        posted_error = Signal()
+        posted_overflow = Signal()
+        status_clear = Signal()
+        bus = wishbone.Interface()
+
+        fsm = FSM(reset_state="IDLE")
+        fsm = ResetInserter()(fsm)
+        self.submodules += fsm
+        self.comb += fsm.reset.eq(cs_n)
+
+        # Connect the Wishbone bus up to our values
+        self.comb += [
+            bus.adr.eq(address[2:]),
+            bus.dat_w.eq(value << lane),
+            bus.sel.eq(sel),
+        ]
+        self.comb += Case(size, {
+            SIZE_BYTE: [
+                data_bytes.eq(1),
+                sel.eq(1 << address[0:2]),
+                lane.eq(Cat(Replicate(0, 3), address[0:2])),
+            ],
+            SIZE_HALF: [
+                data_bytes.eq(2),
+                sel.eq(0b11 << Cat(0, address[1])),
+                lane.eq(Cat(Replicate(0, 4), address[1])),
+            ],
+            "default": [
+                data_bytes.eq(4),
+                sel.eq(0b1111),
+                lane.eq(0),
+            ],
+        })
+
+        # Queued posted writes take priority over the FSM, which stalls
+        # until they have all been written.
+        self.comb += [
+            If(posted_fifo.source.valid,
+                self.wishbone.adr.eq(posted_fifo.source.adr),
+                self.wishbone.dat_w.eq(posted_fifo.source.data),
+                self.wishbone.sel.eq(2**len(self.wishbone.sel) - 1),
+                self.wishbone.stb.eq(1),
+                self.wishbone.we.eq(1),
+                self.wishbone.cyc.eq(1),
+                posted_fifo.source.ready.eq(self.wishbone.ack | self.wishbone.err),
+            ).Else(
+                bus.connect(self.wishbone),
+            ),
+        ]
+        self.sync += [
+            If(status_clear,
+                posted_error.eq(0),
+                posted_overflow.eq(0),
+            ),
+            If(posted_fifo.source.valid & self.wishbone.err,
+                posted_error.eq(1),
+            ),
+            If(posted_fifo.sink.valid & ~posted_fifo.sink.ready,
+                posted_overflow.eq(1),
+            ),
+        ]
+
+        # Issue burst reads whenever there is room in the prefetch FIFO.
+        # This is added to every state that can run during a burst read.
+        prefetch = [
+            bus.stb.eq(fetching & prefetch_fifo.sink.ready),
+            bus.we.eq(0),
+            bus.cyc.eq(fetching & prefetch_fifo.sink.ready),
+            prefetch_fifo.sink.data.eq(bus.dat_r),
+            prefetch_fifo.sink.err.eq(bus.err),
+            If(fetching & prefetch_fifo.sink.ready & (bus.ack | bus.err),
+                prefetch_fifo.sink.valid.eq(1),
+                NextValue(address, address + 4),
+                NextValue(fetch_count, fetch_count - 1),
+                If((fetch_count == 1) | bus.err,
+                    NextValue(fetching, 0),
+                ),
+            ),
+        ]
+
+        # The response byte echoes the command, with the top bit set if
+        # the operation failed
+        self.comb += status.eq(Mux(failed, command | 0x80, command))
+
+        self.comb += Case(command, {
+            CMD_RMW_SET:    rmw_result.eq(bus.dat_r | value),
+            CMD_RMW_CLEAR:  rmw_result.eq(bus.dat_r & ~value),
+            CMD_RMW_TOGGLE: rmw_result.eq(bus.dat_r ^ value),
+            "default":      rmw_result.eq(bus.dat_r),
+        })
+
+        self.comb += [
+            posted_fifo.sink.adr.eq(address[2:]),
+            posted_fifo.sink.data.eq(value),
+        ]
+
+        # Shift the next received byte into `target`, counting down
+        # `bytes_left`.  The field is complete when `bytes_left` is 0.
+        def receive(target):
+            return [
+                rx.ready.eq(1),
+                If(rx.valid,
+                    NextValue(target, Cat(rx.data, target)),
+                    NextValue(bytes_left, bytes_left - 1),
+                ),
+            ]
+        received = rx.valid & (bytes_left == 0)
+
+        # Go back to waiting for a command without ending the transaction
+        next_command = [
+            self.done.eq(1),
+            NextState("IDLE"),
+        ]
+
+        fsm.act("IDLE",
+            rx.ready.eq(1),
+            If(rx.valid,
+                NextValue(command, rx.data),
+                NextState("GET_TYPE_BYTE"),
+            ),
+        )
+
+        # Determine if it's a read or a write
+        fsm.act("GET_TYPE_BYTE",
+            NextValue(burst, 0),
+            NextValue(posted, 0),
+            NextValue(rmw, 0),
+            NextValue(poll, 0),
+            NextValue(failed, 0),
+            NextValue(size, SIZE_WORD),
+            NextValue(bytes_left, address_bytes - 1),
+            # Write value
+            If(command == 0,
+                NextValue(wr, 1),
+                NextState("READ_ADDRESS"),
+
+            # Read value
+            ).Elif(command == 1,
+                NextValue(wr, 0),
+                NextState("READ_ADDRESS"),
+
+            # Burst write
+            ).Elif(command == 2,
+                NextValue(wr, 1),
+                NextValue(burst, 1),
+                NextState("READ_ADDRESS"),
+
+            # Burst read
+            ).Elif(command == 3,
+                NextValue(wr, 0),
+                NextValue(burst, 1),
+                NextState("READ_ADDRESS"),
+
+            # Posted write
+            ).Elif(command == 4,
+                NextValue(wr, 1),
+                NextValue(posted, 1),
+                NextState("READ_ADDRESS"),
+
+            # Posted write status
+            ).Elif(command == 5,
+                NextValue(wr, 0),
+                NextState("READ_STATUS"),
+
+            # Byte write
+            ).Elif(command == 6,
+                NextValue(wr, 1),
+                NextValue(size, SIZE_BYTE),
+                NextState("READ_ADDRESS"),
+
+            # Byte read
+            ).Elif(command == 7,
+                NextValue(wr, 0),
+                NextValue(size, SIZE_BYTE),
+                NextState("READ_ADDRESS"),
+
+            # Halfword write
+            ).Elif(command == 8,
+                NextValue(wr, 1),
+                NextValue(size, SIZE_HALF),
+                NextState("READ_ADDRESS"),
+
+            # Halfword read
+            ).Elif(command == 9,
+                NextValue(wr, 0),
+                NextValue(size, SIZE_HALF),
+                NextState("READ_ADDRESS"),
+
+            # Read-modify-write
+            ).Elif((command == CMD_RMW_SET) | (command == CMD_RMW_CLEAR) | (command == CMD_RMW_TOGGLE),
+                NextValue(wr, 1),
+                NextValue(rmw, 1),
+                NextState("READ_ADDRESS"),
+
+            # Poll until match
+            ).Elif(command == CMD_POLL,
+                NextValue(wr, 0),
+                NextValue(poll, 1),
+                NextState("READ_ADDRESS"),
+
+            # Padding between commands
+            ).Elif(command == 0xff,
+                *next_command,
+            ).Else(
+                NextState("END"),
+            ),
+        )
+
+        fsm.act("READ_ADDRESS",
+            *receive(address),
+            If(received,
+                # Short addresses are offsets from `address_base`
+                NextValue(address, address_base | Cat(rx.data, address)[:address_bits]),
+                If(burst,
+                    NextValue(bytes_left, 1),
+                    NextState("READ_COUNT"),
+                ).Elif(poll,
+                    NextValue(bytes_left, 3),
+                    NextState("READ_POLL_MASK"),
+                ).Elif(wr,
+                    NextValue(bytes_left, data_bytes - 1),
+                    NextState("READ_VALUE"),
+                ).Else(
+                    NextState("READ_WISHBONE"),
+                ),
+            ),
+        )
+
+        fsm.act("READ_COUNT",
+            *receive(count),
+            If(received,
+                If(wr,
+                    NextValue(bytes_left, 3),
+                    NextState("READ_VALUE"),
+                ).Else(
+                    NextValue(fetching, 1),
+                    NextValue(fetch_count, Cat(rx.data, count)),
+                    NextState("WAIT_PREFETCH"),
+                ),
+            ),
+        )
+
+        fsm.act("READ_POLL_MASK",
+            *receive(mask),
+            If(received,
+                NextValue(bytes_left, 3),
+                NextState("READ_POLL_EXPECTED"),
+            ),
+        )
+
+        fsm.act("READ_POLL_EXPECTED",
+            *receive(expected),
+            If(received,
+                NextValue(bytes_left, 1),
+                NextState("READ_POLL_COUNT"),
+            ),
+        )
+
+        fsm.act("READ_POLL_COUNT",
+            *receive(count),
+            If(received,
+                NextState("POLL_WISHBONE"),
+            ),
+        )
+
+        # Move on to the next word of a burst write
+        next_word = [
+            NextValue(address, address + 4),
+            NextValue(count, count - 1),
+            If(count == 1,
+                NextState("SEND_RESPONSE"),
+            ).Else(
+                NextValue(bytes_left, 3),
+                NextState("READ_VALUE"),
+            ),
+        ]
+
+        fsm.act("READ_VALUE",
+            *receive(value),
+            If(self.rx_overflow,
+                NextValue(failed, 1),
+            ),
+            If(received,
+                If(posted,
+                    NextState("QUEUE_POSTED"),
+                ).Elif(rmw,
+                    NextState("RMW_READ_WISHBONE"),
+                ).Elif(burst,
+                    If(failed,
+                        *next_word,
+                    ).Else(
+                        NextState("WRITE_BURST_WISHBONE"),
+                    ),
+                ).Else(
+                    NextState("WRITE_WISHBONE"),
+                ),
+            ),
+        )
+
+        fsm.act("QUEUE_POSTED",
+            posted_fifo.sink.valid.eq(1),
+            *next_command,
+        )
+
+        # Write one word of a burst.  The next word is received into the
+        # front end's buffer in the meantime, and if that overflows, the
+        # rest of the burst is received and discarded.  After the last
+        # word, any bytes received are padding.
+        fsm.act("WRITE_BURST_WISHBONE",
+            rx.ready.eq(count == 1),
+            self.drive.eq(count == 1),
+            bus.stb.eq(1),
+            bus.we.eq(1),
+            bus.cyc.eq(1),
+            If(self.rx_overflow,
+                NextValue(failed, 1),
+            ),
+            If(bus.ack | bus.err,
+                If(bus.err,
+                    NextValue(failed, 1),
+                ),
+                *next_word,
+            ),
+        )
+
+        # Bytes received while the bus is busy or a response is being sent
+        # are "FF" padding, and are discarded.
+        fsm.act("WRITE_WISHBONE",
+            rx.ready.eq(1),
+            self.drive.eq(1),
+            bus.stb.eq(1),
+            bus.we.eq(1),
+            bus.cyc.eq(1),
+            If(bus.ack | bus.err,
+                NextState("SEND_RESPONSE"),
+            ),
+        )
+
+        # Read-modify-write keeps `cyc` asserted between the read and the
+        # write, so no other master can access the bus in between.  The
+        # write is skipped if the read fails.
+        fsm.act("RMW_READ_WISHBONE",
+            rx.ready.eq(1),
+            self.drive.eq(1),
+            bus.stb.eq(1),
+            bus.we.eq(0),
+            bus.cyc.eq(1),
+            If(bus.ack,
+                NextValue(value, rmw_result),
+                NextState("RMW_WRITE_WISHBONE"),
+            ).Elif(bus.err,
+                NextValue(failed, 1),
+                NextState("SEND_RESPONSE"),
+            ),
+        )
+
+        fsm.act("RMW_WRITE_WISHBONE",
+            rx.ready.eq(1),
+            self.drive.eq(1),
+            bus.stb.eq(1),
+            bus.we.eq(1),
+            bus.cyc.eq(1),
+            If(bus.ack | bus.err,
+                If(bus.err,
+                    NextValue(failed, 1),
+                ),
+                NextState("SEND_RESPONSE"),
+            ),
+        )
+
+        # Read the value, and try again once another byte has been received
+        # if it doesn't match.  This limits polling to one read per byte, so
+        # bytes are left in the front end's buffer while the bus is busy.
+        fsm.act("POLL_WISHBONE",
+            self.drive.eq(1),
+            bus.stb.eq(1),
+            bus.we.eq(0),
+            bus.cyc.eq(1),
+            If(bus.ack | bus.err,
+                NextValue(value, bus.dat_r),
+                If(bus.ack & ((bus.dat_r & mask) == expected),
+                    NextState("SEND_RESPONSE"),
+                ).Elif(bus.err | (count == 1),
+                    NextValue(failed, 1),
+                    NextState("SEND_RESPONSE"),
+                ).Else(
+                    NextValue(count, count - 1),
+                    NextState("POLL_WAIT"),
+                ),
+            ),
+        )
+
+        fsm.act("POLL_WAIT",
+            rx.ready.eq(1),
+            self.drive.eq(1),
+            If(rx.valid,
+                NextState("POLL_WISHBONE"),
+            ),
+        )
+
+        # Wait for all posted writes to finish, then report their status
+        fsm.act("READ_STATUS",
+            rx.ready.eq(1),
+            self.drive.eq(1),
+            If(~posted_fifo.source.valid,
+                status_clear.eq(1),
+                NextValue(value, Cat(posted_error, posted_overflow)),
+                NextState("SEND_RESPONSE"),
+            ),
+        )
+
+        fsm.act("READ_WISHBONE",
+            rx.ready.eq(1),
+            self.drive.eq(1),
+            bus.stb.eq(1),
+            bus.we.eq(0),
+            bus.cyc.eq(1),
+            If(bus.ack | bus.err,
+                NextValue(value, bus.dat_r >> lane),
+                NextState("SEND_RESPONSE"),
+            ),
+        )
+
+        # Wait for the next word of a burst read to arrive
+        fsm.act("WAIT_PREFETCH",
+            rx.ready.eq(1),
+            self.drive.eq(1),
+            *prefetch,
+            If(prefetch_fifo.source.valid,
+                prefetch_fifo.source.ready.eq(1),
+                NextValue(value, prefetch_fifo.source.data),
+                NextValue(failed, prefetch_fifo.source.err),
+                NextState("SEND_RESPONSE"),
+            ),
+        )
+
+        # Send the response byte, which is all there is for a write
+        fsm.act("SEND_RESPONSE",
+            rx.ready.eq(1),
+            self.drive.eq(1),
+            *prefetch,
+            tx.valid.eq(1),
+            tx.data.eq(status),
+            If(tx.ready,
+                If(wr,
+                    *next_command,
+                ).Else(
+                    NextValue(bytes_left, data_bytes - 1),
+                    NextState("SEND_VALUE"),
+                ),
+            ),
+        )
+
+        # Send the value.  Bursts continue with the next word, and end
+        # after a word that failed.
+        fsm.act("SEND_VALUE",
+            rx.ready.eq(1),
+            self.drive.eq(1),
+            *prefetch,
+            tx.valid.eq(1),
+            tx.data.eq(value >> Cat(Replicate(0, 3), bytes_left)),
+            If(tx.ready,
+                NextValue(bytes_left, bytes_left - 1),
+                If(bytes_left == 0,
+                    If(burst & (count != 1) & ~failed,
+                        NextValue(count, count - 1),
+                        NextState("WAIT_PREFETCH"),
+                    ).Else(
+                        *next_command,
+                    ),
+                ),
+            ),
+        )
+
+        # An unknown command ends the transaction, unless the next command
+        # can be found from its sync byte
+        if resync:
+            fsm.act("END",
+                *next_command,
+            )
+        else:
+            fsm.act("END",
+                rx.ready.eq(1),
+                self.drive.eq(1),
+            )
+
+def _check_address(address_bytes, address_base):
+    if address_bytes not in (1, 2, 3, 4):
+        raise ValueError("`address_bytes` must be 1, 2, 3, or 4")
+    address_bits = 8 * address_bytes
+    if address_base & (2**address_bits - 1):
+        raise ValueError("`address_base` must be aligned to the addressable range")
+
 class SpiWishboneBridge(Module, ModuleDoc, AutoDoc):
     """Wishbone Bridge over SPI
 
@@ -119,9 +892,7 @@ class SpiWishboneBridge(Module, ModuleDoc, AutoDoc):
 
     The bridge core is designed to run at 1/4 the system clock.
     """
-    def __init__(self, pads, wires=4, with_tristate=True):
-        self.wishbone = wishbone.Interface()
-
+    def __init__(self, pads, wires=4, with_tristate=True, width=1, address_bytes=4, address_base=0):
         # # #
         self.__doc__ = self.__doc__.format(wires)
         if wires == 4:
@@ -130,25 +901,44 @@ class SpiWishboneBridge(Module, ModuleDoc, AutoDoc):
             self.mod_doc = Spi3WireDocumentation()
         elif wires == 2:
             self.mod_doc = Spi2WireDocumentation()
+        self.burst_doc = SpiBurstDocumentation()
+        self.posted_doc = SpiPostedWriteDocumentation()
+        self.multiple_doc = SpiMultipleCommandDocumentation()
+        self.narrow_doc = SpiNarrowDocumentation()
+        self.rmw_doc = SpiReadModifyWriteDocumentation()
+        self.poll_doc = SpiPollDocumentation()
+        if width not in (1, 2, 4):
+            raise ValueError("`width` must be 1, 2, or 4")
+        if width > 1:
+            if wires == 2:
+                raise ValueError("`width` must be 1 in two-wire mode")
+            self.wide_doc = SpiWideDocumentation()
+        _check_address(address_bytes, address_base)
+        if address_bytes < 4:
+            self.address_doc = SpiAddressDocumentation(address_bytes, address_base)
 
         clk = Signal()
         cs_n = Signal()
         mosi = Signal()
-        miso = Signal()
+        miso = Signal(width)
         miso_en = Signal()
 
-        counter = Signal(8)
-        write_offset = Signal(5)
-        command = Signal(8)
-        address = Signal(32)
-        value   = Signal(32)
-        wr      = Signal()
-        sync_byte = Signal(8)
+        # Data lines.  The first byte after CS is received on `mosi`, and
+        # everything after it is transferred `width` bits at a time.
+        din = Signal(width)
 
         self.specials += [
             MultiReg(pads.clk, clk),
         ]
-        if wires == 2:
+        if width > 1:
+            self.specials += MultiReg(pads.cs_n, cs_n),
+            io = TSTriple(width)
+            self.specials += io.get_tristate(pads.dq)
+            self.specials += MultiReg(io.i, din)
+            self.comb += mosi.eq(din[0])
+            self.comb += io.o.eq(miso)
+            self.comb += io.oe.eq(miso_en)
+        elif wires == 2:
             io = TSTriple()
             self.specials += io.get_tristate(pads.mosi)
             self.specials += MultiReg(io.i, mosi)
@@ -170,6 +960,12 @@ class SpiWishboneBridge(Module, ModuleDoc, AutoDoc):
                 self.comb += pads.miso.eq(miso)
         else:
             raise ValueError("`wires` must be 2, 3, or 4")
+        if width == 1:
+            self.comb += din.eq(mosi)
+
+        self.submodules.core = core = _SpiBridgeCore(address_bytes, address_base, resync=(wires == 2))
+        self.wishbone = core.wishbone
+        self.comb += core.cs_n.eq(cs_n)
 
         clk_last = Signal()
         clk_rising = Signal()
@@ -178,174 +974,251 @@ class SpiWishboneBridge(Module, ModuleDoc, AutoDoc):
         self.comb += clk_rising.eq(clk & ~clk_last)
         self.comb += clk_falling.eq(~clk & clk_last)
 
-        fsm = FSM(reset_state="IDLE")
-        fsm = ResetInserter()(fsm)
-        self.submodules += fsm
-        self.comb += fsm.reset.eq(cs_n)
+        # Count the bits of each byte.  `continued` is set once the first
+        # byte has been received, and from then on the counter advances by
+        # `width` on each clock.
+        counter = Signal(3)
+        continued = Signal()
+        step = Signal(3)
+        self.comb += step.eq(Mux(continued, width, 1))
 
-        # Connect the Wishbone bus up to our values
+        # Received bytes are buffered for the core, which takes them as soon
+        # as it can.  The buffer holds a word, so a burst write can receive
+        # the next word while the previous one is being written.  The host
+        # only sends padding while the bridge is responding, so bytes that
+        # arrive while the data lines are being driven are read as "FF"
+        # rather than as whatever was sent on them.
+        rx_shift = Signal(8)
+        rx_next = Signal(8)
+        rx_done = Signal()
+        aligned = Signal()
+        rx_fifo = stream.SyncFIFO([("data", 8)], 4)
+        rx_fifo = ResetInserter()(rx_fifo)
+        self.submodules += rx_fifo
         self.comb += [
-            self.wishbone.adr.eq(address[2:]),
-            self.wishbone.dat_w.eq(value),
-            self.wishbone.sel.eq(2**len(self.wishbone.sel) - 1)
+            rx_next.eq(Mux(continued, Cat(din, rx_shift), Cat(mosi, rx_shift))),
+            rx_done.eq(clk_rising & (counter + step == 8)),
+            rx_fifo.sink.valid.eq(rx_done & aligned),
+            rx_fifo.sink.data.eq(Mux(miso_en, 0xff, rx_next)),
+            rx_fifo.source.connect(core.sink),
+            core.rx_overflow.eq(rx_fifo.sink.valid & ~rx_fifo.sink.ready),
+        ]
+        self.sync += [
+            If(cs_n,
+                counter.eq(0),
+                continued.eq(0),
+            ).Elif(clk_rising,
+                counter.eq(counter + step),
+                rx_shift.eq(rx_next),
+                If(rx_done,
+                    continued.eq(1),
+                ),
+            ),
         ]
 
-        # Constantly have the counter increase, except when it's reset
-        # in the IDLE state
-        self.sync += If(cs_n, counter.eq(0)).Elif(clk_rising, counter.eq(counter + 1))
-
+        # In two-wire mode there is no CS, so each command is preceded by a
+        # sync byte.  Received bits are ignored until the sync byte has been
+        # seen, and again once the core has finished with the command.
         if wires == 2:
-            fsm.act("IDLE",
-                miso_en.eq(0),
-                NextValue(miso, 1),
-                If(clk_rising,
-                    NextValue(sync_byte, Cat(mosi, sync_byte))
-                ),
-                If(sync_byte[0:7] == 0b101011,
-                    NextState("GET_TYPE_BYTE"),
-                    NextValue(counter, 0),
-                    NextValue(command, mosi),
-                )
-            )
-        elif wires == 3 or wires == 4:
-            fsm.act("IDLE",
-                miso_en.eq(0),
-                NextValue(miso, 1),
-                If(clk_rising,
-                    NextState("GET_TYPE_BYTE"),
-                    NextValue(command, mosi),
+            sync_byte = Signal(8)
+            self.comb += rx_fifo.reset.eq(~aligned | core.done)
+            self.sync += [
+                If(core.done,
+                    aligned.eq(0),
+                    sync_byte.eq(0),
+                ).Elif(clk_rising & ~aligned & ~miso_en,
+                    sync_byte.eq(Cat(mosi, sync_byte)),
+                    If(Cat(mosi, sync_byte)[0:7] == 0b0101011,
+                        aligned.eq(1),
+                        sync_byte.eq(0),
+                        counter.eq(0),
+                    ),
                 ),
-            )
+            ]
         else:
-            raise ValueError("invalid `wires` count: {}".format(wires))
+            self.comb += [
+                aligned.eq(1),
+                rx_fifo.reset.eq(cs_n),
+            ]
 
-        # Determine if it's a read or a write
-        fsm.act("GET_TYPE_BYTE",
-            miso_en.eq(0),
-            NextValue(miso, 1),
-            If(counter == 8,
-                # Write value
-                If(command == 0,
-                    NextValue(wr, 1),
-                    NextState("READ_ADDRESS"),
-
-                # Read value
-                ).Elif(command == 1,
-                    NextValue(wr, 0),
-                    NextState("READ_ADDRESS"),
+        # Send each byte the core offers at the next byte boundary, or "FF"
+        # if there isn't one.  Whether to drive the data lines is also only
+        # decided at byte boundaries.
+        tx_shift = Signal(8, reset=0xff)
+        boundary = Signal()
+        self.comb += [
+            boundary.eq(clk_falling & (counter == 0)),
+            core.source.ready.eq(boundary),
+            miso.eq(tx_shift[8 - width:]),
+        ]
+        self.sync += [
+            If(cs_n,
+                tx_shift.eq(0xff),
+                miso_en.eq(0),
+            ).Elif(boundary,
+                miso_en.eq(core.drive | core.source.valid),
+                If(core.source.valid,
+                    tx_shift.eq(core.source.data),
                 ).Else(
-                    NextState("END"),
+                    tx_shift.eq(0xff),
                 ),
+            ).Elif(clk_falling,
+                tx_shift.eq(Cat(Replicate(1, width), tx_shift)),
             ),
-            If(clk_rising,
-                NextValue(command, Cat(mosi, command)),
-            ),
-        )
+        ]
 
-        fsm.act("READ_ADDRESS",
-            miso_en.eq(0),
-            If(counter == 32 + 8,
-                If(wr,
-                    NextState("READ_VALUE"),
-                ).Else(
-                    NextState("READ_WISHBONE"),
-                )
-            ),
-            If(clk_rising,
-                NextValue(address, Cat(mosi, address)),
-            ),
-        )
+class DirectSpiWishboneBridge(Module, ModuleDoc, AutoDoc):
+    """Wishbone Bridge over SPI, Clocked by SPI
 
-        fsm.act("READ_VALUE",
-            miso_en.eq(0),
-            If(counter == 32 + 32 + 8,
-                NextState("WRITE_WISHBONE"),
-            ),
-            If(clk_rising,
-                NextValue(value, Cat(mosi, value)),
-            ),
-        )
+    This module speaks the same 4-wire protocol as ``SpiWishboneBridge``, but
+    rather than oversampling the SPI signals it clocks its shift registers
+    directly from ``CLK``.  Received bytes are passed to the system clock
+    domain through an asynchronous FIFO, and each response byte is handed
+    back to be shifted out.  This removes the requirement for the system clock
+    to run at 4x the SPI clock, and the SPI clock may be as fast as the system
+    clock.
 
-        fsm.act("WRITE_WISHBONE",
-            self.wishbone.stb.eq(1),
-            self.wishbone.we.eq(1),
-            self.wishbone.cyc.eq(1),
-            miso_en.eq(1),
-            If(self.wishbone.ack | self.wishbone.err,
-                NextState("WAIT_BYTE_BOUNDARY"),
-            ),
-        )
+    Because there are no SPI clock edges between transactions, the bridge uses
+    the system clock to notice the end of a transaction.  ``CS`` must remain
+    high for at least four system clock cycles between transactions.
+    """
+    def __init__(self, pads, with_tristate=True, address_bytes=4, address_base=0):
+        # # #
+        self.mod_doc = Spi4WireDocumentation()
+        self.burst_doc = SpiBurstDocumentation()
+        self.posted_doc = SpiPostedWriteDocumentation()
+        self.multiple_doc = SpiMultipleCommandDocumentation()
+        self.narrow_doc = SpiNarrowDocumentation()
+        self.rmw_doc = SpiReadModifyWriteDocumentation()
+        self.poll_doc = SpiPollDocumentation()
+        _check_address(address_bytes, address_base)
+        if address_bytes < 4:
+            self.address_doc = SpiAddressDocumentation(address_bytes, address_base)
 
-        fsm.act("READ_WISHBONE",
-            self.wishbone.stb.eq(1),
-            self.wishbone.we.eq(0),
-            self.wishbone.cyc.eq(1),
-            miso_en.eq(1),
-            If(self.wishbone.ack | self.wishbone.err,
-                NextState("WAIT_BYTE_BOUNDARY"),
-                NextValue(value, self.wishbone.dat_r),
-            ),
-        )
+        self.clock_domains.cd_spi_rx = ClockDomain("spi_rx", reset_less=True)
+        self.clock_domains.cd_spi_tx = ClockDomain("spi_tx", reset_less=True)
+        self.comb += [
+            self.cd_spi_rx.clk.eq(pads.clk),
+            self.cd_spi_tx.clk.eq(~pads.clk),
+        ]
 
-        fsm.act("WAIT_BYTE_BOUNDARY",
-            miso_en.eq(1),
-            If(clk_falling,
-                If(counter[0:3] == 0,
-                    NextValue(miso, 0),
-                    # For writes, fill in the 0 byte response
-                    If(wr,
-                        NextState("WRITE_WR_RESPONSE"),
-                    ).Else(
-                        NextState("WRITE_RESPONSE"),
-                    ),
-                ),
-            ),
-        )
+        cs_n = Signal()
+        miso = Signal()
+        self.specials += MultiReg(pads.cs_n, cs_n)
+        if with_tristate:
+            self.specials += Tristate(pads.miso, miso, ~pads.cs_n)
+        else:
+            self.comb += pads.miso.eq(miso)
 
-        # Write the "01" byte that indicates a response
-        fsm.act("WRITE_RESPONSE",
-            miso_en.eq(1),
-            If(clk_falling,
-                If(counter[0:3] == 0b111,
-                    NextValue(miso, 1),
-                ).Elif(counter[0:3] == 0,
-                    NextValue(write_offset, 31),
-                    NextState("WRITE_VALUE")
-                ),
+        self.submodules.core = core = _SpiBridgeCore(address_bytes, address_base)
+        self.wishbone = core.wishbone
+        self.comb += core.cs_n.eq(cs_n)
+
+        # Toggled each time CS is released.  The SPI side only sees this
+        # change between transactions, when there are no clock edges, and
+        # uses it to restart its bit counters on the first edge of the next
+        # transaction.
+        frame = Signal()
+        cs_n_last = Signal()
+        self.sync += [
+            cs_n_last.eq(cs_n),
+            If(cs_n & ~cs_n_last,
+                frame.eq(~frame),
             ),
-        )
+        ]
 
-        # Write the actual value
-        fsm.act("WRITE_VALUE",
-            miso_en.eq(1),
-            NextValue(miso, value >> write_offset),
-            If(clk_falling,
-                NextValue(write_offset, write_offset - 1),
-                If(write_offset == 0,
-                    NextValue(miso, 0),
-                    NextState("END"),
+        # Receive bytes on the rising edge of `clk`, and write each one to
+        # the FIFO on the edge that completes it.  If the FIFO is full, the
+        # byte is dropped and `rx_dropped` is toggled.
+        rx_frame = Signal()
+        rx_count = Signal(3)
+        rx_shift = Signal(7)
+        rx_dropped = Signal()
+        rx_fifo = stream.AsyncFIFO([("data", 8)], 16)
+        rx_fifo = ClockDomainsRenamer({"write": "spi_rx", "read": "sys"})(rx_fifo)
+        self.submodules += rx_fifo
+        self.comb += [
+            rx_fifo.sink.valid.eq(~pads.cs_n & (rx_frame == frame) & (rx_count == 7)),
+            rx_fifo.sink.data.eq(Cat(pads.mosi, rx_shift)),
+        ]
+        self.sync.spi_rx += [
+            rx_frame.eq(frame),
+            If(pads.cs_n,
+                rx_count.eq(0),
+            ).Else(
+                rx_shift.eq(Cat(pads.mosi, rx_shift)),
+                If(rx_frame != frame,
+                    rx_count.eq(1),
+                ).Else(
+                    rx_count.eq(rx_count + 1),
                 ),
             ),
-        )
+            If(rx_fifo.sink.valid & ~rx_fifo.sink.ready,
+                rx_dropped.eq(~rx_dropped),
+            ),
+        ]
 
-        fsm.act("WRITE_WR_RESPONSE",
-            miso_en.eq(1),
-            If(clk_falling,
-                If(counter[0:3] == 0,
-                    NextState("END"),
+        # Transmit bytes on the falling edge of `clk`.  The system side
+        # offers one byte at a time by toggling `tx_toggle`, and it is
+        # loaded at the next byte boundary.  If nothing is offered in time,
+        # "FF" is sent instead.
+        tx_frame = Signal()
+        tx_count = Signal(3)
+        tx_shift = Signal(8, reset=0xff)
+        tx_byte = Signal(8)
+        tx_toggle = Signal()
+        tx_toggle_spi = Signal()
+        tx_ack = Signal()
+        self.specials += MultiReg(tx_toggle, tx_toggle_spi, odomain="spi_tx")
+        self.comb += miso.eq(tx_shift[7] | (tx_frame != frame))
+        self.sync.spi_tx += [
+            tx_frame.eq(frame),
+            If(pads.cs_n,
+                tx_count.eq(0),
+                tx_shift.eq(0xff),
+            ).Elif(tx_frame != frame,
+                tx_count.eq(1),
+                tx_shift.eq(0xff),
+            ).Else(
+                tx_count.eq(tx_count + 1),
+                If(tx_count == 7,
+                    If(tx_toggle_spi != tx_ack,
+                        tx_shift.eq(tx_byte),
+                        tx_ack.eq(~tx_ack),
+                    ).Else(
+                        tx_shift.eq(0xff),
+                    ),
+                ).Else(
+                    tx_shift.eq(Cat(1, tx_shift)),
                 ),
             ),
-        )
+        ]
 
-        if wires == 3 or wires == 4:
-            fsm.act("END",
-                miso_en.eq(1),
-            )
-        elif wires == 2:
-            fsm.act("END",
-                miso_en.eq(0),
-                NextValue(sync_byte, 0),
-                NextState("IDLE")
-            )
-        else:
-            raise ValueError("invalid `wires` count: {}".format(wires))
+        # System side of the handshakes.  A byte that has not been sent by
+        # the time CS is released is withdrawn.
+        rx = rx_fifo.source
+        rx_dropped_sys = Signal()
+        rx_dropped_last = Signal()
+        tx_ack_sys = Signal()
+        tx_ready = Signal()
+        self.specials += [
+            MultiReg(rx_dropped, rx_dropped_sys),
+            MultiReg(tx_ack, tx_ack_sys),
+        ]
+        self.comb += [
+            core.sink.valid.eq(rx.valid),
+            core.sink.data.eq(rx.data),
+            rx.ready.eq(core.sink.ready | cs_n),
+            core.rx_overflow.eq(rx_dropped_sys != rx_dropped_last),
+            tx_ready.eq(tx_toggle == tx_ack_sys),
+            core.source.ready.eq(tx_ready),
+        ]
+        self.sync += [
+            rx_dropped_last.eq(rx_dropped_sys),
+            If(cs_n,
+                tx_toggle.eq(tx_ack_sys),
+            ).Elif(core.source.valid & tx_ready,
+                tx_byte.eq(core.source.data),
+                tx_toggle.eq(~tx_toggle),
+            ),
+        ]
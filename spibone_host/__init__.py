@@ -0,0 +1,4 @@
+from .framing import Batch, Op, SpiboneError, ResponseTimeout, ProtocolError, OperationFailed
+from .transport import Transport, ModelTransport
+from .adaptive import AdaptivePoll
+from .client import SpiboneClient
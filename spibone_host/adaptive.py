@@ -0,0 +1,78 @@
+# Poll window sizing from observed response times
+import collections
+
+class AdaptivePoll:
+    """Chooses poll windows from the response times seen in each region
+
+    Addresses are grouped into regions of ``2**region_bits`` bytes.  For each
+    region, the last `history` "FF" counts are kept in a histogram, and the
+    window is the given percentile of them plus `margin`, limited to between
+    `minimum` and `maximum`.  Regions that have not been seen yet use
+    `default`.
+
+    If a response still doesn't arrive in time, and the transport can keep
+    CS low between transfers, the client sends up to `continuations` more
+    transfers of `continuation` "FF" bytes to collect it.  This only works for
+    the last operation in a transfer, since any later ones would have been
+    sent while the device was busy.
+    """
+    def __init__(self, default=8, percentile=99, margin=1, region_bits=16,
+                 minimum=1, maximum=256, history=256, continuation=None, continuations=4):
+        self.default = default
+        self.percentile = percentile
+        self.margin = margin
+        self.region_bits = region_bits
+        self.minimum = minimum
+        self.maximum = maximum
+        self.history = history
+        self.continuation = maximum if continuation is None else continuation
+        self.continuations = continuations
+        self._regions = {}
+
+    def _region(self, address):
+        if address is None:
+            return None
+        return address >> self.region_bits
+
+    def window(self, address):
+        region = self._regions.get(self._region(address))
+        if region is None:
+            return self.default
+        if region.window is None:
+            rank = (len(region.samples) * self.percentile + 99) // 100
+            total = 0
+            for waited, count in enumerate(region.counts):
+                total += count
+                if total >= rank:
+                    break
+            region.window = min(self.maximum, max(self.minimum, waited + self.margin))
+        return region.window
+
+    def record(self, address, waited):
+        """Record that a response came after `waited` "FF" bytes"""
+        key = self._region(address)
+        region = self._regions.get(key)
+        if region is None:
+            region = _Region(self.maximum, self.history)
+            self._regions[key] = region
+        waited = min(waited, self.maximum)
+        if len(region.samples) == self.history:
+            region.counts[region.samples[0]] -= 1
+        region.samples.append(waited)
+        region.counts[waited] += 1
+        region.window = None
+
+    def histogram(self, address):
+        """Return the counts of "FF" bytes seen in the region of `address`"""
+        region = self._regions.get(self._region(address))
+        if region is None:
+            return {}
+        return {waited: count for waited, count in enumerate(region.counts) if count}
+
+class _Region:
+    __slots__ = ("samples", "counts", "window")
+
+    def __init__(self, maximum, history):
+        self.samples = collections.deque(maxlen=history)
+        self.counts = [0] * (maximum + 1)
+        self.window = None
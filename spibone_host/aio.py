@@ -0,0 +1,85 @@
+# asyncio wrapper around SpiboneClient
+import asyncio
+import concurrent.futures
+
+class AsyncSpiboneClient:
+    """Pipelines operations from asyncio code
+
+    Each method queues an operation and returns a future for its result.
+    Everything queued during one pass of the event loop is sent as a single
+    batch.  Transfers run on a thread of their own, so each link (and each
+    board) proceeds independently of the others.  If an operation fails, it
+    and every operation queued after it in the same batch fail with the same
+    exception, while the ones before it still get their results.
+    """
+    def __init__(self, client, loop=None):
+        self.client = client
+        self.loop = loop
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._batch = None
+        self._futures = []
+
+    def _queue(self, method, *args):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        if self._batch is None:
+            self._batch = self.client.batch()
+            self.loop.call_soon(self._flush)
+        getattr(self._batch, method)(*args)
+        future = self.loop.create_future()
+        self._futures.append(future)
+        return future
+
+    def _flush(self):
+        batch, futures = self._batch, self._futures
+        if batch is None:
+            return
+        self._batch = None
+        self._futures = []
+        transfer = self.loop.run_in_executor(self.executor, self.client.execute, batch)
+        transfer.add_done_callback(lambda t: self._resolve(t, futures))
+
+    def _resolve(self, transfer, futures):
+        error = transfer.exception()
+        if error is None:
+            results = transfer.result()
+        else:
+            # Operations before the one that failed still completed
+            results = getattr(error, "results", [])
+        for index, future in enumerate(futures):
+            if future.cancelled():
+                continue
+            if index < len(results):
+                future.set_result(results[index])
+            else:
+                future.set_exception(error)
+
+    def read(self, address):
+        return self._queue("read", address)
+
+    def write(self, address, value):
+        return self._queue("write", address, value)
+
+    def read8(self, address):
+        return self._queue("read8", address)
+
+    def write8(self, address, value):
+        return self._queue("write8", address, value)
+
+    def read16(self, address):
+        return self._queue("read16", address)
+
+    def write16(self, address, value):
+        return self._queue("write16", address, value)
+
+    def burst_read(self, address, count):
+        return self._queue("burst_read", address, count)
+
+    def burst_write(self, address, values):
+        return self._queue("burst_write", address, values)
+
+    def close(self):
+        """Send anything still queued, wait for it, and close the client"""
+        self._flush()
+        self.executor.shutdown()
+        self.client.close()
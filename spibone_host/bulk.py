@@ -0,0 +1,211 @@
+# Bulk upload and download of memory over spibone
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+
+from .client import SpiboneClient
+from .framing import SpiboneError
+
+class TransferFailed(SpiboneError):
+    """A bulk transfer gave up after too many errors
+
+    `offset` is the number of bytes that were acknowledged, which can be
+    passed back in as `offset` to resume the transfer.
+    """
+    def __init__(self, offset, error):
+        SpiboneError.__init__(self, "transfer failed at offset 0x{:x}: {}".format(offset, error))
+        self.offset = offset
+        self.error = error
+
+class TransferStats:
+    """How much was transferred, and how long it took"""
+    def __init__(self):
+        self.bytes = 0
+        self.seconds = 0.0
+        self.retries = 0
+
+    @property
+    def rate(self):
+        """Throughput in MB/s"""
+        if self.seconds == 0:
+            return 0.0
+        return self.bytes / self.seconds / 1e6
+
+class BulkTransfer:
+    """Moves files to and from a range of Wishbone memory
+
+    Memory is accessed with the largest bursts that fit in a single
+    transfer of the client's transport.  Words are stored little-endian,
+    which matches how the CPU sees them.  After a link error, the chunk
+    that failed is sent again, up to `retries` times in a row.
+
+    `progress`, if given, is called with `(offset, total)` after each chunk.
+    """
+    def __init__(self, client, retries=3, progress=None):
+        self.client = client
+        self.retries = retries
+        self.progress = progress
+
+    def _words(self, address, remaining, per_word):
+        """Number of words to move in a burst starting at `address`"""
+        words = min(remaining, 65536)
+        limit = self.client.transport.max_transfer
+        if limit is None:
+            return words
+
+        # A burst of one word, plus `per_word` bytes for each additional word
+        batch = self.client.batch()
+        if per_word == 4:
+            batch.burst_write(address, [0])
+        else:
+            batch.burst_read(address, 1)
+        first = len(batch.encode())
+        if first > limit:
+            raise ValueError("a single word does not fit in a {} byte transfer".format(limit))
+        return min(words, (limit - first) // per_word + 1)
+
+    def _run(self, stats, offset, total, step):
+        """Call `step(offset)` until `total` bytes are done, retrying errors"""
+        failures = 0
+        start = time.perf_counter()
+        try:
+            while offset < total:
+                try:
+                    done = step(offset)
+                except (SpiboneError, OSError) as e:
+                    failures += 1
+                    stats.retries += 1
+                    if failures > self.retries:
+                        raise TransferFailed(offset, e)
+                    # Release CS so that the bridge starts over
+                    self.client.transport.release()
+                    continue
+                failures = 0
+                offset += done
+                stats.bytes += done
+                if self.progress is not None:
+                    self.progress(offset, total)
+        finally:
+            stats.seconds += time.perf_counter() - start
+        return stats
+
+    def upload(self, address, path, offset=0, verify=False):
+        """Write the contents of the file at `path` to memory at `address`
+
+        With `verify`, each burst is read back and compared.  Returns a
+        `TransferStats`.
+        """
+        if address & 3 or offset & 3:
+            raise ValueError("`address` and `offset` must be word aligned")
+        stats = TransferStats()
+        with open(path, "rb") as f:
+            total = os.fstat(f.fileno()).st_size
+            if total == 0:
+                return stats
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                def step(offset):
+                    base = address + offset
+                    if total - offset < 4:
+                        # Trailing bytes are written one at a time
+                        batch = self.client.batch()
+                        for i in range(total - offset):
+                            batch.write8(base + i, data[offset + i])
+                        if verify:
+                            index = batch.read(base)
+                        results = self.client.execute(batch)
+                        if verify:
+                            expected = data[offset:total]
+                            actual = results[index].to_bytes(4, "little")[:len(expected)]
+                            if actual != expected:
+                                raise SpiboneError("verify failed at 0x{:08x}".format(base))
+                        return total - offset
+
+                    count = self._words(base, (total - offset) // 4, 4)
+                    if verify:
+                        # Reading back takes a response byte per word too
+                        count = min(count, self._words(base, count, 5))
+                    values = struct.unpack_from("<{}I".format(count), data, offset)
+                    self.client.burst_write(base, values)
+                    if verify:
+                        actual = self.client.burst_read(base, count)
+                        if tuple(actual) != values:
+                            bad = next(i for i in range(count) if actual[i] != values[i])
+                            raise SpiboneError("verify failed at 0x{:08x}".format(base + 4 * bad))
+                    return 4 * count
+                return self._run(stats, offset, total, step)
+
+    def download(self, address, length, path, offset=0):
+        """Read `length` bytes of memory at `address` into the file at `path`
+
+        When resuming with a nonzero `offset`, the start of an existing file
+        is kept.  Returns a `TransferStats`.
+        """
+        if address & 3 or offset & 3:
+            raise ValueError("`address` and `offset` must be word aligned")
+        stats = TransferStats()
+        if length == 0:
+            open(path, "wb").close()
+            return stats
+        with open(path, "r+b" if offset and os.path.exists(path) else "w+b") as f:
+            f.truncate(length)
+            with mmap.mmap(f.fileno(), length) as data:
+                def step(offset):
+                    base = address + offset
+                    count = self._words(base, (length - offset + 3) // 4, 5)
+                    values = self.client.burst_read(base, count)
+                    chunk = struct.pack("<{}I".format(count), *values)
+                    done = min(4 * count, length - offset)
+                    data[offset:offset + done] = chunk[:done]
+                    return done
+                self._run(stats, offset, length, step)
+                data.flush()
+        return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy files to and from memory over spibone")
+    parser.add_argument("direction", choices=["upload", "download"], help="direction to copy")
+    parser.add_argument("file", help="file to read from or write to")
+    parser.add_argument("--address", default="0x40000000", help="Wishbone byte address (default: main_ram)")
+    parser.add_argument("--length", default=None, help="bytes to download")
+    parser.add_argument("--offset", default="0", help="offset to resume from")
+    parser.add_argument("--verify", action="store_true", help="read back each burst after uploading it")
+    parser.add_argument("--retries", default=3, type=int, help="attempts per chunk after a link error")
+    parser.add_argument("--spidev", default="/dev/spidev0.0", help="spidev device to use")
+    parser.add_argument("--speed-hz", default=1000000, type=int, help="SPI clock speed")
+    parser.add_argument("--poll", default=None, type=int, help="poll bytes per response (default: cover 2 us)")
+    parser.add_argument("--address-bytes", default=4, type=int, choices=[1, 2, 3, 4],
+                        help="address bytes the bridge was built with")
+    args = parser.parse_args()
+
+    if args.direction == "download" and args.length is None:
+        parser.error("--length is required for downloads")
+
+    from .spidev import SpidevTransport
+    transport = SpidevTransport(args.spidev, speed_hz=args.speed_hz)
+    poll = transport.poll_bytes(2e-6) if args.poll is None else args.poll
+    client = SpiboneClient(transport, poll=poll, address_bytes=args.address_bytes)
+
+    def progress(offset, total):
+        sys.stderr.write("\r{:>10} / {} bytes".format(offset, total))
+    bulk = BulkTransfer(client, retries=args.retries, progress=progress)
+    address = int(args.address, 0)
+    offset = int(args.offset, 0)
+    try:
+        if args.direction == "upload":
+            stats = bulk.upload(address, args.file, offset, args.verify)
+        else:
+            stats = bulk.download(address, int(args.length, 0), args.file, offset)
+    except TransferFailed as e:
+        sys.stderr.write("\n{}\nresume with --offset 0x{:x}\n".format(e, e.offset))
+        sys.exit(1)
+    finally:
+        client.close()
+    sys.stderr.write("\n{} {} bytes in {:.2f} s ({:.3f} MB/s, {} retries)\n".format(
+        "Uploaded" if args.direction == "upload" else "Downloaded",
+        stats.bytes, stats.seconds, stats.rate, stats.retries))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# Host-side cache of register values
+import bisect
+import collections
+import csv
+import fnmatch
+
+from .framing import CMD_READ, CMD_BURST_READ, CMD_BURST_WRITE
+
+# Registers that never change, such as identifiers and build options.
+# Reads are cached, and writing drops the cached value.
+CACHEABLE = "cacheable"
+
+# Registers that only the host changes.  Reads are cached, and writes go
+# straight to the device and update the cached value.
+WRITE_THROUGH = "write-through"
+
+# Registers that the hardware changes.  These are never cached.
+VOLATILE = "volatile"
+
+class CachedClient:
+    """Wraps a `SpiboneClient` and caches reads of registers that allow it
+
+    Addresses are volatile unless they fall in a region declared with
+    `add_region()` or `load_csr_csv()`.  Only 32-bit reads are answered from
+    the cache.  Other operations always go to the device, and anything that
+    writes to a cached word drops it.  At most `capacity` words are kept,
+    and the least recently used word is evicted first.
+
+    `hits`, `misses`, and `evictions` count what the cache did.
+    """
+    def __init__(self, client, capacity=1024):
+        self.client = client
+        self.capacity = capacity
+        self._starts = []
+        self._regions = []
+        self._values = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def add_region(self, address, length, policy):
+        """Apply `policy` to the `length` bytes starting at `address`"""
+        if policy not in (CACHEABLE, WRITE_THROUGH, VOLATILE):
+            raise ValueError("unknown cache policy {!r}".format(policy))
+        index = bisect.bisect(self._starts, address)
+        if index and self._regions[index - 1][1] > address:
+            raise ValueError("region at 0x{:08x} overlaps another region".format(address))
+        if index < len(self._starts) and self._starts[index] < address + length:
+            raise ValueError("region at 0x{:08x} overlaps another region".format(address))
+        self._starts.insert(index, address)
+        self._regions.insert(index, (address, address + length, policy))
+        self.flush()
+
+    def load_csr_csv(self, path, policies):
+        """Declare regions for the CSRs listed in a LiteX `csr.csv`
+
+        `policies` maps names to policies.  Names may contain shell-style
+        wildcards, and are matched against both registers (such as
+        ``ctrl_scratch``) and whole peripherals (such as ``ctrl``).  The first
+        pattern that matches is used.  Registers that don't match anything
+        are left volatile.
+        """
+        registers = []
+        bases = []
+        with open(path, newline='') as csr_csv_file:
+            csr_csv = csv.reader(csr_csv_file)
+            # csr_register format: csr_register, name, address, size, rw/ro
+            for row in csr_csv:
+                if row[0] == 'csr_register':
+                    registers.append((row[1], int(row[2], base=0), int(row[3], base=0)))
+                elif row[0] == 'csr_base':
+                    bases.append((row[1], int(row[2], base=0)))
+
+        def policy_for(name):
+            for pattern, policy in policies.items():
+                if fnmatch.fnmatchcase(name, pattern):
+                    return policy
+            return None
+
+        for name, address, size in registers:
+            policy = policy_for(name)
+            if policy is None:
+                # Fall back to the peripheral the register belongs to
+                owners = [base for base in bases if name.startswith(base[0] + "_") and base[1] <= address]
+                if owners:
+                    policy = policy_for(max(owners, key=lambda base: base[1])[0])
+            if policy is not None and policy != VOLATILE:
+                self.add_region(address, 4 * size, policy)
+
+    def policy(self, address):
+        index = bisect.bisect(self._starts, address) - 1
+        if index >= 0:
+            start, end, policy = self._regions[index]
+            if address < end:
+                return policy
+        return VOLATILE
+
+    def flush(self, address=None):
+        """Forget the cached value of `address`, or of everything"""
+        if address is None:
+            self._values.clear()
+        else:
+            self._values.pop(address & ~3, None)
+
+    def _store(self, address, value):
+        self._values[address] = value
+        self._values.move_to_end(address)
+        if len(self._values) > self.capacity:
+            self._values.popitem(last=False)
+            self.evictions += 1
+
+    def _drop(self, address, words=1):
+        start = address & ~3
+        end = start + 4 * words
+        if words == 1:
+            self._values.pop(start, None)
+        elif self._values:
+            for cached in [a for a in self._values if start <= a < end]:
+                del self._values[cached]
+
+    def _fill(self, address, values):
+        for i, value in enumerate(values):
+            if self.policy(address + 4 * i) != VOLATILE:
+                self._store(address + 4 * i, value)
+
+    def _written(self, batch, op):
+        """Return the number of words that `op` writes"""
+        # Everything with an address that doesn't return a value writes
+        if op.address is None or (op.value_bytes and op.replies):
+            return 0
+        if op.command == CMD_BURST_WRITE:
+            body = 1 + batch.address_bytes
+            return int.from_bytes(op.payload[body:body + 2], "big") or 65536
+        return 1
+
+    def read(self, address):
+        word = address & ~3
+        if word in self._values:
+            self.hits += 1
+            self._values.move_to_end(word)
+            return self._values[word]
+        cached = self.policy(word) != VOLATILE
+        if cached:
+            self.misses += 1
+        value = self.client.read(address)
+        if cached:
+            self._store(word, value)
+        return value
+
+    def write(self, address, value):
+        try:
+            self.client.write(address, value)
+        finally:
+            self._drop(address)
+        if self.policy(address & ~3) == WRITE_THROUGH:
+            self._store(address & ~3, value)
+
+    def read8(self, address):
+        return self.client.read8(address)
+
+    def write8(self, address, value):
+        try:
+            self.client.write8(address, value)
+        finally:
+            self._drop(address)
+
+    def read16(self, address):
+        return self.client.read16(address)
+
+    def write16(self, address, value):
+        try:
+            self.client.write16(address, value)
+        finally:
+            self._drop(address)
+
+    def burst_read(self, address, count):
+        values = self.client.burst_read(address, count)
+        self._fill(address & ~3, values)
+        return values
+
+    def burst_write(self, address, values):
+        try:
+            self.client.burst_write(address, values)
+        finally:
+            self._drop(address, len(values))
+
+    def batch(self):
+        return self.client.batch()
+
+    def execute(self, batch):
+        """Send `batch`, then update the cache from it
+
+        Reads in a batch always go to the device, so a batch can be used to
+        refresh the cache.
+        """
+        try:
+            results = self.client.execute(batch)
+        except BaseException:
+            for op in batch.ops:
+                words = self._written(batch, op)
+                if words:
+                    self._drop(op.address, words)
+            raise
+        # In order, so that a word that is read and then written in the
+        # same batch isn't left with the value that was read
+        for op, result in zip(batch.ops, results):
+            words = self._written(batch, op)
+            if words:
+                self._drop(op.address, words)
+            elif op.command == CMD_READ:
+                self._fill(op.address & ~3, [result])
+            elif op.command == CMD_BURST_READ:
+                self._fill(op.address & ~3, result)
+        return results
+
+    def close(self):
+        self.client.close()
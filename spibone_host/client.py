@@ -0,0 +1,123 @@
+# Blocking spibone client
+import time
+
+from .framing import Batch, SpiboneError, ResponseTimeout, CMD_POLL
+
+class SpiboneClient:
+    """Runs batches of operations over a transport
+
+    The convenience methods each run a single operation.  To combine many
+    operations into one transfer, fill in a `batch()` and pass it to
+    `execute()`.
+
+    `poll` may be an `AdaptivePoll`, in which case the response times of
+    every operation are fed back into it.  If `trace` is a `TraceRecorder`,
+    every operation is recorded in it.
+    """
+    def __init__(self, transport, poll=8, wires=4, address_bytes=4, trace=None):
+        self.transport = transport
+        self.poll = poll
+        self.trace = trace
+        self.wires = wires
+        self.address_bytes = address_bytes
+
+    def batch(self):
+        return Batch(self.poll, self.wires, self.address_bytes)
+
+    def execute(self, batch):
+        """Send `batch`, and return the result of each operation
+
+        If an operation fails, the exception's `results` attribute holds the
+        results of the operations before it.
+        """
+        if self.transport.max_transfer is None:
+            batches = [batch]
+        else:
+            batches = batch.split(self.transport.max_transfer)
+
+        # Leave CS low after the last frame, so a late response to its last
+        # operation can still be collected.  CS is raised again once this
+        # batch is done with, however it ends.
+        continuations = getattr(self.poll, "continuations", 0)
+        if not self.transport.can_continue:
+            continuations = 0
+        held = bool(continuations)
+        started = time.perf_counter_ns()
+        received = self.transport.xfer_many([b.encode() for b in batches], held)
+
+        results = []
+        decoded = []
+        failed = None
+        partial = []
+        try:
+            for b, data in zip(batches, received):
+                while True:
+                    try:
+                        decoded.append(b.decode(data))
+                        results += decoded[-1]
+                        break
+                    except ResponseTimeout as e:
+                        if b is not batches[-1] or e.index != len(b) - 1 or continuations == 0:
+                            # It took at least this long
+                            if self._adaptive(e.op):
+                                self.poll.record(e.op.address, e.op.poll)
+                            raise
+                        continuations -= 1
+                        e.op.poll += self.poll.continuation
+                        data += self.transport.xfer(b"\xff" * self.poll.continuation, keep_selected=True)
+        except SpiboneError as e:
+            # Errors without an index are blamed on the whole frame
+            failed = getattr(e, "index", len(batches[len(decoded)]) - 1)
+            partial = getattr(e, "results", [])
+            e.results = results + partial
+            raise
+        finally:
+            if held:
+                self.transport.release()
+            for b in batches:
+                for op in b.ops:
+                    if op.waited is not None and self._adaptive(op):
+                        self.poll.record(op.address, op.waited)
+            if self.trace is not None:
+                latency = time.perf_counter_ns() - started
+                for b, values in zip(batches, decoded):
+                    self.trace.record_batch(b, values, started, latency)
+                if failed is not None:
+                    self.trace.record_batch(batches[len(decoded)], partial, started, latency, failed)
+        return results
+
+    def _adaptive(self, op):
+        # Polls wait on purpose, so they say nothing about the bus
+        return not isinstance(self.poll, int) and op.command != CMD_POLL
+
+    def _run(self, method, *args):
+        batch = self.batch()
+        getattr(batch, method)(*args)
+        return self.execute(batch)[0]
+
+    def read(self, address):
+        return self._run("read", address)
+
+    def write(self, address, value):
+        self._run("write", address, value)
+
+    def read8(self, address):
+        return self._run("read8", address)
+
+    def write8(self, address, value):
+        self._run("write8", address, value)
+
+    def read16(self, address):
+        return self._run("read16", address)
+
+    def write16(self, address, value):
+        self._run("write16", address, value)
+
+    def burst_read(self, address, count):
+        return self._run("burst_read", address, count)
+
+    def burst_write(self, address, values):
+        self._run("burst_write", address, values)
+
+    def close(self):
+        self.transport.close()
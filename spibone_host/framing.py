@@ -0,0 +1,253 @@
+# Encoding and decoding of spibone transactions
+import struct
+
+CMD_WRITE        = 0x00
+CMD_READ         = 0x01
+CMD_BURST_WRITE  = 0x02
+CMD_BURST_READ   = 0x03
+CMD_POSTED_WRITE = 0x04
+CMD_STATUS       = 0x05
+CMD_WRITE8       = 0x06
+CMD_READ8        = 0x07
+CMD_WRITE16      = 0x08
+CMD_READ16       = 0x09
+CMD_RMW_SET      = 0x0a
+CMD_POLL         = 0x0b
+CMD_RMW_CLEAR    = 0x0c
+CMD_RMW_TOGGLE   = 0x0e
+CMD_NOP          = 0xff
+
+# Sent before every command in two-wire mode
+SYNC_BYTE = 0xab
+
+class SpiboneError(Exception):
+    """Base class for errors reported by the host library"""
+
+class ResponseTimeout(SpiboneError):
+    """The device did not respond within the poll window
+
+    Any operations after `index` in the same frame were sent while the device
+    was busy, and may not have been performed.
+    """
+    def __init__(self, index, op):
+        SpiboneError.__init__(self, "no response to {} within {} poll bytes".format(op, op.poll))
+        self.index = index
+        self.op = op
+
+class ProtocolError(SpiboneError):
+    """The response byte did not match the command"""
+
+class OperationFailed(SpiboneError):
+    """The device reported that the operation failed
+
+    `value` holds whatever data came with the response, such as the last
+    value read by a poll.
+    """
+    def __init__(self, index, op, value=None):
+        SpiboneError.__init__(self, "{} failed".format(op))
+        self.index = index
+        self.op = op
+        self.value = value
+
+class Op:
+    """A single spibone operation
+
+    `payload` is everything the host sends, starting with the command byte.
+    The response is `replies` repetitions of the command byte followed by
+    `value_bytes` bytes, each preceded by any number of "FF" bytes up to a
+    total of `poll` for the operation.  Once decoded, `waited` is the
+    number of "FF" bytes that came before the first response.
+    """
+    __slots__ = ("command", "address", "payload", "replies", "value_bytes", "poll", "waited")
+
+    def __init__(self, command, address, payload, replies, value_bytes, poll):
+        self.command = command
+        self.address = address
+        self.payload = payload
+        self.replies = replies
+        self.value_bytes = value_bytes
+        self.poll = poll
+        self.waited = None
+
+    def __repr__(self):
+        return "<Op 0x{:02x} @ 0x{:08x}>".format(self.command, self.address or 0)
+
+    @property
+    def window(self):
+        """Number of bytes to clock after the payload to collect the response"""
+        if self.replies == 0:
+            return 0
+        return self.poll + self.replies * (1 + self.value_bytes)
+
+class Batch:
+    """Collects operations to be sent in a single transaction
+
+    Each method adds one operation and returns its index, which can be used
+    to find its result in the list returned by `decode()`.  `poll` is the
+    default number of "FF" bytes to allow for each response, or an object
+    such as `AdaptivePoll` whose `window(address)` method chooses it.
+    """
+    def __init__(self, poll=8, wires=4, address_bytes=4):
+        if address_bytes not in (1, 2, 3, 4):
+            raise ValueError("`address_bytes` must be 1, 2, 3, or 4")
+        self.poll = poll
+        self.wires = wires
+        self.address_bytes = address_bytes
+        self.ops = []
+
+    def __len__(self):
+        return len(self.ops)
+
+    def _address(self, address):
+        return (address & (2**(8 * self.address_bytes) - 1)).to_bytes(self.address_bytes, "big")
+
+    def _add(self, command, address, body, replies, value_bytes, poll=None):
+        payload = bytes([command])
+        if address is not None:
+            payload += self._address(address)
+        payload += body
+        if poll is None:
+            poll = self._poll(address)
+        self.ops.append(Op(command, address, payload, replies, value_bytes, poll))
+        return len(self.ops) - 1
+
+    def _poll(self, address):
+        if isinstance(self.poll, int):
+            return self.poll
+        return self.poll.window(address)
+
+    def write(self, address, value, poll=None):
+        return self._add(CMD_WRITE, address, struct.pack(">I", value), 1, 0, poll)
+
+    def read(self, address, poll=None):
+        return self._add(CMD_READ, address, b"", 1, 4, poll)
+
+    def write8(self, address, value, poll=None):
+        return self._add(CMD_WRITE8, address, struct.pack(">B", value), 1, 0, poll)
+
+    def read8(self, address, poll=None):
+        return self._add(CMD_READ8, address, b"", 1, 1, poll)
+
+    def write16(self, address, value, poll=None):
+        return self._add(CMD_WRITE16, address, struct.pack(">H", value), 1, 0, poll)
+
+    def read16(self, address, poll=None):
+        return self._add(CMD_READ16, address, b"", 1, 2, poll)
+
+    def burst_write(self, address, values, poll=None):
+        if not 0 < len(values) <= 65536:
+            raise ValueError("bursts must be 1 to 65536 words long")
+        body = struct.pack(">H", len(values) & 0xffff)
+        body += struct.pack(">{}I".format(len(values)), *values)
+        return self._add(CMD_BURST_WRITE, address, body, 1, 0, poll)
+
+    def burst_read(self, address, count, poll=None):
+        if not 0 < count <= 65536:
+            raise ValueError("bursts must be 1 to 65536 words long")
+        return self._add(CMD_BURST_READ, address, struct.pack(">H", count & 0xffff), count, 4, poll)
+
+    def posted_write(self, address, value):
+        return self._add(CMD_POSTED_WRITE, address, struct.pack(">I", value), 0, 0, 0)
+
+    def status(self, poll=None):
+        return self._add(CMD_STATUS, None, b"", 1, 4, poll)
+
+    def rmw_set(self, address, mask, poll=None):
+        return self._add(CMD_RMW_SET, address, struct.pack(">I", mask), 1, 0, poll)
+
+    def rmw_clear(self, address, mask, poll=None):
+        return self._add(CMD_RMW_CLEAR, address, struct.pack(">I", mask), 1, 0, poll)
+
+    def rmw_toggle(self, address, mask, poll=None):
+        return self._add(CMD_RMW_TOGGLE, address, struct.pack(">I", mask), 1, 0, poll)
+
+    def poll_until(self, address, mask, expected, attempts, poll=None):
+        """Wait until `(value & mask) == expected`, for up to `attempts` reads
+
+        The poll window is extended by one byte per attempt.
+        """
+        if not 0 < attempts <= 65536:
+            raise ValueError("`attempts` must be 1 to 65536")
+        body = struct.pack(">IIH", mask, expected, attempts & 0xffff)
+        return self._add(CMD_POLL, address, body, 1, 4, (self._poll(address) if poll is None else poll) + attempts)
+
+    def _length(self, op):
+        return (self.wires == 2) + len(op.payload) + op.window
+
+    def split(self, limit):
+        """Split into batches that each encode to no more than `limit` bytes
+
+        A single operation that is longer than `limit` gets a batch of its own.
+        """
+        batches = []
+        current = None
+        size = 0
+        for op in self.ops:
+            length = self._length(op)
+            if current is None or size + length > limit:
+                current = Batch(self.poll, self.wires, self.address_bytes)
+                batches.append(current)
+                size = 0
+            current.ops.append(op)
+            size += length
+        return batches
+
+    def encode(self):
+        """Return the bytes to send for the whole batch"""
+        out = bytearray()
+        for op in self.ops:
+            if self.wires == 2:
+                out.append(SYNC_BYTE)
+            out += op.payload
+            out += b"\xff" * op.window
+        return bytes(out)
+
+    def decode(self, data):
+        """Decode the bytes received while sending `encode()`
+
+        Returns a list with one entry per operation: the value read, a list
+        of values for burst reads, or None for operations without a value.
+        If decoding stops with an error, its `results` attribute holds the
+        results of the operations before the one that failed.
+        """
+        results = []
+        offset = 0
+        try:
+            for index, op in enumerate(self.ops):
+                if self.wires == 2:
+                    offset += 1
+                offset += len(op.payload)
+                end = offset + op.window
+                values = []
+                failed = False
+                pos = offset
+                for reply in range(op.replies):
+                    while pos < end and data[pos] == 0xff:
+                        pos += 1
+                    if pos + 1 + op.value_bytes > end:
+                        raise ResponseTimeout(index, op)
+                    if reply == 0:
+                        op.waited = pos - offset
+                    if data[pos] & 0x7f != op.command:
+                        raise ProtocolError("{}: unexpected response 0x{:02x}".format(op, data[pos]))
+                    failed |= bool(data[pos] & 0x80)
+                    values.append(int.from_bytes(data[pos + 1:pos + 1 + op.value_bytes], "big"))
+                    pos += 1 + op.value_bytes
+                    # A burst ends at the first word that fails
+                    if failed:
+                        break
+                offset = end
+
+                if op.value_bytes == 0:
+                    value = None
+                elif op.command == CMD_BURST_READ:
+                    value = values
+                else:
+                    value = values[0]
+                if failed:
+                    raise OperationFailed(index, op, value)
+                results.append(value)
+        except SpiboneError as e:
+            e.results = results
+            raise
+        return results
@@ -0,0 +1,167 @@
+# Vectorized encoding and decoding of spibone frames, using NumPy
+import numpy as np
+
+from .framing import CMD_WRITE, CMD_READ, CMD_BURST_WRITE, CMD_BURST_READ, SYNC_BYTE
+from .framing import Op, ResponseTimeout, ProtocolError, OperationFailed
+
+class Frame:
+    """An encoded frame of single reads and writes
+
+    Every operation takes up `stride` bytes of `data`, so both the frame and
+    the bytes received for it can be viewed as one row per operation.  The
+    response window of each operation starts `starts` bytes into its row.
+    """
+    def __init__(self, data, stride, starts, commands, addresses, poll):
+        self.data = data
+        self.stride = stride
+        self.starts = starts
+        self.commands = commands
+        self.addresses = addresses
+        self.poll = poll
+
+def _op(frame, index):
+    command = int(frame.commands[index])
+    return Op(command, int(frame.addresses[index]), b"", 1, 4 if command == CMD_READ else 0, frame.poll)
+
+def _big_endian(values, nbytes):
+    """View the low `nbytes` bytes of each value as big-endian bytes"""
+    return np.asarray(values, dtype=">u4").view(np.uint8).reshape(-1, 4)[:, 4 - nbytes:]
+
+def encode(commands, addresses, values=None, poll=8, wires=4, address_bytes=4):
+    """Encode arrays of `CMD_READ` and `CMD_WRITE` operations into a Frame
+
+    `values` is only used for writes.
+    """
+    commands = np.asarray(commands, dtype=np.uint8)
+    addresses = np.asarray(addresses, dtype=np.uint32)
+    if not np.all((commands == CMD_READ) | (commands == CMD_WRITE)):
+        raise ValueError("only reads and writes can be encoded")
+    writes = commands == CMD_WRITE
+    prefix = 1 if wires == 2 else 0
+
+    # Writes send four more bytes and reads receive four more bytes, so
+    # both take the same amount of space.
+    header = prefix + 1 + address_bytes
+    stride = header + 4 + poll + 1
+    rows = np.full((len(commands), stride), 0xff, dtype=np.uint8)
+    if prefix:
+        rows[:, 0] = SYNC_BYTE
+    rows[:, prefix] = commands
+    rows[:, prefix + 1:header] = _big_endian(addresses, address_bytes)
+    if values is not None and writes.any():
+        rows[writes, header:header + 4] = _big_endian(np.asarray(values)[writes], 4)
+    starts = np.where(writes, header + 4, header)
+    return Frame(rows.reshape(-1), stride, starts, commands, addresses, poll)
+
+def decode(frame, rx):
+    """Decode the bytes received while sending `frame.data`
+
+    Returns a uint32 array with the value of each read, and 0 for writes.
+    """
+    rows = np.frombuffer(rx, dtype=np.uint8).reshape(-1, frame.stride)
+    count = len(rows)
+    result = np.zeros(count, dtype=np.uint32)
+
+    # Reads and writes have their windows in different places, so each kind
+    # is searched separately for the first byte that isn't "FF".
+    for command in (CMD_READ, CMD_WRITE):
+        selected = frame.commands == command
+        if not selected.any():
+            continue
+        start = int(frame.starts[np.argmax(selected)])
+        group = rows if selected.all() else rows[selected]
+        window = group[:, start:start + frame.poll + 1] != 0xff
+        positions = np.argmax(window, axis=1)
+        late = ~window[np.arange(len(group)), positions]
+        markers = group[np.arange(len(group)), start + positions]
+        failed = late | (markers != command)
+        if failed.any():
+            which = int(np.argmax(failed))
+            index = int(np.flatnonzero(selected)[which])
+            if late[which]:
+                raise ResponseTimeout(index, _op(frame, index))
+            if markers[which] == command | 0x80:
+                raise OperationFailed(index, _op(frame, index))
+            raise ProtocolError("{}: unexpected response 0x{:02x}".format(_op(frame, index), markers[which]))
+        if command == CMD_READ:
+            words = group[np.arange(len(group))[:, None], (start + 1 + positions)[:, None] + np.arange(4)]
+            result[selected] = words.view(">u4").reshape(-1)
+    return result
+
+def _burst_header(command, address, count, wires, address_bytes):
+    if not 0 < count <= 65536:
+        raise ValueError("bursts must be 1 to 65536 words long")
+    prefix = [SYNC_BYTE] if wires == 2 else []
+    return np.concatenate([
+        prefix,
+        [command],
+        _big_endian([address], address_bytes)[0],
+        _big_endian([count & 0xffff], 2)[0],
+    ]).astype(np.uint8)
+
+def encode_burst_write(address, words, poll=8, wires=4, address_bytes=4):
+    """Encode a burst write of up to 65536 words"""
+    words = np.asarray(words, dtype=">u4")
+    header = _burst_header(CMD_BURST_WRITE, address, len(words), wires, address_bytes)
+    return np.concatenate([header, words.view(np.uint8), np.full(poll + 1, 0xff, dtype=np.uint8)])
+
+def decode_burst_write(rx, count, poll=8, wires=4, address_bytes=4):
+    """Check the response to a burst write encoded by `encode_burst_write()`"""
+    rx = np.frombuffer(rx, dtype=np.uint8)
+    start = len(rx) - poll - 1
+    marks = np.flatnonzero(rx[start:] != 0xff)
+    op = Op(CMD_BURST_WRITE, None, b"", 1, 0, poll)
+    if len(marks) == 0:
+        raise ResponseTimeout(0, op)
+    marker = rx[start + marks[0]]
+    if marker == CMD_BURST_WRITE | 0x80:
+        raise OperationFailed(0, op)
+    if marker != CMD_BURST_WRITE:
+        raise ProtocolError("{}: unexpected response 0x{:02x}".format(op, marker))
+
+def encode_burst_read(address, count, poll=8, wires=4, address_bytes=4):
+    """Encode a burst read of up to 65536 words
+
+    `poll` is the total number of "FF" bytes the device may send between
+    words, since it only pads when the bus is slower than SPI.
+    """
+    header = _burst_header(CMD_BURST_READ, address, count, wires, address_bytes)
+    return np.concatenate([header, np.full(poll + 5 * count, 0xff, dtype=np.uint8)])
+
+def decode_burst_read(rx, count, poll=8, wires=4, address_bytes=4):
+    """Decode the words of a burst read encoded by `encode_burst_read()`
+
+    Words normally follow each other without padding, so they are checked
+    and converted all at once.  Where the device had to wait for the bus,
+    the padding is skipped and the rest of the burst is tried again.  A
+    word that failed ends the burst, and raises `OperationFailed`.
+    """
+    rx = np.frombuffer(rx, dtype=np.uint8)
+    start = (2 if wires == 2 else 1) + address_bytes + 2
+    end = start + poll + 5 * count
+    result = np.empty(count, dtype=np.uint32)
+    op = Op(CMD_BURST_READ, None, b"", count, 4, poll)
+    done = 0
+    pos = start
+    while done < count:
+        # Skip any padding before the next word
+        skip = np.flatnonzero(rx[pos:end] != 0xff)
+        if len(skip) == 0:
+            raise ResponseTimeout(done, op)
+        pos += int(skip[0])
+        remaining = min(count - done, (end - pos) // 5)
+        if remaining == 0:
+            raise ResponseTimeout(done, op)
+        records = rx[pos:pos + 5 * remaining].reshape(-1, 5)
+        bad = records[:, 0] != CMD_BURST_READ
+        good = int(np.argmax(bad)) if bad.any() else remaining
+        if good < remaining and records[good, 0] == CMD_BURST_READ | 0x80:
+            # The burst ended with a word that failed
+            result[done:done + good + 1] = records[:good + 1, 1:].copy().view(">u4").reshape(-1)
+            raise OperationFailed(done + good, op, result[:done + good + 1])
+        if good == 0:
+            raise ProtocolError("{}: unexpected response 0x{:02x}".format(op, records[0, 0]))
+        result[done:done + good] = records[:good, 1:].copy().view(">u4").reshape(-1)
+        done += good
+        pos += 5 * good
+    return result
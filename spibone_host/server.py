@@ -0,0 +1,233 @@
+# Etherbone server backed by spibone, for use with the litex tools
+import argparse
+import collections
+import logging
+import socket
+import threading
+import time
+
+from litex.tools.remote.etherbone import EtherbonePacket, EtherboneRecord, EtherboneWrites
+from litex.tools.remote.etherbone import EtherboneIPC
+
+from .client import SpiboneClient
+from .framing import SpiboneError, OperationFailed
+
+logger = logging.getLogger(__name__)
+
+def coalesce(addrs, max_length=65536):
+    """Merge consecutive word addresses into (base, length) bursts"""
+    bursts = []
+    for addr in addrs:
+        if bursts:
+            base, length = bursts[-1]
+            if addr == base + 4 * length and length < max_length:
+                bursts[-1] = (base, length + 1)
+                continue
+        bursts.append((addr, 1))
+    return bursts
+
+def record_to_batch(batch, record):
+    """Add the operations for an Etherbone record to `batch`
+
+    Returns the index of each read result and the number of words it
+    holds, in order.
+    """
+    if record.writes is not None:
+        base = record.writes.base_addr
+        datas = record.writes.get_datas()
+        if record.wff:
+            for data in datas:
+                batch.write(base, data)
+        elif len(datas) == 1:
+            batch.write(base, datas[0])
+        elif datas:
+            batch.burst_write(base, datas)
+    reads = []
+    if record.reads is not None:
+        for base, length in coalesce(record.reads.get_addrs()):
+            if length == 1:
+                reads.append((batch.read(base), 1))
+            else:
+                reads.append((batch.burst_read(base, length), length))
+    return reads
+
+def read_datas(reads, results, error=None):
+    """Return the words read, given the results of running the batch
+
+    If the batch raised `error`, `results` only goes as far as the failed
+    operation, so the words that weren't read are returned as 0xffffffff,
+    as a bus error would read on most Wishbone buses.
+    """
+    datas = []
+    for index, length in reads:
+        if index < len(results):
+            value = results[index]
+            words = value if isinstance(value, list) else [value]
+        elif error is not None and index == len(results) and isinstance(error.value, list):
+            # The words of a burst before the one that failed are good
+            words = error.value[:-1]
+        else:
+            words = []
+        datas += words + [0xffffffff] * (length - len(words))
+    return datas
+
+class Scheduler:
+    """Shares one spibone link between several connections
+
+    Each connection submits one batch at a time, and connections with
+    pending batches are served in turn.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.pending = collections.OrderedDict()
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, key, batch):
+        job = [batch, None, None, threading.Event()]
+        with self.cond:
+            self.pending.setdefault(key, collections.deque()).append(job)
+            self.cond.notify()
+        job[3].wait()
+        if job[2] is not None:
+            raise job[2]
+        return job[1]
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                # Take the first connection's next batch, and move the
+                # connection to the back of the line
+                key, queue = next(iter(self.pending.items()))
+                job = queue.popleft()
+                del self.pending[key]
+                if queue:
+                    self.pending[key] = queue
+            # Anything raised is passed on to the submitter, so that
+            # neither this thread nor the waiting connection hangs
+            try:
+                job[1] = self.client.execute(job[0])
+            except Exception as e:
+                job[2] = e
+            job[3].set()
+
+class SpiboneServer(EtherboneIPC):
+    """Etherbone server, compatible with `litex_server`, that uses spibone
+
+    Each record is sent as a single batch, with consecutive reads and
+    incrementing writes turned into bursts.
+    """
+    def __init__(self, client, bind_ip="localhost", bind_port=1234, addr_width=32):
+        self.client = client
+        self.bind_ip = bind_ip
+        self.bind_port = bind_port
+        self.addr_width = addr_width
+        self.scheduler = Scheduler(client)
+
+    def open(self):
+        if hasattr(self, "socket"):
+            return
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if hasattr(socket, "SO_REUSEADDR"):
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.bind_ip, self.bind_port))
+        self.bind_port = self.socket.getsockname()[1]
+        print("tcp port: {:d}".format(self.bind_port))
+        self.socket.listen(4)
+
+    def close(self):
+        self.client.close()
+        if not hasattr(self, "socket"):
+            return
+        self.socket.close()
+        del self.socket
+
+    def _serve_client(self, client_socket, addr):
+        addr_size = self.addr_width // 8
+        # litex_client expects the server to describe itself
+        client_socket.sendall(bytes("CommSpibone:{}:{}".format(self.bind_ip, self.bind_port), "UTF-8"))
+        print("Connected with " + addr[0] + ":" + str(addr[1]))
+        try:
+            while True:
+                packet = self.receive_packet(client_socket, addr_size)
+                if packet == 0:
+                    break
+                packet = EtherbonePacket(self.addr_width, packet)
+                packet.decode()
+                record = packet.records.pop()
+
+                batch = self.client.batch()
+                reads = record_to_batch(batch, record)
+                error = None
+                try:
+                    results = self.scheduler.submit(client_socket, batch)
+                except OperationFailed as e:
+                    # The link is fine, so answer and carry on
+                    logger.warning("%s:%d: %s", addr[0], addr[1], e)
+                    results = e.results
+                    error = e
+                except (SpiboneError, OSError, ValueError) as e:
+                    logger.error("%s:%d: spibone error: %s", addr[0], addr[1], e)
+                    break
+
+                if record.reads is not None:
+                    datas = read_datas(reads, results, error)
+                    reply = EtherboneRecord(addr_size)
+                    reply.writes = EtherboneWrites(addr_size=addr_size, base_addr=record.reads.base_ret_addr, datas=datas)
+                    reply.wcount = len(datas)
+                    packet = EtherbonePacket(self.addr_width)
+                    packet.records = [reply]
+                    packet.encode()
+                    self.send_packet(client_socket, packet)
+        finally:
+            print("Disconnect")
+            client_socket.close()
+
+    def _serve_thread(self):
+        while True:
+            client_socket, addr = self.socket.accept()
+            thread = threading.Thread(target=self._serve_client, args=(client_socket, addr), daemon=True)
+            thread.start()
+
+    def start(self):
+        self.serve_thread = threading.Thread(target=self._serve_thread, daemon=True)
+        self.serve_thread.start()
+
+def main():
+    parser = argparse.ArgumentParser(description="Etherbone server for spibone")
+    parser.add_argument("--bind-ip", default="localhost", help="host bind address")
+    parser.add_argument("--bind-port", default=1234, type=int, help="host bind port")
+    parser.add_argument("--spidev", default="/dev/spidev0.0", help="spidev device to use")
+    parser.add_argument("--speed-hz", default=1000000, type=int, help="SPI clock speed")
+    parser.add_argument("--poll", default=None, type=int, help="poll bytes per response (default: cover 2 us)")
+    parser.add_argument("--address-bytes", default=4, type=int, choices=[1, 2, 3, 4],
+                        help="address bytes the bridge was built with")
+    parser.add_argument("--model", action="store_true", help="serve the Python model instead of a device")
+    args = parser.parse_args()
+
+    if args.model:
+        from spibone_model import SpiboneModel
+        from .transport import ModelTransport
+        transport = ModelTransport(SpiboneModel(address_bytes=args.address_bytes))
+        poll = 8 if args.poll is None else args.poll
+    else:
+        from .spidev import SpidevTransport
+        transport = SpidevTransport(args.spidev, speed_hz=args.speed_hz)
+        poll = transport.poll_bytes(2e-6) if args.poll is None else args.poll
+    client = SpiboneClient(transport, poll=poll, address_bytes=args.address_bytes)
+
+    server = SpiboneServer(client, args.bind_ip, args.bind_port)
+    server.open()
+    server.start()
+    try:
+        while True:
+            time.sleep(100)
+    except KeyboardInterrupt:
+        pass
+    server.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# Linux spidev transport
+import ctypes
+import fcntl
+import math
+import os
+import struct
+
+from .transport import Transport
+
+# From <linux/spi/spidev.h>.  These use the generic ioctl encoding, which is
+# correct for ARM and x86 but not for every architecture.
+SPI_IOC_MAGIC = ord("k")
+
+def _IOW(nr, size):
+    return (1 << 30) | (size << 16) | (SPI_IOC_MAGIC << 8) | nr
+
+SPI_IOC_WR_MODE          = _IOW(1, 1)
+SPI_IOC_WR_BITS_PER_WORD = _IOW(3, 1)
+SPI_IOC_WR_MAX_SPEED_HZ  = _IOW(4, 4)
+
+def SPI_IOC_MESSAGE(n):
+    return _IOW(0, n * ctypes.sizeof(SpiIocTransfer))
+
+class SpiIocTransfer(ctypes.Structure):
+    """struct spi_ioc_transfer"""
+    _fields_ = [
+        ("tx_buf",           ctypes.c_uint64),
+        ("rx_buf",           ctypes.c_uint64),
+        ("len",              ctypes.c_uint32),
+        ("speed_hz",         ctypes.c_uint32),
+        ("delay_usecs",      ctypes.c_uint16),
+        ("bits_per_word",    ctypes.c_uint8),
+        ("cs_change",        ctypes.c_uint8),
+        ("tx_nbits",         ctypes.c_uint8),
+        ("rx_nbits",         ctypes.c_uint8),
+        ("word_delay_usecs", ctypes.c_uint8),
+        ("pad",              ctypes.c_uint8),
+    ]
+
+class SpidevTransport(Transport):
+    """Transport for a four-wire bridge on a Linux spidev device
+
+    Several frames can be sent with a single ioctl by `xfer_many()`.  Each
+    frame is a separate segment of the message, with CS released in between.
+    The transmit and receive buffers and the segment array are allocated
+    once, so `bufsiz` should match the spidev module's ``bufsiz`` parameter,
+    which limits the total length of a message.  `delay_usecs` is added after
+    each frame, before CS is released.
+
+    With `keep_selected`, the driver is asked to leave CS low after the last
+    frame.  The kernel treats this as a hint, and releases CS anyway if
+    another device on the same bus is accessed in between.
+    """
+    can_continue = True
+
+    def __init__(self, path="/dev/spidev0.0", speed_hz=1000000, bufsiz=4096, max_segments=64, delay_usecs=0):
+        self.speed_hz = speed_hz
+        self.delay_usecs = delay_usecs
+        self.max_transfer = bufsiz
+        self.max_segments = max_segments
+
+        self._tx = bytearray(bufsiz)
+        self._rx = bytearray(bufsiz)
+        self._tx_addr = ctypes.addressof(ctypes.c_char.from_buffer(self._tx))
+        self._rx_addr = ctypes.addressof(ctypes.c_char.from_buffer(self._rx))
+        self._segments = (SpiIocTransfer * max_segments)()
+        self._lengths = [0] * max_segments
+
+        self.fd = self._open(path)
+        self._ioctl(SPI_IOC_WR_MODE, struct.pack("=B", 0))
+        self._ioctl(SPI_IOC_WR_BITS_PER_WORD, struct.pack("=B", 8))
+        self._ioctl(SPI_IOC_WR_MAX_SPEED_HZ, struct.pack("=I", speed_hz))
+
+    def _open(self, path):
+        return os.open(path, os.O_RDWR)
+
+    def _ioctl(self, request, arg):
+        return fcntl.ioctl(self.fd, request, arg)
+
+    def poll_bytes(self, latency):
+        """Number of "FF" bytes to allow for a Wishbone latency of `latency` seconds"""
+        return math.ceil(latency * self.speed_hz / 8) + 1
+
+    def xfer(self, data, keep_selected=False):
+        return self.xfer_many([data], keep_selected)[0]
+
+    def release(self):
+        # A lone NOP command, after which CS goes high
+        self.xfer(b"\xff")
+
+    def xfer_many(self, frames, keep_selected=False):
+        results = []
+        index = 0
+        while index < len(frames):
+            # Fill in as many segments as will fit in the buffers
+            count = 0
+            offset = 0
+            while index + count < len(frames) and count < self.max_segments:
+                frame = frames[index + count]
+                if offset + len(frame) > self.max_transfer:
+                    break
+                self._tx[offset:offset + len(frame)] = frame
+                segment = self._segments[count]
+                segment.tx_buf = self._tx_addr + offset
+                segment.rx_buf = self._rx_addr + offset
+                segment.len = len(frame)
+                segment.speed_hz = self.speed_hz
+                segment.delay_usecs = self.delay_usecs
+                segment.bits_per_word = 8
+                # On the last segment, this would keep CS low afterwards
+                segment.cs_change = 1
+                self._lengths[count] = len(frame)
+                offset += len(frame)
+                count += 1
+            if count == 0:
+                raise ValueError("frame is longer than the {} byte buffer".format(self.max_transfer))
+            if index + count == len(frames):
+                self._segments[count - 1].cs_change = int(keep_selected)
+            else:
+                self._segments[count - 1].cs_change = 0
+
+            self._ioctl(SPI_IOC_MESSAGE(count), self._segments)
+
+            offset = 0
+            for length in self._lengths[:count]:
+                results.append(bytes(self._rx[offset:offset + length]))
+                offset += length
+            index += count
+        return results
+
+    def close(self):
+        os.close(self.fd)
@@ -0,0 +1,216 @@
+# Recording and replaying the operations a client sends
+import argparse
+import struct
+import time
+
+from .framing import CMD_WRITE, CMD_BURST_WRITE, CMD_BURST_READ, CMD_POSTED_WRITE
+from .framing import CMD_STATUS, CMD_WRITE8, CMD_READ8, CMD_WRITE16, CMD_READ16
+from .framing import CMD_RMW_SET, CMD_RMW_CLEAR, CMD_RMW_TOGGLE, CMD_POLL, SpiboneError
+
+# timestamp_ns, latency_ns, address, value, batch, waited, command
+RECORD = struct.Struct("<QIIIIHBx")
+COLUMNS = ("timestamp_ns", "latency_ns", "address", "value", "batch", "waited", "command")
+
+class TraceRecorder:
+    """Records every operation a client sends into a ring buffer
+
+    Pass one to `SpiboneClient` as `trace`.  Each record is `RECORD.size`
+    bytes, and once `capacity` records have been made the oldest ones are
+    overwritten.  The columns are:
+
+    * `timestamp_ns`: when the transfer started, from `time.perf_counter_ns()`
+    * `latency_ns`: how long the whole transfer took
+    * `address`: the address of the operation, or 0 for `status()`
+    * `value`: the value written or read, the mask for read-modify-write
+      and polls, or the number of words for bursts
+    * `batch`: a sequence number shared by operations sent together
+    * `waited`: the number of "FF" bytes before the response
+    * `command`: the command byte, with bit 7 set if the operation failed
+    """
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.buffer = bytearray(RECORD.size * capacity)
+        self.count = 0
+        self.batches = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def clear(self):
+        self.count = 0
+
+    def record(self, timestamp_ns, latency_ns, address, value, batch, waited, command):
+        offset = (self.count % self.capacity) * RECORD.size
+        RECORD.pack_into(self.buffer, offset, timestamp_ns, min(latency_ns, 0xffffffff),
+                         (address or 0) & 0xffffffff, (value or 0) & 0xffffffff,
+                         batch & 0xffffffff, min(waited or 0, 0xffff), command)
+        self.count += 1
+
+    def record_batch(self, batch, results, timestamp_ns, latency_ns, failed=None):
+        """Record the operations of `batch`, given the results of `execute()`
+
+        Operations after `failed`, which is the index of the one that raised,
+        were never decoded and are not recorded.
+        """
+        number = self.batches
+        self.batches += 1
+        body = 1 + batch.address_bytes
+        for index, op in enumerate(batch.ops):
+            if failed is not None and index > failed:
+                break
+            if op.command in (CMD_BURST_READ, CMD_BURST_WRITE):
+                value = int.from_bytes(op.payload[body:body + 2], "big") or 65536
+            elif op.value_bytes == 0 or op.command == CMD_POLL:
+                value = int.from_bytes(op.payload[body:body + 4], "big")
+            elif index < len(results):
+                value = results[index]
+            else:
+                value = 0
+            command = op.command | (0x80 if index == failed else 0)
+            self.record(timestamp_ns, latency_ns, op.address, value, number, op.waited, command)
+
+    def records(self):
+        """Return the records that are still in the buffer, oldest first"""
+        first = max(0, self.count - self.capacity)
+        return [RECORD.unpack_from(self.buffer, (i % self.capacity) * RECORD.size)
+                for i in range(first, self.count)]
+
+    def columns(self):
+        """Return the records as a dict of NumPy arrays, oldest first"""
+        import numpy as np
+        dtype = np.dtype({
+            "names": COLUMNS,
+            "formats": ["<u8", "<u4", "<u4", "<u4", "<u4", "<u2", "u1"],
+            "offsets": [0, 8, 12, 16, 20, 24, 26],
+            "itemsize": RECORD.size,
+        })
+        records = np.frombuffer(self.buffer, dtype=dtype)
+        if self.count > self.capacity:
+            start = self.count % self.capacity
+            records = np.concatenate([records[start:], records[:start]])
+        else:
+            records = records[:self.count]
+        return {name: np.ascontiguousarray(records[name]) for name in COLUMNS}
+
+    def export(self, path):
+        """Save the records to `path` as a NumPy `.npz` file, one array per column"""
+        import numpy as np
+        np.savez(path, **self.columns())
+
+def load(path):
+    """Load a trace saved by `TraceRecorder.export()` as a dict of arrays"""
+    import numpy as np
+    with np.load(path) as data:
+        return {name: data[name] for name in COLUMNS}
+
+def _add(batch, command, address, value):
+    if command == CMD_WRITE:
+        batch.write(address, value)
+    elif command == CMD_WRITE8:
+        batch.write8(address, value)
+    elif command == CMD_WRITE16:
+        batch.write16(address, value)
+    elif command == CMD_POSTED_WRITE:
+        batch.posted_write(address, value)
+    elif command == CMD_BURST_WRITE:
+        batch.burst_write(address, [0] * value)
+    elif command == CMD_BURST_READ:
+        batch.burst_read(address, value)
+    elif command == CMD_STATUS:
+        batch.status()
+    elif command == CMD_RMW_SET:
+        batch.rmw_set(address, value)
+    elif command == CMD_RMW_CLEAR:
+        batch.rmw_clear(address, value)
+    elif command == CMD_RMW_TOGGLE:
+        batch.rmw_toggle(address, value)
+    elif command == CMD_READ8:
+        batch.read8(address)
+    elif command == CMD_READ16:
+        batch.read16(address)
+    else:
+        # Polls are replayed as reads, since the expected value isn't kept
+        batch.read(address)
+
+class ReplayStats:
+    """Results of `replay()`"""
+    def __init__(self, operations, batches, seconds):
+        self.operations = operations
+        self.batches = batches
+        self.seconds = seconds
+
+    @property
+    def rate(self):
+        """Operations per second"""
+        if self.seconds == 0:
+            return 0.0
+        return self.operations / self.seconds
+
+def replay(trace, client, repeat=1):
+    """Send the operations in `trace` again, in the same batches, and time it
+
+    `trace` is a `TraceRecorder` or the columns returned by `load()`.
+    Writes send the values that were recorded, so only replay traces
+    against hardware where that is safe.  Burst writes send zeroes.
+    Failures are ignored, since the aim is to measure throughput.
+    """
+    if isinstance(trace, TraceRecorder):
+        records = trace.records()
+    else:
+        records = zip(*(trace[name].tolist() for name in COLUMNS))
+
+    batches = []
+    current = None
+    for timestamp_ns, latency_ns, address, value, number, waited, command in records:
+        if current is None or number != current_number:
+            current = []
+            current_number = number
+            batches.append(current)
+        current.append((command & 0x7f, address, value))
+
+    operations = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for ops in batches:
+            # Executing a batch updates the poll windows and response times
+            # of its operations, so each one is built afresh
+            batch = client.batch()
+            for command, address, value in ops:
+                _add(batch, command, address, value)
+            try:
+                client.execute(batch)
+            except SpiboneError:
+                pass
+            operations += len(batch)
+    return ReplayStats(operations, repeat * len(batches), time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a spibone trace as a benchmark")
+    parser.add_argument("trace", help="trace saved by TraceRecorder.export()")
+    parser.add_argument("--repeat", default=1, type=int, help="number of times to replay the trace")
+    parser.add_argument("--spidev", default="/dev/spidev0.0", help="spidev device to use")
+    parser.add_argument("--speed-hz", default=1000000, type=int, help="SPI clock speed")
+    parser.add_argument("--poll", default=None, type=int, help="poll bytes per response (default: cover 2 us)")
+    parser.add_argument("--address-bytes", default=4, type=int, choices=[1, 2, 3, 4],
+                        help="address bytes the bridge was built with")
+    parser.add_argument("--model", action="store_true", help="replay against the Python model instead of a device")
+    args = parser.parse_args()
+
+    from .client import SpiboneClient
+    if args.model:
+        from spibone_model import SpiboneModel
+        from .transport import ModelTransport
+        transport = ModelTransport(SpiboneModel(address_bytes=args.address_bytes))
+        poll = 8 if args.poll is None else args.poll
+    else:
+        from .spidev import SpidevTransport
+        transport = SpidevTransport(args.spidev, speed_hz=args.speed_hz)
+        poll = transport.poll_bytes(2e-6) if args.poll is None else args.poll
+    client = SpiboneClient(transport, poll=poll, address_bytes=args.address_bytes)
+    stats = replay(load(args.trace), client, args.repeat)
+    client.close()
+    print("{} operations in {} batches, {:.3f} s ({:.0f} operations/s)".format(
+        stats.operations, stats.batches, stats.seconds, stats.rate))
+
+if __name__ == "__main__":
+    main()
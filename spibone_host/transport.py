@@ -0,0 +1,41 @@
+# Transports carry encoded batches to a spibone device
+class Transport:
+    """Base class for transports
+
+    `xfer()` must send `data` with CS held low for the whole transfer, and
+    return the same number of bytes that were received.  If the transport
+    can only send a limited amount at once, it sets `max_transfer`.
+
+    Transports that set `can_continue` also accept `keep_selected`, which
+    leaves CS low so that the next transfer continues the same transaction.
+    `release()` then raises CS without sending anything that matters.
+    """
+    max_transfer = None
+    can_continue = False
+
+    def xfer(self, data, keep_selected=False):
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+    def xfer_many(self, frames, keep_selected=False):
+        """Send each of `frames` as a separate transfer"""
+        results = [self.xfer(frame) for frame in frames[:-1]]
+        return results + [self.xfer(frames[-1], keep_selected)]
+
+    def close(self):
+        pass
+
+class ModelTransport(Transport):
+    """Transport that talks to a `spibone_model.SpiboneModel`"""
+    can_continue = True
+
+    def __init__(self, model):
+        self.model = model
+
+    def xfer(self, data, keep_selected=False):
+        return self.model.transfer(data, keep_selected)
+
+    def release(self):
+        self.model.deselect()
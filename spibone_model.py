@@ -0,0 +1,323 @@
+# Behavioral model of SpiWishboneBridge, for testing host software without HDL
+from collections import deque
+
+from spibone import SIZE_BYTE, SIZE_HALF, SIZE_WORD
+from spibone import CMD_RMW_SET, CMD_RMW_CLEAR, CMD_RMW_TOGGLE, CMD_POLL
+
+class BusError(Exception):
+    """Raised by a memory backend to signal a Wishbone error"""
+
+class Memory:
+    """Sparse Wishbone memory
+
+    Addresses are word addresses, as on the Wishbone bus.  `latency` is the
+    number of extra bytes that each access takes, as seen from the SPI side.
+    Subclass this and override `read()` and `write()` to model peripherals.
+    """
+    def __init__(self, latency=0):
+        self.words = {}
+        self.latency = latency
+
+    def read(self, adr):
+        return self.words.get(adr, 0)
+
+    def write(self, adr, value, sel=0b1111):
+        mask = 0
+        for lane in range(4):
+            if sel & (1 << lane):
+                mask |= 0xff << (8 * lane)
+        self.words[adr] = (self.words.get(adr, 0) & ~mask) | (value & mask)
+
+class SpiboneModel:
+    """Model of SpiWishboneBridge
+
+    The model works a byte at a time rather than a clock at a time, which is
+    exact for single data line bridges since everything they do is byte
+    aligned.  `exchange()` clocks one byte in each direction, and returns the
+    byte the host would see on MISO, or on MOSI for two- and three-wire mode.
+    `state` follows the state names of the gateware FSM.
+
+    In two-wire mode, the ``0xab`` sync byte must be aligned to the bytes
+    passed to `exchange()`.
+    """
+    def __init__(self, memory=None, wires=4, address_bytes=4, address_base=0):
+        if wires not in (2, 3, 4):
+            raise ValueError("`wires` must be 2, 3, or 4")
+        if address_bytes not in (1, 2, 3, 4):
+            raise ValueError("`address_bytes` must be 1, 2, 3, or 4")
+        if address_base & (2**(8 * address_bytes) - 1):
+            raise ValueError("`address_base` must be aligned to the addressable range")
+        if memory is None:
+            memory = Memory()
+        self.memory = memory
+        self.wires = wires
+        self.address_bytes = address_bytes
+        self.address_base = address_base
+
+        # Bytes clocked so far, which is used to time posted writes
+        self.time = 0
+
+        # Posted writes that are still queued, by the time they finish
+        self.posted = deque()
+        self.posted_error = False
+        self.posted_overflow = False
+
+        # The line is only driven by the host while receiving in two- and
+        # three-wire mode, which is represented by None.
+        self._idle = 0xff if wires == 4 else None
+        self.selected = wires == 2
+        self._restart()
+
+    def _restart(self):
+        self.state = "IDLE"
+        self._fsm = self._run()
+        self._out = next(self._fsm)
+
+    def select(self):
+        """Pull CS low"""
+        if not self.selected:
+            self.selected = True
+            self._restart()
+
+    def deselect(self):
+        """Release CS, which resets the FSM.  This does nothing in two-wire mode."""
+        if self.wires != 2:
+            self.selected = False
+
+    def exchange(self, byte):
+        if not self.selected:
+            raise ValueError("CS must be low to exchange data")
+        self.time += 1
+        while self.posted and self.posted[0] <= self.time:
+            self.posted.popleft()
+        out = self._out
+        self._out = self._fsm.send(byte & 0xff)
+        if out is None:
+            return byte & 0xff
+        return out
+
+    def transfer(self, data, keep_selected=False):
+        """Exchange `data` in a single transaction, returning the bytes received"""
+        self.select()
+        result = bytes(self.exchange(b) for b in data)
+        if not keep_selected:
+            self.deselect()
+        return result
+
+    def _latency(self):
+        return getattr(self.memory, "latency", 0)
+
+    def _drain(self):
+        """Wait for queued posted writes, which have priority over the FSM"""
+        if self.posted:
+            return max(0, self.posted[-1] - self.time)
+        return 0
+
+    def _read(self, adr):
+        try:
+            return self.memory.read(adr) & 0xffffffff, False
+        except BusError:
+            return 0, True
+
+    def _write(self, adr, value, sel=0b1111):
+        try:
+            self.memory.write(adr, value & 0xffffffff, sel)
+            return False
+        except BusError:
+            return True
+
+    def _receive(self, count):
+        value = 0
+        for _ in range(count):
+            value = (value << 8) | (yield self._idle)
+        return value
+
+    def _wait(self, count):
+        for _ in range(count):
+            yield 0xff
+
+    def _send(self, value, count):
+        for shift in range(8 * (count - 1), -1, -8):
+            yield (value >> shift) & 0xff
+
+    def _run(self):
+        while True:
+            self.state = "IDLE"
+            if self.wires == 2:
+                while ((yield None) & 0x7f) != 0x2b:
+                    pass
+            command = yield self._idle
+
+            self.state = "GET_TYPE_BYTE"
+            size = SIZE_WORD
+            if command == 0xff:
+                continue
+            elif command in (0x06, 0x07):
+                size = SIZE_BYTE
+            elif command in (0x08, 0x09):
+                size = SIZE_HALF
+            elif command == 0x05:
+                yield from self._status()
+                continue
+            elif command not in (0x00, 0x01, 0x02, 0x03, 0x04, CMD_POLL,
+                                 CMD_RMW_SET, CMD_RMW_CLEAR, CMD_RMW_TOGGLE):
+                self.state = "END"
+                if self.wires == 2:
+                    continue
+                while True:
+                    yield 0xff
+
+            self.state = "READ_ADDRESS"
+            address = yield from self._receive(self.address_bytes)
+            address |= self.address_base
+
+            if command in (0x02, 0x03):
+                yield from self._burst(command, address)
+            elif command == CMD_POLL:
+                yield from self._poll(command, address)
+            elif command in (CMD_RMW_SET, CMD_RMW_CLEAR, CMD_RMW_TOGGLE):
+                yield from self._rmw(command, address)
+            elif command in (0x00, 0x04, 0x06, 0x08):
+                yield from self._write_value(command, address, size)
+            else:
+                yield from self._read_value(command, address, size)
+
+    def _lanes(self, address, size):
+        if size == SIZE_BYTE:
+            return 1, 1 << (address & 3), 8 * (address & 3)
+        if size == SIZE_HALF:
+            return 2, 0b11 << (address & 2), 8 * (address & 2)
+        return 4, 0b1111, 0
+
+    def _write_value(self, command, address, size):
+        nbytes, sel, lane = self._lanes(address, size)
+        self.state = "READ_VALUE"
+        value = yield from self._receive(nbytes)
+        if command == 0x04:
+            # The queue has room for four writes
+            pending = sum(1 for done in self.posted if done > self.time)
+            if pending >= 4:
+                self.posted_overflow = True
+                return
+            start = self.posted[-1] if self.posted else self.time
+            self.posted.append(max(start, self.time) + self._latency())
+            if self._write(address >> 2, value):
+                self.posted_error = True
+            return
+        self.state = "WRITE_WISHBONE"
+        self._write(address >> 2, value << lane, sel)
+        self.state = "WAIT_BYTE_BOUNDARY"
+        yield from self._wait(1 + self._drain() + self._latency())
+        self.state = "WRITE_WR_RESPONSE"
+        yield command
+
+    def _read_value(self, command, address, size):
+        nbytes, sel, lane = self._lanes(address, size)
+        self.state = "READ_WISHBONE"
+        wait = self._drain()
+        value, error = self._read(address >> 2)
+        self.state = "WAIT_BYTE_BOUNDARY"
+        yield from self._wait(1 + wait + self._latency())
+        self.state = "WRITE_RESPONSE"
+        yield command
+        self.state = "WRITE_VALUE"
+        yield from self._send(value >> lane, nbytes)
+
+    def _status(self):
+        self.state = "READ_STATUS"
+        yield from self._wait(1 + self._drain())
+        status = int(self.posted_error) | (int(self.posted_overflow) << 1)
+        self.posted_error = False
+        self.posted_overflow = False
+        self.state = "WRITE_RESPONSE"
+        yield 0x05
+        self.state = "WRITE_VALUE"
+        yield from self._send(status, 4)
+
+    def _burst(self, command, address):
+        self.state = "READ_COUNT"
+        count = (yield from self._receive(2)) or 65536
+        latency = self._latency()
+        failed = False
+        if command == 0x02:
+            # Each word is written while the next one is received, so a bus
+            # that takes longer than a word loses the rest of the burst.
+            self.state = "READ_BURST_VALUE"
+            wait = self._drain()
+            for i in range(count):
+                value = yield from self._receive(4)
+                if failed:
+                    continue
+                if self._write((address >> 2) + i, value):
+                    failed = True
+                elif i + 1 < count and latency >= 4:
+                    failed = True
+            self.state = "WAIT_BYTE_BOUNDARY"
+            yield from self._wait(1 + wait + latency)
+            self.state = "WRITE_WR_RESPONSE"
+            yield command | 0x80 if failed else command
+            return
+
+        # Words are prefetched while the previous one is sent, so only the
+        # first word waits unless the bus is slower than a word.
+        wait = 1 + self._drain() + latency
+        for i in range(count):
+            self.state = "WAIT_PREFETCH"
+            value, error = self._read((address >> 2) + i)
+            yield from self._wait(wait)
+            self.state = "WRITE_RESPONSE"
+            yield command | 0x80 if error else command
+            self.state = "WRITE_VALUE"
+            yield from self._send(value, 4)
+            if error:
+                return
+            wait = max(0, latency - 4)
+
+    def _rmw(self, command, address):
+        self.state = "READ_VALUE"
+        mask = yield from self._receive(4)
+        self.state = "RMW_READ_WISHBONE"
+        wait = 1 + self._drain() + self._latency()
+        value, failed = self._read(address >> 2)
+        if not failed:
+            if command == CMD_RMW_SET:
+                value |= mask
+            elif command == CMD_RMW_CLEAR:
+                value &= ~mask
+            else:
+                value ^= mask
+            self.state = "RMW_WRITE_WISHBONE"
+            wait += self._latency()
+            failed = self._write(address >> 2, value)
+        self.state = "WAIT_BYTE_BOUNDARY"
+        yield from self._wait(wait)
+        self.state = "WRITE_WR_RESPONSE"
+        yield command | 0x80 if failed else command
+
+    def _poll(self, command, address):
+        self.state = "READ_POLL_MASK"
+        mask = yield from self._receive(4)
+        self.state = "READ_POLL_EXPECTED"
+        expected = yield from self._receive(4)
+        self.state = "READ_POLL_COUNT"
+        count = (yield from self._receive(2)) or 65536
+
+        # One attempt is made per byte
+        yield from self._wait(self._drain())
+        while True:
+            self.state = "POLL_WISHBONE"
+            value, failed = self._read(address >> 2)
+            count -= 1
+            if failed or value & mask == expected:
+                break
+            if count == 0:
+                failed = True
+                break
+            self.state = "POLL_WAIT"
+            yield from self._wait(1 + self._latency())
+        self.state = "WAIT_BYTE_BOUNDARY"
+        yield from self._wait(1 + self._latency())
+        self.state = "WRITE_RESPONSE"
+        yield command | 0x80 if failed else command
+        self.state = "WRITE_VALUE"
+        yield from self._send(value, 4)
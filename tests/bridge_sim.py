@@ -0,0 +1,205 @@
+# Simulation of the bridges, for testing the gateware from pytest
+from migen import Module, Record, run_simulation
+
+from spibone import SpiWishboneBridge, DirectSpiWishboneBridge
+from spibone_host.transport import Transport
+from spibone_model import Memory, BusError
+
+def _tristate(width):
+    # Records with these fields are lowered to plain signals in simulation
+    return [("o", width), ("oe", 1), ("i", width)]
+
+def make_pads(wires=4, width=1):
+    layout = [("clk", 1)]
+    if wires != 2:
+        layout.append(("cs_n", 1))
+    if width > 1:
+        layout.append(("dq", _tristate(width)))
+    elif wires == 4:
+        layout += [("mosi", 1), ("miso", 1)]
+    else:
+        layout.append(("mosi", _tristate(1)))
+    return Record(layout)
+
+def wishbone_slave(bus, memory, latency):
+    """Answer Wishbone cycles from `memory`, taking `latency` extra cycles
+
+    `memory.read()` and `memory.write()` may raise `BusError`, which is
+    signalled with `err`.  `accesses` records each access as
+    ``(we, adr)``.
+    """
+    yield "passive"
+    while True:
+        if (yield bus.cyc) and (yield bus.stb):
+            for _ in range(latency):
+                yield
+            adr = yield bus.adr
+            we = yield bus.we
+            wishbone_slave.accesses.append((we, adr))
+            try:
+                if we:
+                    memory.write(adr, (yield bus.dat_w), (yield bus.sel))
+                else:
+                    yield bus.dat_r.eq(memory.read(adr) & 0xffffffff)
+                yield bus.ack.eq(1)
+            except BusError:
+                yield bus.dat_r.eq(0)
+                yield bus.err.eq(1)
+            yield
+            yield bus.ack.eq(0)
+            yield bus.err.eq(0)
+        yield
+wishbone_slave.accesses = []
+
+class SerialHost:
+    """Clocks frames into a `SpiWishboneBridge`, one bit at a time
+
+    Each SPI clock takes `2 * half_period` system clocks.  With a `width` of
+    2 or 4, the first byte of each frame is sent one bit per clock on
+    ``dq[0]``, and the rest of the frame `width` bits per clock.
+    """
+    def __init__(self, pads, wires, width, half_period=4):
+        self.pads = pads
+        self.wires = wires
+        self.width = width
+        self.half_period = half_period
+        self.host = 2**width - 1
+        self.results = []
+
+    def line(self):
+        """Resolve the shared data lines, which the bridge wins"""
+        yield "passive"
+        io = self.pads.dq if self.width > 1 else self.pads.mosi
+        while True:
+            if (yield io.oe):
+                yield io.i.eq((yield io.o))
+            else:
+                yield io.i.eq(self.host)
+            yield
+
+    def _sample(self):
+        if self.width > 1:
+            io = self.pads.dq
+        elif self.wires == 4:
+            return (yield self.pads.miso)
+        else:
+            io = self.pads.mosi
+        if (yield io.oe):
+            return (yield io.o)
+        return self.host
+
+    def _byte(self, byte, bits):
+        value = 0
+        for shift in range(8 - bits, -1, -bits):
+            group = (byte >> shift) & (2**bits - 1)
+            if bits < self.width:
+                group |= (2**self.width - 1) & ~1
+            self.host = group
+            if self.wires == 4 and self.width == 1:
+                yield self.pads.mosi.eq(group)
+            yield self.pads.clk.eq(0)
+            for _ in range(self.half_period):
+                yield
+            yield self.pads.clk.eq(1)
+            for _ in range(self.half_period):
+                yield
+            value = (value << bits) | ((yield from self._sample()) & (2**bits - 1))
+        return value
+
+    def run(self, frames, gap=16):
+        if self.wires != 2:
+            yield self.pads.cs_n.eq(1)
+        for _ in range(gap):
+            yield
+        for frame in frames:
+            if self.wires != 2:
+                yield self.pads.cs_n.eq(0)
+            for _ in range(gap):
+                yield
+            rx = bytearray()
+            for index, byte in enumerate(frame):
+                bits = 1 if index == 0 else self.width
+                rx.append((yield from self._byte(byte, bits)))
+            yield self.pads.clk.eq(0)
+            self.host = 2**self.width - 1
+            for _ in range(gap):
+                yield
+            if self.wires != 2:
+                yield self.pads.cs_n.eq(1)
+            for _ in range(gap):
+                yield
+            self.results.append(bytes(rx))
+
+class DirectHost:
+    """Clocks frames into a `DirectSpiWishboneBridge`
+
+    This runs in the ``spi_tx`` domain, so it drives MOSI on the falling
+    edge of the SPI clock and sees what the bridge sent on the rising edge
+    before.  Simulated clocks can't stop, so CLK keeps running while CS is
+    high.
+    """
+    def __init__(self, pads):
+        self.pads = pads
+        self.results = []
+
+    def run(self, frames, gap=8):
+        yield self.pads.cs_n.eq(1)
+        for _ in range(gap):
+            yield
+        for frame in frames:
+            yield self.pads.cs_n.eq(0)
+            rx = bytearray()
+            for byte in frame:
+                value = 0
+                for shift in range(7, -1, -1):
+                    yield self.pads.mosi.eq((byte >> shift) & 1)
+                    yield
+                    value = (value << 1) | (yield self.pads.miso)
+                rx.append(value)
+            yield self.pads.cs_n.eq(1)
+            for _ in range(gap):
+                yield
+            self.results.append(bytes(rx))
+
+def run_frames(frames, memory=None, latency=0, wires=4, width=1, direct=False,
+               sys_period=10, spi_period=20, vcd_name=None, **kwargs):
+    """Send each of `frames` with CS low, and return the bytes received
+
+    `kwargs` are passed to the bridge.  With `direct`, the system and SPI
+    clocks have periods of `sys_period` and `spi_period`.
+    """
+    if memory is None:
+        memory = Memory()
+    pads = make_pads(wires, width)
+    wishbone_slave.accesses = []
+    if direct:
+        dut = DirectSpiWishboneBridge(pads, with_tristate=False, **kwargs)
+        host = DirectHost(pads)
+        # Start the SPI clocks a little after the system clock, so that the
+        # two are out of phase
+        clocks = {"sys": sys_period, "spi_rx": (spi_period, 3), "spi_tx": (spi_period, 3 + spi_period // 2)}
+        generators = {
+            "sys": [wishbone_slave(dut.wishbone, memory, latency)],
+            "spi_tx": [host.run(frames)],
+        }
+    else:
+        dut = SpiWishboneBridge(pads, wires=wires, with_tristate=False, width=width, **kwargs)
+        host = SerialHost(pads, wires, width)
+        clocks = {"sys": sys_period}
+        generators = [host.run(frames), wishbone_slave(dut.wishbone, memory, latency)]
+        if wires != 4 or width > 1:
+            generators.append(host.line())
+    run_simulation(dut, generators, clocks=clocks, vcd_name=vcd_name)
+    return host.results
+
+class SimTransport(Transport):
+    """Transport that runs each call in a fresh simulation of a bridge"""
+    def __init__(self, memory=None, **kwargs):
+        self.memory = Memory() if memory is None else memory
+        self.kwargs = kwargs
+
+    def xfer(self, data, keep_selected=False):
+        return self.xfer_many([data])[0]
+
+    def xfer_many(self, frames, keep_selected=False):
+        return run_frames(frames, self.memory, **self.kwargs)
@@ -0,0 +1,5 @@
+# Make spibone, spibone_model and spibone_host importable from the tests
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
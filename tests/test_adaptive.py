@@ -0,0 +1,132 @@
+import pytest
+
+from spibone_host import SpiboneClient, ModelTransport, AdaptivePoll, ResponseTimeout, OperationFailed
+from spibone_model import SpiboneModel, Memory, BusError
+
+class RegionMemory(Memory):
+    """Memory whose latency depends on the address"""
+    def __init__(self, latencies):
+        super().__init__()
+        self.latencies = latencies
+        self.adr = 0
+
+    @property
+    def latency(self):
+        return self.latencies.get(self.adr >> 14, 0)
+
+    @latency.setter
+    def latency(self, value):
+        pass
+
+    def read(self, adr):
+        self.adr = adr
+        return super().read(adr)
+
+class CountingTransport(ModelTransport):
+    def __init__(self, model):
+        super().__init__(model)
+        self.transfers = []
+
+    def xfer(self, data, keep_selected=False):
+        self.transfers.append(("xfer", len(data), keep_selected))
+        return super().xfer(data, keep_selected)
+
+    def release(self):
+        self.transfers.append(("release",))
+        super().release()
+
+def test_window():
+    poll = AdaptivePoll(default=8, percentile=90, margin=1, minimum=2, maximum=32)
+    assert poll.window(0x1000) == 8
+    for waited in [1] * 9 + [20]:
+        poll.record(0x1000, waited)
+    assert poll.histogram(0x1000) == {1: 9, 20: 1}
+    assert poll.window(0x1000) == 2
+    poll.record(0x1000, 20)
+    assert poll.window(0x1000) == 21
+    # Other regions, and operations without an address, are separate
+    assert poll.window(0x20000) == 8
+    assert poll.window(None) == 8
+    assert poll.histogram(0x20000) == {}
+
+def test_window_limits():
+    poll = AdaptivePoll(margin=0, minimum=3, maximum=16, history=4)
+    poll.record(0, 1000)
+    assert poll.histogram(0) == {16: 1}
+    assert poll.window(0) == 16
+    for _ in range(4):
+        poll.record(0, 0)
+    # The oldest sample has dropped out of the history
+    assert poll.histogram(0) == {0: 4}
+    assert poll.window(0) == 3
+
+def test_client_learns():
+    memory = RegionMemory({0: 2, 1: 12})
+    poll = AdaptivePoll(default=32, margin=1, region_bits=16)
+    client = SpiboneClient(ModelTransport(SpiboneModel(memory)), poll=poll)
+    for _ in range(4):
+        client.read(0x100)
+        client.read(0x10100)
+    fast = poll.window(0x100)
+    slow = poll.window(0x10100)
+    assert fast < slow <= 32
+    assert client.read(0x10100) == 0
+
+def test_continuation():
+    memory = Memory(latency=12)
+    memory.words[0] = 0x1234
+    transport = CountingTransport(SpiboneModel(memory))
+    poll = AdaptivePoll(default=2, continuation=4, continuations=4)
+    client = SpiboneClient(transport, poll=poll)
+    batch = client.batch()
+    batch.read(0)
+    assert client.execute(batch) == [0x1234]
+    # The late response was collected with more "FF" bytes while CS was
+    # still low, and then CS was raised
+    assert transport.transfers == [("xfer", 12, True)] + [("xfer", 4, True)] * 3 + [("release",)]
+    assert batch.ops[0].poll == 14
+    # The time it took is what was recorded
+    assert batch.ops[0].waited == 13
+    assert poll.histogram(0) == {13: 1}
+    # The next transfer starts a new frame
+    transport.transfers = []
+    assert client.read(0) == 0x1234
+    assert transport.transfers[-1] == ("release",)
+
+def test_continuation_released_on_failure():
+    class Broken(Memory):
+        def write(self, adr, value, sel=0b1111):
+            raise BusError()
+    transport = CountingTransport(SpiboneModel(Broken()))
+    client = SpiboneClient(transport, poll=AdaptivePoll(default=8, continuation=4))
+    batch = client.batch()
+    batch.rmw_set(0, 1)
+    with pytest.raises(OperationFailed):
+        client.execute(batch)
+    assert transport.transfers[-1] == ("release",)
+
+def test_continuation_gives_up():
+    memory = Memory(latency=40)
+    transport = CountingTransport(SpiboneModel(memory))
+    poll = AdaptivePoll(default=2, continuation=4, continuations=2)
+    client = SpiboneClient(transport, poll=poll)
+    with pytest.raises(ResponseTimeout):
+        client.read(0)
+    assert [t[0] for t in transport.transfers] == ["xfer", "xfer", "xfer", "release"]
+    # The timeout is recorded as the whole window that was tried
+    assert poll.histogram(0) == {10: 1}
+
+def test_no_continuation_in_middle():
+    # Only the last operation can be continued, since later ones were sent
+    # while the device was busy
+    memory = Memory(latency=12)
+    transport = CountingTransport(SpiboneModel(memory))
+    poll = AdaptivePoll(default=2, continuation=4, continuations=4)
+    client = SpiboneClient(transport, poll=poll)
+    batch = client.batch()
+    batch.read(0)
+    batch.read(4)
+    with pytest.raises(ResponseTimeout) as e:
+        client.execute(batch)
+    assert e.value.index == 0
+    assert [t[0] for t in transport.transfers] == ["xfer", "release"]
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from spibone_host import SpiboneClient, ModelTransport, OperationFailed
+from spibone_host.aio import AsyncSpiboneClient
+from spibone_model import SpiboneModel, Memory, BusError
+
+class FaultyMemory(Memory):
+    """Signals a bus error on writes to one word"""
+    def __init__(self, bad):
+        super().__init__()
+        self.bad = bad
+
+    def write(self, adr, value, sel=0b1111):
+        if adr == self.bad:
+            raise BusError()
+        super().write(adr, value, sel)
+
+class CountingTransport(ModelTransport):
+    def __init__(self, model):
+        super().__init__(model)
+        self.transfers = 0
+
+    def xfer_many(self, frames, keep_selected=False):
+        self.transfers += 1
+        return super().xfer_many(frames, keep_selected)
+
+def make_client(memory=None):
+    transport = CountingTransport(SpiboneModel(memory))
+    return AsyncSpiboneClient(SpiboneClient(transport, poll=4)), transport
+
+def test_coalesced():
+    client, transport = make_client()
+
+    async def run():
+        writes = [client.write(4 * i, i * 0x01010101) for i in range(8)]
+        reads = [client.read(4 * i) for i in range(8)]
+        burst = client.burst_read(0, 8)
+        assert await asyncio.gather(*writes) == [None] * 8
+        return await asyncio.gather(*reads), await burst
+
+    values, burst = asyncio.run(run())
+    assert values == [i * 0x01010101 for i in range(8)]
+    assert burst == values
+    assert transport.transfers == 1
+    client.close()
+
+def test_separate_passes():
+    client, transport = make_client()
+
+    async def run():
+        await client.write8(0x10, 0x5a)
+        await client.write16(0x12, 0x1234)
+        return await client.read(0x10), await client.read8(0x13), await client.read16(0x10)
+
+    assert asyncio.run(run()) == (0x1234005a, 0x12, 0x005a)
+    assert transport.transfers == 5
+    client.close()
+
+def test_partial_failure():
+    client, _ = make_client(FaultyMemory(2))
+
+    async def run():
+        futures = [client.write(0, 1), client.read(0), client.burst_write(4, [2, 3]),
+                   client.read(4), client.write(12, 4)]
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert results[:2] == [None, 1]
+    for result in results[2:]:
+        assert isinstance(result, OperationFailed)
+        assert result.index == 2
+    client.close()
+
+def test_close_flushes():
+    client, transport = make_client()
+    memory = transport.model.memory
+
+    async def run():
+        client.write(0x20, 0xdeadbeef)
+        client.close()
+
+    asyncio.run(run())
+    assert memory.words == {0x20 >> 2: 0xdeadbeef}
+    assert transport.transfers == 1
+
+def test_needs_running_loop():
+    client, _ = make_client()
+    with pytest.raises(RuntimeError):
+        client.read(0)
+    client.close()
@@ -0,0 +1,138 @@
+# Tests of SpiWishboneBridge in simulation.  These are slow, so each one
+# sends as little as it can.
+import pytest
+
+from spibone_host import SpiboneClient, OperationFailed
+from spibone_model import Memory, BusError
+
+from bridge_sim import SimTransport, run_frames, wishbone_slave
+
+class FaultyMemory(Memory):
+    """Signals a bus error on any access to the words in `bad`"""
+    def __init__(self, bad):
+        super().__init__()
+        self.bad = set(bad)
+
+    def read(self, adr):
+        if adr in self.bad:
+            raise BusError()
+        return super().read(adr)
+
+    def write(self, adr, value, sel=0b1111):
+        if adr in self.bad:
+            raise BusError()
+        super().write(adr, value, sel)
+
+def make_client(memory=None, poll=8, wires=4, **kwargs):
+    transport = SimTransport(memory, wires=wires, **kwargs)
+    client = SpiboneClient(transport, poll=poll, wires=wires,
+                           address_bytes=kwargs.get("address_bytes", 4))
+    return client, transport.memory
+
+@pytest.mark.parametrize("wires", [2, 3, 4])
+def test_read_write(wires):
+    client, memory = make_client(wires=wires)
+    batch = client.batch()
+    batch.write(0x10, 0x12345678)
+    batch.read(0x10)
+    batch.burst_read(0x10, 2)
+    assert client.execute(batch) == [None, 0x12345678, [0x12345678, 0]]
+    assert memory.words == {4: 0x12345678}
+
+@pytest.mark.parametrize("width", [2, 4])
+@pytest.mark.parametrize("poll", [2, 8])
+def test_wide_commands(width, poll):
+    # Only the first command is sent one bit per clock, and the padding
+    # and commands after it are all `width` bits per clock
+    client, memory = make_client(poll=poll, width=width)
+    batch = client.batch()
+    batch.write(0x10, 0x12345678)
+    batch.read(0x10)
+    batch.write8(0x11, 0xab)
+    batch.read(0x10)
+    assert client.execute(batch) == [None, 0x12345678, None, 0x1234ab78]
+
+def test_two_wire_burst_state():
+    # There is no CS in two-wire mode, so nothing about a burst may be left
+    # over for the commands after it
+    client, memory = make_client(FaultyMemory([5]), wires=2)
+    batch = client.batch()
+    batch.burst_write(0x10, [1, 2])
+    with pytest.raises(OperationFailed):
+        client.execute(batch)
+
+    batch = client.batch()
+    batch.burst_read(0x00, 2)
+    batch.read(0x10)
+    batch.write(0x18, 3)
+    batch.read(0x18)
+    assert client.execute(batch) == [[0, 0], 1, None, 3]
+
+@pytest.mark.parametrize("direct", [False, True])
+def test_burst_read_prefetch(direct):
+    memory = Memory()
+    memory.words = {4: 0x11111111, 5: 0x22222222, 6: 0x33333333}
+    frame = b"\x03\x00\x00\x00\x10\x00\x03" + b"\xff" * 24
+    rx = run_frames([frame], memory, direct=direct)[0][7:].lstrip(b"\xff")
+    # Only the first word waits for the bus
+    assert rx[:15] == bytes.fromhex("03111111110322222222 0333333333")
+    assert rx[15:] == b"\xff" * (len(rx) - 15)
+
+@pytest.mark.parametrize("direct", [False, True])
+def test_burst_read_error(direct):
+    memory = FaultyMemory([5])
+    memory.words = {4: 0x11111111, 6: 0x33333333}
+    # The burst ends at the word that failed, and the read after it is
+    # still understood
+    frame = b"\x03\x00\x00\x00\x10\x00\x03" + b"\xff" * 16 + b"\x01\x00\x00\x00\x18" + b"\xff" * 10
+    rx = run_frames([frame], memory, direct=direct)[0]
+    assert rx[7:23].lstrip(b"\xff")[:10] == bytes.fromhex("0311111111 8300000000")
+    assert rx[28:].lstrip(b"\xff")[:5] == bytes.fromhex("0133333333")
+    # Nothing after the failed word was fetched for the burst
+    assert wishbone_slave.accesses == [(0, 4), (0, 5), (0, 6)]
+
+@pytest.mark.parametrize("sys_period,spi_period", [(10, 10), (10, 24), (7, 30)])
+def test_direct_clocks(sys_period, spi_period):
+    # The SPI clock may be anything up to the system clock, and the two
+    # aren't in phase
+    client, memory = make_client(direct=True, sys_period=sys_period, spi_period=spi_period)
+    batch = client.batch()
+    batch.write(0x10, 0x12345678)
+    batch.read(0x10)
+    batch.burst_write(0x20, [1, 2, 3])
+    batch.burst_read(0x1c, 4)
+    batch.rmw_set(0x24, 0xf0)
+    batch.read16(0x12)
+    assert client.execute(batch) == [None, 0x12345678, None, [0, 1, 2, 3], None, 0x1234]
+    assert memory.words == {4: 0x12345678, 8: 1, 9: 0xf2, 10: 3}
+
+@pytest.mark.parametrize("direct", [False, True])
+def test_burst_write_overflow(direct):
+    # The bus is too slow for the data to be buffered while the first word
+    # is written, so the rest of the burst is lost
+    client, memory = make_client(poll=32 if direct else 12, latency=400, direct=direct)
+    batch = client.batch()
+    batch.burst_write(0x10, list(range(1, 7)))
+    with pytest.raises(OperationFailed):
+        client.execute(batch)
+    assert memory.words == {4: 1}
+
+    # Only data can overflow, and not the padding after the last word
+    batch = client.batch()
+    batch.burst_write(0x10, [9])
+    batch.read(0x10)
+    assert client.execute(batch) == [None, 9]
+
+@pytest.mark.parametrize("wires,direct", [(3, False), (4, True)])
+def test_poll(wires, direct):
+    client, memory = make_client(wires=wires, direct=direct)
+    memory.words = {4: 0x12}
+    batch = client.batch()
+    batch.poll_until(0x10, 0xff, 0x12, 4)
+    batch.poll_until(0x10, 0xff, 0x34, 4)
+    with pytest.raises(OperationFailed) as e:
+        client.execute(batch)
+    assert e.value.results == [0x12]
+    assert e.value.value == 0x12
+    # One attempt per byte
+    assert wishbone_slave.accesses == [(0, 4)] * 5
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from spibone_host import SpiboneClient, ModelTransport
+from spibone_host.bulk import BulkTransfer, TransferFailed
+from spibone_model import SpiboneModel, Memory
+
+class LimitedTransport(ModelTransport):
+    def __init__(self, model, max_transfer, failures=0):
+        super().__init__(model)
+        self.max_transfer = max_transfer
+        self.failures = failures
+        self.lengths = []
+
+    def xfer(self, data, keep_selected=False):
+        if self.failures:
+            self.failures -= 1
+            raise OSError(5, "Input/output error")
+        if len(data) > self.max_transfer:
+            raise ValueError("frame is longer than the {} byte buffer".format(self.max_transfer))
+        self.lengths.append(len(data))
+        return super().xfer(data, keep_selected)
+
+def make_bulk(memory=None, max_transfer=4096, failures=0, **kwargs):
+    transport = LimitedTransport(SpiboneModel(memory), max_transfer, failures)
+    return BulkTransfer(SpiboneClient(transport, poll=4), **kwargs), transport
+
+def image(length):
+    return bytes((i * 7 + 3) & 0xff for i in range(length))
+
+@pytest.mark.parametrize("verify", [False, True])
+@pytest.mark.parametrize("length", [4, 10003, 20000])
+def test_upload_download(tmp_path, verify, length):
+    bulk, transport = make_bulk()
+    src = tmp_path / "src.bin"
+    dst = tmp_path / "dst.bin"
+    src.write_bytes(image(length))
+    stats = bulk.upload(0x40000000, str(src), verify=verify)
+    assert stats.bytes == length
+    assert stats.retries == 0
+    assert max(transport.lengths) <= 4096
+
+    stats = bulk.download(0x40000000, length, str(dst))
+    assert stats.bytes == length
+    assert dst.read_bytes() == src.read_bytes()
+
+def test_trailing_bytes(tmp_path):
+    memory = Memory()
+    memory.words[1] = 0xaabbccdd
+    bulk, _ = make_bulk(memory)
+    src = tmp_path / "src.bin"
+    src.write_bytes(b"\x01\x02\x03\x04\x05\x06")
+    bulk.upload(0, str(src), verify=True)
+    assert memory.words == {0: 0x04030201, 1: 0xaabb0605}
+
+def test_retry(tmp_path):
+    bulk, _ = make_bulk(failures=2)
+    src = tmp_path / "src.bin"
+    src.write_bytes(image(64))
+    stats = bulk.upload(0, str(src))
+    assert stats.retries == 2
+    assert stats.bytes == 64
+
+def test_resume(tmp_path):
+    memory = Memory()
+    bulk, transport = make_bulk(memory, max_transfer=64, failures=100, retries=1)
+    src = tmp_path / "src.bin"
+    src.write_bytes(image(64))
+    with pytest.raises(TransferFailed) as e:
+        bulk.upload(0, str(src))
+    assert e.value.offset == 0
+
+    transport.failures = 0
+    bulk.upload(0, str(src), offset=e.value.offset)
+    dst = tmp_path / "dst.bin"
+    dst.write_bytes(b"\0" * 16)
+    bulk.download(0, 64, str(dst), offset=16)
+    data = dst.read_bytes()
+    assert data[:16] == b"\0" * 16
+    assert data[16:] == image(64)[16:]
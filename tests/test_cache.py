@@ -0,0 +1,143 @@
+import pytest
+
+from spibone_host import SpiboneClient, ModelTransport, OperationFailed
+from spibone_host.cache import CachedClient, CACHEABLE, WRITE_THROUGH, VOLATILE
+from spibone_model import SpiboneModel, Memory, BusError
+
+class CountingMemory(Memory):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def read(self, adr):
+        self.reads += 1
+        return super().read(adr)
+
+def make_cache(capacity=1024):
+    memory = CountingMemory()
+    client = SpiboneClient(ModelTransport(SpiboneModel(memory)), poll=4)
+    return CachedClient(client, capacity), memory
+
+def test_policies():
+    cache, memory = make_cache()
+    cache.add_region(0x1000, 0x100, CACHEABLE)
+    cache.add_region(0x2000, 0x100, WRITE_THROUGH)
+    memory.words.update({0x400: 1, 0x800: 2, 0xc00: 3})
+
+    for _ in range(3):
+        assert cache.read(0x1000) == 1
+        assert cache.read(0x2000) == 2
+        assert cache.read(0x3000) == 3
+    assert memory.reads == 5
+    assert (cache.hits, cache.misses) == (4, 2)
+
+    # The hardware changed these behind the cache's back
+    memory.words.update({0x400: 4, 0x800: 5, 0xc00: 6})
+    assert cache.read(0x1000) == 1
+    assert cache.read(0x3000) == 6
+
+    cache.write(0x1000, 7)
+    cache.write(0x2000, 8)
+    reads = memory.reads
+    assert cache.read(0x1000) == 7
+    assert cache.read(0x2000) == 8
+    assert memory.reads == reads + 1
+
+    assert cache.policy(0x10ff) == CACHEABLE
+    assert cache.policy(0x1100) == VOLATILE
+
+def test_regions():
+    cache, _ = make_cache()
+    cache.add_region(0x1000, 0x100, CACHEABLE)
+    with pytest.raises(ValueError):
+        cache.add_region(0x10fc, 8, CACHEABLE)
+    with pytest.raises(ValueError):
+        cache.add_region(0xffc, 8, CACHEABLE)
+    with pytest.raises(ValueError):
+        cache.add_region(0x2000, 4, "sometimes")
+
+def test_narrow_and_burst_writes_drop():
+    cache, memory = make_cache()
+    cache.add_region(0, 0x100, CACHEABLE)
+    assert cache.burst_read(0, 4) == [0, 0, 0, 0]
+    reads = memory.reads
+    assert cache.read(8) == 0
+    assert memory.reads == reads
+
+    cache.write8(9, 0x12)
+    assert cache.read(8) == 0x1200
+    cache.write16(10, 0x3456)
+    assert cache.read(8) == 0x34561200
+    cache.burst_write(4, [1, 2])
+    assert cache.read(4) == 1
+    assert cache.read(8) == 2
+    assert cache.read16(8) == 2
+    assert cache.read8(8) == 2
+
+def test_eviction():
+    cache, memory = make_cache(capacity=2)
+    cache.add_region(0, 0x100, CACHEABLE)
+    for address in (0, 4, 0, 8):
+        cache.read(address)
+    assert cache.evictions == 1
+    reads = memory.reads
+    cache.read(0)
+    assert memory.reads == reads
+    cache.read(4)
+    assert memory.reads == reads + 1
+    cache.flush(4)
+    cache.flush()
+    cache.read(0)
+    assert memory.reads == reads + 2
+
+def test_execute():
+    cache, memory = make_cache()
+    cache.add_region(0, 0x100, CACHEABLE)
+    cache.read(0)
+    batch = cache.batch()
+    batch.write(0, 5)
+    batch.burst_read(0x10, 2)
+    batch.posted_write(0x14, 9)
+    cache.execute(batch)
+    reads = memory.reads
+    assert cache.read(0) == 5
+    assert cache.read(0x10) == 0
+    assert memory.reads == reads + 1
+    # The posted write dropped the value that was read before it
+    assert cache.read(0x14) == 9
+
+def test_failed_write_drops():
+    class Broken(CountingMemory):
+        def write(self, adr, value, sel=0b1111):
+            raise BusError()
+    memory = Broken()
+    cache = CachedClient(SpiboneClient(ModelTransport(SpiboneModel(memory)), poll=4))
+    cache.add_region(0, 0x100, CACHEABLE)
+    cache.read(0)
+    batch = cache.batch()
+    batch.burst_write(0, [1])
+    with pytest.raises(OperationFailed):
+        cache.execute(batch)
+    reads = memory.reads
+    cache.read(0)
+    assert memory.reads == reads + 1
+
+def test_csr_csv(tmp_path):
+    path = tmp_path / "csr.csv"
+    path.write_text(
+        "csr_base,ctrl,0x82000000,,\n"
+        "csr_base,timer0,0x82001000,,\n"
+        "csr_register,ctrl_reset,0x82000000,1,rw\n"
+        "csr_register,ctrl_scratch,0x82000004,1,rw\n"
+        "csr_register,ctrl_bus_errors,0x82000008,1,ro\n"
+        "csr_register,timer0_load,0x82001000,1,rw\n"
+        "csr_register,timer0_value,0x82001004,1,ro\n"
+        "constant,config_clock_frequency,12000000,,\n")
+    cache, _ = make_cache()
+    cache.load_csr_csv(str(path), {"ctrl_bus_errors": VOLATILE, "ctrl_scratch": WRITE_THROUGH,
+                                   "ctrl": CACHEABLE, "timer0_load": WRITE_THROUGH})
+    assert cache.policy(0x82000000) == CACHEABLE
+    assert cache.policy(0x82000004) == WRITE_THROUGH
+    assert cache.policy(0x82000008) == VOLATILE
+    assert cache.policy(0x82001000) == WRITE_THROUGH
+    assert cache.policy(0x82001004) == VOLATILE
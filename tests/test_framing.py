@@ -0,0 +1,119 @@
+import pytest
+
+from spibone_host import Batch, SpiboneClient, ModelTransport
+from spibone_host import ResponseTimeout, ProtocolError, OperationFailed
+from spibone_host.framing import SYNC_BYTE
+from spibone_model import SpiboneModel, Memory
+
+def test_encode():
+    batch = Batch(poll=2)
+    batch.write(0x12345678, 0xdeadbeef)
+    batch.read(0x10)
+    batch.burst_read(0x20, 2)
+    batch.posted_write(0x30, 1)
+    assert batch.encode() == (
+        b"\x00\x12\x34\x56\x78\xde\xad\xbe\xef" + b"\xff" * 3 +
+        b"\x01\x00\x00\x00\x10" + b"\xff" * 7 +
+        b"\x03\x00\x00\x00\x20\x00\x02" + b"\xff" * 12 +
+        b"\x04\x00\x00\x00\x30\x00\x00\x00\x01")
+
+def test_encode_two_wire_short_address():
+    batch = Batch(poll=1, wires=2, address_bytes=2)
+    batch.write16(0x40001234, 0xabcd)
+    batch.status()
+    assert batch.encode() == (
+        bytes([SYNC_BYTE]) + b"\x08\x12\x34\xab\xcd\xff\xff" +
+        bytes([SYNC_BYTE]) + b"\x05\xff\xff\xff\xff\xff\xff")
+
+def test_burst_limits():
+    batch = Batch()
+    with pytest.raises(ValueError):
+        batch.burst_read(0, 0)
+    with pytest.raises(ValueError):
+        batch.burst_write(0, [0] * 65537)
+    batch.burst_read(0, 65536)
+    assert batch.ops[0].payload[-2:] == b"\x00\x00"
+    with pytest.raises(ValueError):
+        Batch(address_bytes=0)
+
+def test_decode():
+    batch = Batch(poll=3)
+    batch.write(0, 1)
+    batch.read(0)
+    batch.burst_read(0, 2)
+    rx = bytearray(len(batch.encode()))
+    rx[9:13] = b"\xff\xff\x00\xff"
+    rx[13:18] = b"\xff" * 5
+    rx[18:26] = b"\x01\x00\x00\x00\x01\xff\xff\xff"
+    rx[26:33] = b"\xff" * 7
+    rx[33:] = b"\xff\x03\x00\x00\x00\x01\x03\x00\x00\x00\x02\xff\xff\xff"
+    assert batch.decode(bytes(rx)) == [None, 1, [1, 2]]
+    assert [op.waited for op in batch.ops] == [2, 0, 1]
+
+def test_decode_errors():
+    batch = Batch(poll=1)
+    batch.read(0)
+    batch.write(0, 1)
+    batch.write(0, 1)
+    good = b"\xff" * 5 + b"\x01\x00\x00\x00\x07" + b"\xff"
+    write = b"\xff" * 9 + b"\x00\xff"
+
+    with pytest.raises(ResponseTimeout) as e:
+        batch.decode(good + write + b"\xff" * 11)
+    assert e.value.index == 2
+    assert e.value.results == [7, None]
+
+    with pytest.raises(OperationFailed) as e:
+        batch.decode(good + b"\xff" * 9 + b"\x80\xff" + write)
+    assert e.value.index == 1
+    assert e.value.results == [7]
+
+    with pytest.raises(ProtocolError) as e:
+        batch.decode(b"\xff" * 5 + b"\x00" + b"\xff" * 5 + write + write)
+    assert e.value.results == []
+
+def test_split():
+    batch = Batch(poll=4)
+    for i in range(10):
+        batch.read(4 * i)
+    batch.burst_read(0, 100)
+    batches = batch.split(40)
+    assert [len(b) for b in batches] == [2, 2, 2, 2, 2, 1]
+    assert all(len(b.encode()) <= 40 for b in batches[:-1])
+    assert sum((b.ops for b in batches), []) == batch.ops
+
+def test_poll_until_window():
+    batch = Batch(poll=4)
+    batch.poll_until(0, 1, 1, 10)
+    assert batch.ops[0].poll == 14
+    with pytest.raises(ValueError):
+        batch.poll_until(0, 1, 1, 0)
+
+class RecordingTransport(ModelTransport):
+    def __init__(self, model, max_transfer=None):
+        super().__init__(model)
+        self.max_transfer = max_transfer
+        self.frames = []
+
+    def xfer(self, data, keep_selected=False):
+        self.frames.append((data, keep_selected))
+        return super().xfer(data, keep_selected)
+
+def test_client_splits_batches():
+    transport = RecordingTransport(SpiboneModel(), max_transfer=32)
+    client = SpiboneClient(transport, poll=2)
+    batch = client.batch()
+    for i in range(8):
+        batch.write(4 * i, i)
+    index = batch.burst_read(0, 8)
+    assert client.execute(batch)[index] == list(range(8))
+    assert len(transport.frames) == 5
+    assert not any(keep for _, keep in transport.frames)
+
+def test_client_timeout():
+    transport = RecordingTransport(SpiboneModel(Memory(latency=8)))
+    client = SpiboneClient(transport, poll=2)
+    with pytest.raises(ResponseTimeout):
+        client.read(0)
+    # A fixed poll has no continuations, so CS was released
+    assert transport.frames[-1][1] is False
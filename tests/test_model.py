@@ -0,0 +1,199 @@
+import pytest
+
+from spibone_host import SpiboneClient, ModelTransport, OperationFailed
+from spibone_model import SpiboneModel, Memory, BusError
+
+class FaultyMemory(Memory):
+    """Signals a bus error on any access to the words in `bad`"""
+    def __init__(self, bad, latency=0):
+        super().__init__(latency)
+        self.bad = set(bad)
+
+    def read(self, adr):
+        if adr in self.bad:
+            raise BusError()
+        return super().read(adr)
+
+    def write(self, adr, value, sel=0b1111):
+        if adr in self.bad:
+            raise BusError()
+        super().write(adr, value, sel)
+
+def make_client(wires=4, memory=None, poll=8, **kwargs):
+    model = SpiboneModel(memory, wires=wires, **kwargs)
+    client = SpiboneClient(ModelTransport(model), poll=poll, wires=wires,
+                           address_bytes=kwargs.get("address_bytes", 4))
+    return client, model
+
+@pytest.mark.parametrize("wires", [2, 3, 4])
+@pytest.mark.parametrize("latency", [0, 1, 3])
+def test_operations(wires, latency):
+    client, model = make_client(wires, Memory(latency), poll=2 * latency + 4)
+    batch = client.batch()
+    batch.write(0x100, 0x12345678)
+    batch.read(0x100)
+    batch.write8(0x101, 0xab)
+    batch.read8(0x101)
+    batch.write16(0x102, 0xcdef)
+    batch.read16(0x102)
+    batch.burst_write(0x200, [1, 2, 3])
+    batch.burst_read(0x200, 3)
+    batch.rmw_set(0x200, 0xf0)
+    batch.rmw_clear(0x204, 0x02)
+    batch.rmw_toggle(0x208, 0x11)
+    batch.poll_until(0x200, 0xff, 0xf1, 4)
+    batch.burst_read(0x200, 3)
+    results = client.execute(batch)
+    assert results == [None, 0x12345678, None, 0xab, None, 0xcdef, None, [1, 2, 3],
+                       None, None, None, 0xf1, [0xf1, 0, 0x12]]
+    assert model.memory.words[0x40] == 0xcdefab78
+    assert model.state == "IDLE"
+
+@pytest.mark.parametrize("wires", [2, 3, 4])
+def test_bus_errors(wires):
+    client, model = make_client(wires, FaultyMemory([0x81]))
+    batch = client.batch()
+    batch.rmw_set(0x204, 1)
+    with pytest.raises(OperationFailed) as e:
+        client.execute(batch)
+    assert e.value.op.command == 0x0a
+
+    batch = client.batch()
+    batch.burst_write(0x200, [1, 2, 3])
+    with pytest.raises(OperationFailed):
+        client.execute(batch)
+    # The words before the error were written, and the rest discarded
+    assert model.memory.words == {0x80: 1}
+
+    batch = client.batch()
+    batch.poll_until(0x204, 1, 1, 3)
+    with pytest.raises(OperationFailed):
+        client.execute(batch)
+
+    # A burst read ends with the word that failed, and the next command
+    # is still understood
+    batch = client.batch()
+    batch.burst_read(0x200, 3)
+    batch.read(0x200)
+    with pytest.raises(OperationFailed) as e:
+        client.execute(batch)
+    assert e.value.value == [1, 0]
+
+    # The link still works afterwards
+    client.write(0x200, 5)
+    assert client.read(0x200) == 5
+
+def test_response_bytes():
+    # Failed operations echo the command with bit 7 set
+    model = SpiboneModel(FaultyMemory([0]))
+    rx = model.transfer(b"\x0a\x00\x00\x00\x00\x00\x00\x00\x01" + b"\xff" * 4)
+    assert rx[9:].lstrip(b"\xff")[:1] == b"\x8a"
+    rx = model.transfer(b"\x02\x00\x00\x00\x00\x00\x01\x00\x00\x00\x01" + b"\xff" * 4)
+    assert rx[11:].lstrip(b"\xff")[:1] == b"\x82"
+    rx = model.transfer(b"\x03\x00\x00\x00\x00\x00\x02" + b"\xff" * 12)
+    assert rx[7:].lstrip(b"\xff") == b"\x83\x00\x00\x00\x00" + b"\xff" * 6
+    rx = model.transfer(b"\x0b\x00\x00\x00\x00" + b"\x00\x00\x00\x01" * 2 + b"\x00\x01" + b"\xff" * 8)
+    assert rx[15:].lstrip(b"\xff")[:1] == b"\x8b"
+
+def test_poll_timeout():
+    client, model = make_client()
+    batch = client.batch()
+    batch.poll_until(0x10, 1, 1, 5)
+    with pytest.raises(OperationFailed) as e:
+        client.execute(batch)
+    assert e.value.value == 0
+
+def test_posted_writes():
+    client, model = make_client(memory=Memory(latency=40), poll=256)
+    batch = client.batch()
+    for i in range(4):
+        batch.posted_write(4 * i, i + 1)
+    index = batch.status()
+    assert client.execute(batch)[index] == 0
+    assert model.memory.words == {0: 1, 1: 2, 2: 3, 3: 4}
+
+    # A fifth write while four are queued is dropped, which sets bit 1
+    batch = client.batch()
+    for i in range(5):
+        batch.posted_write(0x100 + 4 * i, i)
+    first = batch.status()
+    second = batch.status()
+    results = client.execute(batch)
+    assert results[first] == 0b10
+    assert results[second] == 0
+    assert 0x44 not in model.memory.words
+
+def test_posted_error():
+    client, model = make_client(memory=FaultyMemory([1]))
+    batch = client.batch()
+    batch.posted_write(0, 1)
+    batch.posted_write(4, 2)
+    batch.posted_write(8, 3)
+    first = batch.status()
+    second = batch.status()
+    results = client.execute(batch)
+    assert results[first] == 0b01
+    assert results[second] == 0
+    assert model.memory.words == {0: 1, 2: 3}
+
+def test_reads_wait_for_posted_writes():
+    client, model = make_client(memory=Memory(latency=20), poll=128)
+    batch = client.batch()
+    for i in range(4):
+        batch.posted_write(4 * i, i + 1)
+    index = batch.read(12)
+    results = client.execute(batch)
+    assert results[index] == 4
+    # The read waits for the queued writes before its own
+    assert batch.ops[index].waited > 2 * 20
+
+@pytest.mark.parametrize("address_bytes", [1, 2, 3])
+def test_short_addresses(address_bytes):
+    base = 0x40000000
+    client, model = make_client(address_bytes=address_bytes, address_base=base)
+    client.write(base + 0x10, 0x1234)
+    assert model.memory.words == {(base + 0x10) >> 2: 0x1234}
+    assert client.read(base + 0x10) == 0x1234
+    # Only the low address bytes are sent
+    assert client.batch()._address(base + 0x10) == (0x10).to_bytes(address_bytes, "big")
+
+def test_model_arguments():
+    with pytest.raises(ValueError):
+        SpiboneModel(wires=1)
+    with pytest.raises(ValueError):
+        SpiboneModel(address_bytes=5)
+    with pytest.raises(ValueError):
+        SpiboneModel(address_bytes=2, address_base=0x1234)
+
+def test_unknown_command():
+    model = SpiboneModel()
+    assert model.transfer(b"\x42\x01\x00\x00\x00\x00") == b"\xff" * 6
+    assert model.state == "END"
+    # Releasing CS starts over
+    assert model.transfer(b"\x01\x00\x00\x00\x00\xff\x01\x00\x00\x00\x00")[5:] == b"\xff\x01\x00\x00\x00\x00"
+
+def test_two_wire_sync():
+    model = SpiboneModel(wires=2)
+    # Bytes before the sync byte are ignored, and so is an unknown command
+    rx = model.transfer(b"\x12\xab\x42\xab\x00\x00\x00\x00\x10\x00\x00\x00\x2a" + b"\xff" * 3)
+    assert rx[13:].lstrip(b"\xff")[:1] == b"\x00"
+    assert model.memory.words == {4: 0x2a}
+
+def test_three_wire_echo():
+    model = SpiboneModel(wires=3)
+    data = b"\x01\x00\x00\x00\x10" + b"\xff" * 6
+    rx = model.transfer(data)
+    # The host's own bytes are seen on the shared line until the response
+    assert rx[:5] == data[:5]
+    assert rx[5:] == b"\xff\x01\x00\x00\x00\x00"
+
+def test_deselect():
+    model = SpiboneModel()
+    model.select()
+    model.exchange(0x01)
+    assert model.state == "READ_ADDRESS"
+    model.deselect()
+    with pytest.raises(ValueError):
+        model.exchange(0xff)
+    model.select()
+    assert model.state == "IDLE"
@@ -0,0 +1,95 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from spibone_host import Batch, ResponseTimeout, ProtocolError, OperationFailed
+from spibone_host.framing import CMD_READ, CMD_WRITE
+from spibone_host import numpy_codec
+from spibone_model import SpiboneModel, Memory
+
+def run(model, data):
+    return model.transfer(bytes(data))
+
+@pytest.mark.parametrize("wires", [2, 4])
+@pytest.mark.parametrize("address_bytes", [2, 4])
+def test_matches_batch(wires, address_bytes):
+    commands = [CMD_WRITE, CMD_READ, CMD_WRITE, CMD_READ]
+    addresses = [0x10, 0x10, 0x14, 0x14]
+    values = [0x12345678, 0, 0x9abcdef0, 0]
+    frame = numpy_codec.encode(commands, addresses, values, poll=3, wires=wires, address_bytes=address_bytes)
+
+    batch = Batch(poll=3, wires=wires, address_bytes=address_bytes)
+    batch.write(0x10, 0x12345678)
+    batch.read(0x10)
+    batch.write(0x14, 0x9abcdef0)
+    batch.read(0x14)
+    # Each operation is padded to the same length, so only compare
+    # what's sent before the response window
+    for i, op in enumerate(batch.ops):
+        row = frame.data[i * frame.stride:(i + 1) * frame.stride].tobytes()
+        assert row.startswith(bytes([0xab] if wires == 2 else []) + op.payload)
+
+    model = SpiboneModel(wires=wires, address_bytes=address_bytes)
+    result = numpy_codec.decode(frame, run(model, frame.data))
+    assert result.tolist() == [0, 0x12345678, 0, 0x9abcdef0]
+
+def test_only_reads_and_writes():
+    with pytest.raises(ValueError):
+        numpy_codec.encode([0x03], [0])
+
+def test_decode_errors():
+    frame = numpy_codec.encode([CMD_READ, CMD_READ], [0, 4], poll=1)
+    model = SpiboneModel(Memory(latency=4))
+    with pytest.raises(ResponseTimeout) as e:
+        numpy_codec.decode(frame, run(model, frame.data))
+    assert e.value.index == 0
+
+    rx = bytearray(run(SpiboneModel(), frame.data))
+    rx[frame.stride + frame.starts[1]:frame.stride * 2] = b"\x81" + b"\x00" * 5
+    with pytest.raises(OperationFailed) as e:
+        numpy_codec.decode(frame, bytes(rx))
+    assert e.value.index == 1
+    rx[frame.stride + frame.starts[1]] = 0x42
+    with pytest.raises(ProtocolError):
+        numpy_codec.decode(frame, bytes(rx))
+
+@pytest.mark.parametrize("latency", [0, 6])
+def test_bursts(latency):
+    model = SpiboneModel(Memory(latency))
+    words = np.arange(100, dtype=np.uint32) * 0x01010101
+    poll = 4 * latency + 4
+    data = numpy_codec.encode_burst_write(0x100, words, poll=poll)
+    if latency >= 4:
+        # Words arrive faster than the bus takes them
+        with pytest.raises(OperationFailed):
+            numpy_codec.decode_burst_write(run(model, data), len(words), poll=poll)
+        model.memory.latency = 0
+        numpy_codec.decode_burst_write(run(model, data), len(words), poll=poll)
+        model.memory.latency = latency
+    else:
+        numpy_codec.decode_burst_write(run(model, data), len(words), poll=poll)
+
+    data = numpy_codec.encode_burst_read(0x100, len(words), poll=poll * 100)
+    result = numpy_codec.decode_burst_read(run(model, data), len(words), poll=poll * 100)
+    assert result.tolist() == words.tolist()
+
+def test_burst_read_timeout():
+    model = SpiboneModel(Memory(latency=8))
+    data = numpy_codec.encode_burst_read(0, 4, poll=2)
+    with pytest.raises(ResponseTimeout):
+        numpy_codec.decode_burst_read(run(model, data), 4, poll=2)
+
+def test_burst_read_error():
+    memory = Memory()
+    memory.words = {0: 1, 1: 2}
+    model = SpiboneModel(memory)
+    data = numpy_codec.encode_burst_read(0, 4, poll=2)
+    rx = bytearray(run(model, data))
+    # Fail the third word, which ends the burst
+    start = 1 + 4 + 2
+    pos = rx.index(0x03, start) + 10
+    rx[pos:] = b"\x83\x00\x00\x00\x00" + b"\xff" * (len(rx) - pos - 5)
+    with pytest.raises(OperationFailed) as e:
+        numpy_codec.decode_burst_read(bytes(rx), 4, poll=2)
+    assert e.value.index == 2
+    assert e.value.value.tolist() == [1, 2, 0]
@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+
+from spibone_host import SpiboneClient, ModelTransport, OperationFailed
+from spibone_host.server import Scheduler, SpiboneServer, coalesce
+from spibone_model import SpiboneModel, Memory, BusError
+
+class FailingTransport(ModelTransport):
+    def __init__(self, model, error):
+        super().__init__(model)
+        self.error = error
+
+    def xfer(self, data, keep_selected=False):
+        raise self.error
+
+def make_client(memory=None):
+    return SpiboneClient(ModelTransport(SpiboneModel(memory)), poll=4)
+
+def test_coalesce():
+    assert coalesce([0, 4, 8, 16, 20, 0]) == [(0, 3), (16, 2), (0, 1)]
+    assert coalesce([0, 4, 8], max_length=2) == [(0, 2), (8, 1)]
+
+def test_scheduler_returns_results():
+    client = make_client()
+    scheduler = Scheduler(client)
+    batch = client.batch()
+    batch.write(0x100, 0x12345678)
+    index = batch.read(0x100)
+    assert scheduler.submit("a", batch)[index] == 0x12345678
+
+def test_scheduler_spibone_error():
+    class Broken(Memory):
+        def read(self, adr):
+            raise BusError()
+    client = make_client(Broken())
+    scheduler = Scheduler(client)
+    batch = client.batch()
+    batch.rmw_set(0, 1)
+    with pytest.raises(OperationFailed):
+        scheduler.submit("a", batch)
+
+@pytest.mark.parametrize("error", [OSError(5, "Input/output error"), ValueError("frame is too long")])
+def test_scheduler_other_errors(error):
+    client = SpiboneClient(FailingTransport(SpiboneModel(), error), poll=4)
+    scheduler = Scheduler(client)
+    batch = client.batch()
+    batch.read(0)
+    with pytest.raises(type(error)):
+        scheduler.submit("a", batch)
+
+    # The scheduler keeps running afterwards
+    client.transport = ModelTransport(SpiboneModel())
+    batch = client.batch()
+    index = batch.read(0)
+    assert scheduler.submit("a", batch)[index] == 0
+
+def test_scheduler_serves_connections():
+    client = make_client()
+    scheduler = Scheduler(client)
+    results = {}
+
+    def connection(key):
+        for i in range(8):
+            batch = client.batch()
+            batch.write(0x1000 + 4 * key, i)
+            index = batch.read(0x1000 + 4 * key)
+            results.setdefault(key, []).append(scheduler.submit(key, batch)[index])
+
+    threads = [threading.Thread(target=connection, args=(key,)) for key in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert results == {key: list(range(8)) for key in range(4)}
+
+def test_server_survives_bus_errors():
+    litex_client = pytest.importorskip("litex.tools.litex_client")
+
+    class Broken(Memory):
+        def read(self, adr):
+            if adr == 0x41:
+                raise BusError()
+            return super().read(adr)
+    memory = Broken()
+    memory.words[0x40] = 0x1234
+    server = SpiboneServer(make_client(memory), bind_port=0)
+    server.open()
+    server.start()
+    try:
+        remote = litex_client.RemoteClient(port=server.bind_port, csr_csv=None)
+        remote.open()
+        # The word before the bus error is good, and the rest read as ones
+        assert remote.read(0x100, 3) == [0x1234, 0xffffffff, 0xffffffff]
+        # The connection is still open
+        remote.write(0x200, 0x5678)
+        assert remote.read(0x200) == 0x5678
+        remote.close()
+    finally:
+        server.close()
@@ -0,0 +1,123 @@
+import ctypes
+import os
+import struct
+
+import pytest
+
+from spibone_host import SpiboneClient
+from spibone_host.spidev import SpidevTransport, SpiIocTransfer, SPI_IOC_MESSAGE
+from spibone_host.spidev import SPI_IOC_WR_MODE, SPI_IOC_WR_BITS_PER_WORD, SPI_IOC_WR_MAX_SPEED_HZ
+from spibone_model import SpiboneModel
+
+class FakeSpidev(SpidevTransport):
+    """Hands each segment of a message to the model instead of a device"""
+    def __init__(self, model, **kwargs):
+        self.model = model
+        self.settings = {}
+        self.messages = []
+        super().__init__("/dev/spidev-fake", **kwargs)
+
+    def _open(self, path):
+        self.path = path
+        return os.open(os.devnull, os.O_RDWR)
+
+    def _ioctl(self, request, arg):
+        if isinstance(arg, bytes):
+            self.settings[request] = arg
+            return 0
+        count = len(arg)
+        for n in range(1, count + 1):
+            if request == SPI_IOC_MESSAGE(n):
+                break
+        else:
+            raise AssertionError("unexpected request 0x{:08x}".format(request))
+        segments = arg[:n]
+        message = []
+        for segment in segments:
+            tx = ctypes.string_at(segment.tx_buf, segment.len)
+            rx = self.model.transfer(tx, keep_selected=True)
+            ctypes.memmove(segment.rx_buf, rx, segment.len)
+            # cs_change releases CS after every segment but the last, and
+            # leaves it low after the last one
+            if segment is not segments[-1] and segment.cs_change:
+                self.model.deselect()
+            elif segment is segments[-1] and not segment.cs_change:
+                self.model.deselect()
+            message.append((tx, segment.cs_change, segment.speed_hz, segment.bits_per_word))
+        self.messages.append(message)
+        return 0
+
+def test_setup():
+    transport = FakeSpidev(SpiboneModel(), speed_hz=12000000)
+    assert transport.path == "/dev/spidev-fake"
+    assert transport.settings == {
+        SPI_IOC_WR_MODE: b"\x00",
+        SPI_IOC_WR_BITS_PER_WORD: b"\x08",
+        SPI_IOC_WR_MAX_SPEED_HZ: struct.pack("=I", 12000000),
+    }
+    assert transport.poll_bytes(2e-6) == 4
+    transport.close()
+
+def test_request_encoding():
+    # _IOW('k', 0, char[N * 32])
+    assert ctypes.sizeof(SpiIocTransfer) == 32
+    assert SPI_IOC_MESSAGE(1) == 0x40206b00
+    assert SPI_IOC_MESSAGE(2) == 0x40406b00
+
+def test_client():
+    model = SpiboneModel()
+    transport = FakeSpidev(model)
+    client = SpiboneClient(transport, poll=4)
+    client.write(0x40000000, 0x12345678)
+    assert client.read(0x40000000) == 0x12345678
+    assert client.burst_read(0x40000000, 2) == [0x12345678, 0]
+    assert not model.selected
+    transport.close()
+
+def test_cs_change():
+    model = SpiboneModel()
+    transport = FakeSpidev(model)
+    frames = [b"\x00\x00\x00\x00\x10\x00\x00\x00\x2a" + b"\xff" * 3,
+              b"\x01\x00\x00\x00\x10" + b"\xff" * 7]
+    results = transport.xfer_many(frames)
+    assert results[1][5:].lstrip(b"\xff")[:5] == b"\x01\x00\x00\x00\x2a"
+    [message] = transport.messages
+    assert [tx for tx, _, _, _ in message] == frames
+    assert [cs_change for _, cs_change, _, _ in message] == [1, 0]
+    assert {(speed, bits) for _, _, speed, bits in message} == {(1000000, 8)}
+    assert not model.selected
+
+    transport.xfer(b"\xff", keep_selected=True)
+    assert transport.messages[-1][-1][1] == 1
+    assert model.selected
+    transport.release()
+    assert not model.selected
+    transport.close()
+
+def test_max_transfer():
+    transport = FakeSpidev(SpiboneModel(), bufsiz=32, max_segments=3)
+    frames = [bytes([0xff]) * length for length in (10, 10, 10, 20, 5, 1, 1, 1, 1)]
+    results = transport.xfer_many(frames)
+    assert [len(r) for r in results] == [10, 10, 10, 20, 5, 1, 1, 1, 1]
+
+    # Frames are grouped by buffer size, and by the number of segments
+    assert [[len(tx) for tx, _, _, _ in m] for m in transport.messages] == [[10, 10, 10], [20, 5, 1], [1, 1, 1]]
+    # CS is only left low by the last frame of all
+    assert [m[-1][1] for m in transport.messages] == [0, 0, 0]
+
+    with pytest.raises(ValueError):
+        transport.xfer(b"\xff" * 33)
+    transport.close()
+
+def test_client_split():
+    transport = FakeSpidev(SpiboneModel(), bufsiz=64)
+    client = SpiboneClient(transport, poll=4)
+    batch = client.batch()
+    for i in range(16):
+        batch.write(4 * i, i)
+    for i in range(16):
+        batch.read(4 * i)
+    assert client.execute(batch)[16:] == list(range(16))
+    assert all(sum(len(tx) for tx, _, _, _ in m) <= 64 for m in transport.messages)
+    assert len(transport.messages) == 8
+    transport.close()
@@ -0,0 +1,232 @@
+# Build the cocotb testbench in sim/ under Verilator, with a stand-in for the
+# generated dut, to check that Verilator handles the constructs it relies on:
+# pullups and inout data lines, and $readmemh/$writememh into dut.main_ram.
+import os
+import shutil
+import subprocess
+
+import pytest
+
+SIM = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, "sim"))
+
+DUT = """
+`timescale 100ps / 100ps
+
+// Stands in for the design made by generate-verilog.py.  main_ram answers
+// like a LiteX SRAM, and whatever is sent over SPI is shifted into spi_byte.
+module dut(
+	input clk_clk48,
+	output clk_clk12,
+	input reset,
+`ifdef SPI_WIDTH
+	inout [`SPI_WIDTH-1:0] spi_dq,
+`else
+	input spi_mosi,
+	output spi_miso,
+`endif
+	input spi_cs_n,
+	input spi_clk,
+	input [29:0] wishbone_adr,
+	output reg [31:0] wishbone_dat_r,
+	input [31:0] wishbone_dat_w,
+	input [3:0] wishbone_sel,
+	input wishbone_cyc,
+	input wishbone_stb,
+	output reg wishbone_ack,
+	input wishbone_we,
+	input [2:0] wishbone_cti,
+	input [1:0] wishbone_bte,
+	output wishbone_err
+);
+
+reg [31:0] main_ram [0:1023];
+reg [1:0] divider = 0;
+reg [7:0] spi_byte = 0;
+
+initial wishbone_ack = 0;
+
+always @(posedge clk_clk48)
+	divider <= divider + 1;
+assign clk_clk12 = divider[1];
+
+assign wishbone_err = 0;
+always @(posedge clk_clk12) begin
+	wishbone_ack <= wishbone_cyc & wishbone_stb & ~wishbone_ack;
+	wishbone_dat_r <= main_ram[wishbone_adr[9:0]];
+	if (wishbone_cyc & wishbone_stb & wishbone_we & ~wishbone_ack)
+		main_ram[wishbone_adr[9:0]] <= wishbone_dat_w;
+end
+
+`ifdef SPI_WIDTH
+assign spi_dq = {`SPI_WIDTH{1'bz}};
+always @(posedge spi_clk)
+	if (!spi_cs_n)
+		spi_byte <= {spi_byte, spi_dq};
+`else
+assign spi_miso = spi_mosi;
+always @(posedge spi_clk)
+	if (!spi_cs_n)
+		spi_byte <= {spi_byte[6:0], spi_mosi};
+`endif
+
+endmodule
+"""
+
+TOP = """
+`timescale 100ps / 100ps
+
+module top;
+
+reg clk48 = 0;
+always #104 clk48 = ~clk48;
+wire clk12;
+reg reset = 1;
+
+reg spi_cs_n = 1;
+reg master_start = 0;
+reg [31:0] master_tx = 0;
+reg [15:0] master_len = 0;
+reg master_release = 0;
+reg master_wide = 0;
+wire master_done;
+wire [31:0] master_rx;
+wire [15:0] master_count;
+wire mosi_error;
+wire miso_error;
+
+reg backdoor_load = 0;
+reg backdoor_dump = 0;
+wire backdoor_done;
+
+reg cyc = 0;
+reg stb = 0;
+reg we = 0;
+reg [29:0] adr = 0;
+reg [31:0] datwr = 0;
+wire [31:0] datrd;
+wire ack;
+wire err;
+wire stall;
+
+tb tb(
+	.clk48(clk48), .clk12(clk12), .reset(reset), .spi_cs_n(spi_cs_n),
+	.master_start(master_start), .master_done(master_done), .master_tx(master_tx),
+	.master_len(master_len), .master_wait(1'b0), .master_release(master_release),
+	.master_wide(master_wide), .master_rx(master_rx), .master_count(master_count),
+	.spi_check_miso(1'b0), .spi_mosi_error(mosi_error), .spi_miso_error(miso_error),
+	.backdoor_load(backdoor_load), .backdoor_dump(backdoor_dump),
+	.backdoor_start(32'd0), .backdoor_end(32'd3), .backdoor_done(backdoor_done),
+	.wishbone_adr(adr), .wishbone_datrd(datrd), .wishbone_datwr(datwr),
+	.wishbone_sel(4'hf), .wishbone_cyc(cyc), .wishbone_stb(stb), .wishbone_ack(ack),
+	.wishbone_we(we), .wishbone_cti(3'd0), .wishbone_bte(2'd0), .test_name(4096'd0),
+	.wishbone_err(err), .wishbone_stall(stall)
+);
+
+reg done_seen;
+task transfer(input [31:0] tx, input release_lines, input wide);
+begin
+	done_seen = master_done;
+	master_tx = tx;
+	master_len = 1;
+	master_release = release_lines;
+	master_wide = wide;
+	master_start = ~master_start;
+	wait (master_done != done_seen);
+end
+endtask
+
+// One pipelined cycle of `count` operations, starting at word `first`
+integer accepted;
+integer answered;
+task bus(input write, input integer first, input integer count);
+begin
+	accepted = 0;
+	answered = 0;
+	@(negedge clk12);
+	cyc = 1;
+	stb = 1;
+	we = write;
+	adr = first;
+	datwr = 32'h1000 + first;
+	while (answered < count) begin
+		@(posedge clk12);
+		if (ack) begin
+			if (!write)
+				$display("read %08x", datrd);
+			answered = answered + 1;
+		end
+		if (stb && !stall)
+			accepted = accepted + 1;
+		#1;
+		if (accepted == count) begin
+			stb = 0;
+		end else begin
+			adr = first + accepted;
+			datwr = 32'h1000 + first + accepted;
+		end
+	end
+	cyc = 0;
+end
+endtask
+
+`ifdef SPI_WIDTH
+localparam WIDE = 1;
+`else
+localparam WIDE = 0;
+`endif
+
+initial begin
+	#2000 reset = 0;
+	backdoor_load = 1;
+	wait (backdoor_done);
+	bus(0, 0, 4);
+	bus(1, 2, 2);
+
+	spi_cs_n = 0;
+	transfer(32'h5a, 0, WIDE);
+	$display("sent %02x", tb.dut.spi_byte);
+	$display("looped %02x", master_rx[7:0]);
+	transfer(32'h00, 1, WIDE);
+	$display("released %02x", master_rx[7:0]);
+	spi_cs_n = 1;
+	$display("mosi_error %0d", mosi_error);
+
+	backdoor_dump = 1;
+	wait (!backdoor_done);
+	$finish;
+end
+
+endmodule
+"""
+
+@pytest.mark.parametrize("width", [1, 2, 4])
+def test_verilator(tmp_path, width):
+    verilator = shutil.which(os.environ.get("VERILATOR", "verilator"))
+    if verilator is None:
+        pytest.skip("verilator is not installed")
+    (tmp_path / "dut.v").write_text(DUT)
+    (tmp_path / "top.v").write_text(TOP)
+    (tmp_path / "backdoor.hex").write_text("11111111\n22222222\n33333333\n44444444\n")
+    args = [verilator, "--binary", "--timing", "-Wno-fatal", "-Wno-lint", "-Wno-TIMESCALEMOD",
+            "--top-module", "top", "--Mdir", str(tmp_path / "obj"), "-o", "sim",
+            str(tmp_path / "dut.v"), str(tmp_path / "top.v")]
+    args += [os.path.join(SIM, name) for name in ("tb.v", "spi_master.v", "spi_checker.v")]
+    if width > 1:
+        args.append("-DSPI_WIDTH={}".format(width))
+    subprocess.run(args, check=True, stdout=subprocess.DEVNULL)
+    output = subprocess.run([str(tmp_path / "obj" / "sim")], cwd=str(tmp_path), check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout.split("\n")
+
+    # main_ram was loaded through the backdoor and read over the bus
+    reads = [line.split()[1] for line in output if line.startswith("read ")]
+    assert reads == ["11111111", "22222222", "33333333", "44444444"]
+    # What the master sent reached the dut, and released lines are pulled up
+    assert "sent 5a" in output
+    if width == 1:
+        assert "looped 5a" in output
+    assert "released ff" in output
+    assert "mosi_error 0" in output
+    # The bus writes were dumped through the backdoor
+    words = (tmp_path / "backdoor.hex").read_text().split()
+    words = [word for word in words if not word.startswith("@") and not word.startswith("//")]
+    assert words == ["11111111", "22222222", "00001002", "00001003"]
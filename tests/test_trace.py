@@ -0,0 +1,107 @@
+import pytest
+
+from spibone_host import SpiboneClient, ModelTransport, AdaptivePoll, OperationFailed
+from spibone_host.trace import TraceRecorder, replay, load
+from spibone_model import SpiboneModel, Memory, BusError
+
+def make_client(memory=None, poll=4, trace=None):
+    return SpiboneClient(ModelTransport(SpiboneModel(memory)), poll=poll, trace=trace)
+
+def test_record():
+    trace = TraceRecorder(capacity=4)
+    client = make_client(trace=trace)
+    batch = client.batch()
+    batch.write(0x10, 0x1234)
+    batch.read(0x10)
+    batch.burst_read(0x10, 3)
+    client.execute(batch)
+    batch = client.batch()
+    batch.rmw_set(0x14, 0x80)
+    client.execute(batch)
+    assert len(trace) == 4
+    records = trace.records()
+    assert [r[2] for r in records] == [0x10, 0x10, 0x10, 0x14]
+    assert [r[3] for r in records] == [0x1234, 0x1234, 3, 0x80]
+    assert [r[4] for r in records] == [0, 0, 0, 1]
+    assert [r[6] for r in records] == [0x00, 0x01, 0x03, 0x0a]
+
+    # The oldest record is overwritten
+    client.read(0x10)
+    assert len(trace) == 4
+    assert trace.records()[0][6] == 0x01
+
+def test_record_failure():
+    class Broken(Memory):
+        def write(self, adr, value, sel=0b1111):
+            raise BusError()
+    memory = Broken()
+    memory.words[0] = 0x1234
+    trace = TraceRecorder()
+    client = make_client(memory, trace=trace)
+    batch = client.batch()
+    batch.read(0)
+    batch.rmw_set(0, 1)
+    batch.read(0)
+    with pytest.raises(OperationFailed):
+        client.execute(batch)
+    assert [r[6] for r in trace.records()] == [0x01, 0x8a]
+    # The read before the failure is recorded with the value it returned
+    assert [r[3] for r in trace.records()] == [0x1234, 1]
+
+def test_export_load(tmp_path):
+    pytest.importorskip("numpy")
+    trace = TraceRecorder(capacity=3)
+    client = make_client(trace=trace)
+    for i in range(5):
+        client.write(4 * i, i)
+    path = tmp_path / "trace.npz"
+    trace.export(str(path))
+    columns = load(str(path))
+    assert columns["address"].tolist() == [8, 12, 16]
+    assert columns["value"].tolist() == [2, 3, 4]
+    assert len(columns["timestamp_ns"]) == 3
+
+def test_replay():
+    trace = TraceRecorder()
+    client = make_client(trace=trace)
+    batch = client.batch()
+    batch.write(0x10, 0x1234)
+    batch.read(0x10)
+    client.execute(batch)
+    client.burst_read(0x10, 2)
+
+    memory = Memory()
+    stats = replay(trace, make_client(memory), repeat=3)
+    assert stats.operations == 9
+    assert stats.batches == 6
+    assert memory.words == {4: 0x1234}
+
+def recorded_trace(records):
+    trace = TraceRecorder()
+    for record in records:
+        trace.record(*record)
+    return trace
+
+class CountingPoll(AdaptivePoll):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.windows = 0
+
+    def window(self, address):
+        self.windows += 1
+        return super().window(address)
+
+def test_replay_builds_new_operations():
+    # A late response extends the window of its operation, so replays must
+    # not reuse the operations of an earlier pass
+    poll = CountingPoll(default=1, margin=0, continuation=4)
+    trace = TraceRecorder()
+    client = make_client(Memory(latency=6), poll=poll, trace=trace)
+    client.read(0)
+    recorded = trace.records()
+    assert poll.windows == 1
+
+    replay(recorded_trace(recorded), client, repeat=3)
+    assert poll.windows == 4
+    assert trace.records()[0] == recorded[0]
+    assert {r[5] for r in trace.records()} == {recorded[0][5]}